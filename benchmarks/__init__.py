@@ -0,0 +1 @@
+# Mark benchmarks as a package for module-based execution.
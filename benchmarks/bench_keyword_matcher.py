@@ -0,0 +1,69 @@
+"""Microbenchmark: precompiled KeywordMatcher vs. a linear substring scan.
+
+Usage: python -m benchmarks.bench_keyword_matcher
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import string
+import timeit
+
+from src.config import ChatFilter
+from src.filters import compile_rule
+
+
+def _random_word(rng: random.Random, min_len: int = 4, max_len: int = 12) -> str:
+    return "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(min_len, max_len)))
+
+
+def _make_text(rng: random.Random, length: int) -> str:
+    words: list[str] = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(_random_word(rng, 2, 9))
+    return " ".join(words)[:length]
+
+
+def run(keyword_counts: list[int], text_length: int, number: int) -> None:
+    rng = random.Random(6551)
+    texts = [_make_text(rng, text_length) for _ in range(50)]
+
+    print(f"text_length={text_length} texts={len(texts)} number={number}")
+    print(f"{'keywords':>9} {'linear us':>16} {'compiled us':>12} {'speedup':>8}")
+    for count in keyword_counts:
+        keywords = [_random_word(rng) for _ in range(count)]
+        rule = ChatFilter(mode="deny", keywords=keywords, case_sensitive=False)
+        compiled = compile_rule(rule)
+
+        lowered = [kw.lower() for kw in keywords]
+
+        def legacy() -> None:
+            # 逐个关键词做子串查找，即预编译之前的实现
+            for text in texts:
+                lowered_text = text.lower()
+                next((kw for kw in lowered if kw in lowered_text), None)
+
+        def fast() -> None:
+            for text in texts:
+                compiled.should_push(text)
+
+        legacy_s = min(timeit.repeat(legacy, number=number, repeat=3))
+        fast_s = min(timeit.repeat(fast, number=number, repeat=3))
+        per_call = number * len(texts)
+        print(
+            f"{count:>9} {legacy_s / per_call * 1e6:>16.2f} "
+            f"{fast_s / per_call * 1e6:>12.2f} {legacy_s / fast_s:>7.1f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keywords", default="4,16,64,256,1024", help="Comma separated keyword counts")
+    parser.add_argument("--text-length", type=int, default=400)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+    run([int(n) for n in args.keywords.split(",")], args.text_length, args.number)
+
+
+if __name__ == "__main__":
+    main()
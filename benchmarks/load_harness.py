@@ -0,0 +1,375 @@
+"""Offline end-to-end load test: event injector → real pipeline → fake PushPlus.
+
+Usage:
+    python -m benchmarks.load_harness --rate 200 --duration 30 --latency-ms 80 --error-rate 0.02
+    python -m benchmarks.load_harness --replay recorded.jsonl --rate 50
+    python -m benchmarks.load_harness --fake-only --port 8080   # just the fake server
+
+Messages go through ``TelegramIngest._on_new_message``, the handler ``main()``
+registers with Telethon, so watermarks, filters, dedup, coalescing, the outbox
+and the delivery queues all run exactly as in production. A replay file holds
+one JSON object per line: ``{"chat_id": -100..., "text": "...", "media_url": null}``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+
+from src.config import ChatFilter, Config
+from src.filters import compile_rule
+from src.ingest import TelegramIngest
+from src.log import setup_logging
+from src.pipeline import Pipeline
+from src.watermark import WATERMARKS_FILENAME, WatermarkStore
+
+from .bench_pipeline import KEYWORDS
+from .corpus import make_corpus
+
+
+class FakePushPlus:
+    """PushPlus stand-in on its own thread and event loop.
+
+    Each request waits ``latency_ms`` ± ``jitter_ms``. Then it fails with HTTP
+    500 (``error_rate``), answers ``code != 200`` (``bad_code_rate``), or succeeds.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        bad_code_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 6551,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.bad_code_rate = bad_code_rate
+        self.host = host
+        self.port = port
+        self._rng = random.Random(seed)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+        self._stop: asyncio.Event | None = None
+        self.requests = 0
+        self.succeeded = 0
+        self.http_errors = 0
+        self.bad_codes = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/send"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._run, name="fake-pushplus", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.url
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        asyncio.run(self._serve())
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await self._stop.wait()
+
+    def _outcome(self) -> tuple[int, dict[str, Any] | None]:
+        roll = self._rng.random()
+        if roll < self.error_rate:
+            self.http_errors += 1
+            return 500, None
+        if roll < self.error_rate + self.bad_code_rate:
+            self.bad_codes += 1
+            return 200, {"code": 500, "msg": "fake failure", "data": None}
+        self.succeeded += 1
+        return 200, {"code": 200, "msg": "请求成功", "data": "fake"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # httpx 复用连接：一个连接上循环处理多个请求
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                length = 0
+                for line in head.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value.strip())
+                await reader.readexactly(length)
+                self.requests += 1
+
+                delay = self._rng.gauss(self.latency_ms, self.jitter_ms) if self.jitter_ms else self.latency_ms
+                await asyncio.sleep(max(0.0, delay) / 1000)
+                status, payload = self._outcome()
+                body = json.dumps(payload).encode("utf-8") if payload is not None else b"error"
+                reason = "OK" if status == 200 else "Internal Server Error"
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+@dataclass
+class LoadReport:
+    injected: int = 0
+    delivered: int = 0
+    failed: int = 0
+    filter_dropped: int = 0
+    dedup_dropped: int = 0
+    queue_dropped: int = 0
+    inject_seconds: float = 0.0
+    total_seconds: float = 0.0
+    max_inject_lag_ms: float = 0.0
+    latencies_ms: list[float] = field(default_factory=list)
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies_ms:
+            return 0.0
+        ordered = sorted(self.latencies_ms)
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "injected": self.injected,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "filter_dropped": self.filter_dropped,
+            "dedup_dropped": self.dedup_dropped,
+            "queue_dropped": self.queue_dropped,
+            "inject_rate": round(self.injected / self.inject_seconds, 1) if self.inject_seconds else 0.0,
+            "throughput": round(self.delivered / self.total_seconds, 1) if self.total_seconds else 0.0,
+            "latency_p50_ms": round(self.percentile(0.50), 1),
+            "latency_p99_ms": round(self.percentile(0.99), 1),
+            "latency_max_ms": round(max(self.latencies_ms, default=0.0), 1),
+            "latency_mean_ms": round(statistics.fmean(self.latencies_ms), 1) if self.latencies_ms else 0.0,
+            "max_inject_lag_ms": round(self.max_inject_lag_ms, 1),
+            "total_seconds": round(self.total_seconds, 2),
+        }
+
+
+def load_replay(path: Path) -> list[tuple[int, str, str | None]]:
+    events: list[tuple[int, str, str | None]] = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            events.append((int(entry["chat_id"]), str(entry["text"]), entry.get("media_url")))
+    return events
+
+
+def synthetic_events(count: int, chats: int, seed: int) -> list[tuple[int, str, str | None]]:
+    corpus = make_corpus(count, seed)
+    return [(-1000000000000 - idx % chats, item.text, None) for idx, item in enumerate(corpus)]
+
+
+def _telegram_message(msg_id: int, text: str, media_url: str | None, now: float) -> Any:
+    webpage = SimpleNamespace(url=media_url, description=None) if media_url else None
+    return SimpleNamespace(
+        id=msg_id,
+        # 用注入时刻作为消息时间（带微秒），端到端延迟即注入到送达的耗时
+        date=datetime.fromtimestamp(now, tz=timezone.utc),
+        raw_text=text,
+        message=text,
+        media=SimpleNamespace(webpage=webpage) if webpage is not None else None,
+    )
+
+
+async def run_load(
+    cfg: Config,
+    events: list[tuple[int, str, str | None]],
+    rate: float,
+    filter_mode: str = "deny",
+) -> LoadReport:
+    """Inject ``events`` at ``rate`` per second and wait until every push settles."""
+    report = LoadReport()
+    chat_ids = sorted({chat_id for chat_id, _, _ in events})
+    keywords = KEYWORDS if filter_mode != "none" else []
+    rule = compile_rule(ChatFilter(mode="deny" if filter_mode == "none" else filter_mode, keywords=keywords))
+
+    watermarks = WatermarkStore(cfg.data_dir / WATERMARKS_FILENAME)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(cfg.pushplus_timeout)) as http_client:
+        pipeline = Pipeline(
+            cfg,
+            http_client,
+            {chat_id: f"chat{chat_id}" for chat_id in chat_ids},
+            {chat_id: rule for chat_id in chat_ids},
+        )
+        # 只计时每个 sink 的成功投递，不改变投递逻辑
+        for sink in pipeline.sinks.values():
+            original = sink.send
+
+            async def timed_send(job: Any, _send: Any = original) -> None:
+                await _send(job)
+                if job.origin_ts is not None:
+                    report.latencies_ms.append((time.time() - job.origin_ts) * 1000)
+
+            sink.send = timed_send  # type: ignore[method-assign]
+
+        # 注入器走的是 main() 注册给 Telethon 的同一个回调
+        ingest = TelegramIngest(cfg, client=None, pipeline=pipeline, watermarks=watermarks)
+        await pipeline.start()
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        interval = 1.0 / rate if rate > 0 else 0.0
+        msg_ids: dict[int, int] = {}
+        for idx, (chat_id, text, media_url) in enumerate(events):
+            # 开环注入：按计划时刻发出，落后时立即补发并记录滞后
+            due = started + idx * interval
+            now = loop.time()
+            if due > now:
+                await asyncio.sleep(due - now)
+            else:
+                report.max_inject_lag_ms = max(report.max_inject_lag_ms, (now - due) * 1000)
+            msg_ids[chat_id] = msg_ids.get(chat_id, 0) + 1
+            message = _telegram_message(msg_ids[chat_id], text, media_url, time.time())
+            await ingest._on_new_message(SimpleNamespace(chat_id=chat_id, message=message))
+            report.injected += 1
+        report.inject_seconds = loop.time() - started
+
+        await pipeline.close()
+        report.total_seconds = loop.time() - started
+
+    metrics = pipeline.metrics
+    report.delivered = int(metrics.sent.total())
+    report.failed = int(metrics.send_failures.total())
+    report.filter_dropped = int(metrics.filtered.total(result="drop"))
+    report.dedup_dropped = int(metrics.dedup_dropped.total())
+    report.queue_dropped = int(metrics.queue_dropped.total())
+    return report
+
+
+def harness_config(args: argparse.Namespace, data_dir: Path, api_url: str) -> Config:
+    return Config(
+        api_id=0,
+        api_hash="",
+        phone="",
+        session_name="load-harness",
+        chats=[],
+        chat_filters={},
+        pushplus_token="load-harness",
+        pushplus_timeout=args.timeout,
+        delivery_workers=args.workers,
+        delivery_queue_size=args.queue_size,
+        delivery_overflow=args.overflow,
+        coalesce_window_seconds=args.coalesce_window,
+        pushplus_api_url=api_url,
+        pushplus_rate_per_second=args.send_rate,
+        pushplus_rate_burst=max(1, int(args.send_rate)),
+        pushplus_breaker_threshold=args.breaker_threshold,
+        data_dir=data_dir,
+        outbox_enabled=args.outbox,
+        dedup_enabled=args.dedup,
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=100.0, help="Injected messages per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of synthetic load")
+    parser.add_argument("--chats", type=int, default=20, help="Synthetic chats to spread load over")
+    parser.add_argument("--replay", default=None, help="JSONL file of recorded messages to inject")
+    parser.add_argument("--seed", type=int, default=6551)
+    parser.add_argument("--filter", default="deny", choices=["deny", "allow", "none"])
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake PushPlus latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500 responses")
+    parser.add_argument("--bad-code-rate", type=float, default=0.0, help="Share of code != 200 responses")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--overflow", default="block", choices=["block", "drop_oldest", "drop_newest"])
+    parser.add_argument("--send-rate", type=float, default=1000.0, help="Client-side PushPlus rate limit")
+    parser.add_argument("--breaker-threshold", type=int, default=5)
+    parser.add_argument("--coalesce-window", type=float, default=0.0)
+    parser.add_argument("--timeout", type=int, default=10)
+    parser.add_argument("--outbox", action="store_true", help="Persist pushes in a temporary outbox")
+    parser.add_argument("--dedup", action="store_true", help="Enable cross-chat dedup")
+    parser.add_argument("--fake-only", action="store_true", help="Only run the fake PushPlus server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING", help="Pipeline log level (text, to stderr)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    fake = FakePushPlus(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        bad_code_rate=args.bad_code_rate,
+        host=args.host,
+        port=args.port,
+        seed=args.seed,
+    )
+    url = fake.start()
+    if args.fake_only:
+        print(f"Fake PushPlus listening on {url} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        fake.stop()
+        return 0
+
+    if args.replay:
+        events = load_replay(Path(args.replay))
+    else:
+        events = synthetic_events(max(1, int(args.rate * args.duration)), args.chats, args.seed)
+
+    log_listener = setup_logging(args.log_level, "text", sample_per_second=5)
+    try:
+        with tempfile.TemporaryDirectory(prefix="tg-forwarder-load-") as tmp:
+            cfg = harness_config(args, Path(tmp), url)
+            report = asyncio.run(run_load(cfg, events, args.rate, args.filter))
+    finally:
+        log_listener.stop()
+        fake.stop()
+
+    summary = report.summary()
+    summary["fake_requests"] = fake.requests
+    summary["fake_http_errors"] = fake.http_errors
+    summary["fake_bad_codes"] = fake.bad_codes
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for key, value in summary.items():
+            print(f"{key:<20} {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import queue
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator
+
+from .config import resolve_data_dir
+from .log import get_logger
+
+
+ARCHIVE_DIRNAME = "archive"
+ARCHIVE_BATCH_SIZE = 256
+ARCHIVE_FLUSH_INTERVAL_SECONDS = 1.0
+# 每天至少换一个分段，保留期按整段删除
+SEGMENT_MAX_SECONDS = 86400.0
+DATA_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx"
+# 索引项：chat_id、msg_id、接收时间、所在压缩块的偏移和长度
+INDEX_RECORD = struct.Struct("<qqdQI")
+
+log = get_logger(__name__)
+
+
+class MessageArchive:
+    """Rotating archive of every received message and its filter decision.
+
+    Each segment is a JSONL file written as a series of independent gzip
+    members, one per flushed batch, so ``zcat`` reads a whole segment while
+    lookups decompress only the member that holds a record. A sidecar
+    ``.idx`` file lists ``(chat_id, msg_id, ts, member offset, member length)``
+    for every record. All file I/O happens on one background thread; segments
+    past the retention period or the total size cap are deleted on rotation.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        max_total_bytes: int = 1024 * 1024 * 1024,
+        retention_seconds: float = 30 * 86400.0,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        flush_interval: float = ARCHIVE_FLUSH_INTERVAL_SECONDS,
+    ) -> None:
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.retention_seconds = retention_seconds
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._records: queue.SimpleQueue[dict[str, Any] | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._data: BinaryIO | None = None
+        self._index: BinaryIO | None = None
+        self._segment_started = 0.0
+        self._segment_size = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer, name="archive-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, record: dict[str, Any]) -> None:
+        """Queue ``record`` (must carry ``ts``, ``chat_id`` and ``msg_id``); never blocks."""
+        self._records.put(record)
+
+    async def close(self) -> None:
+        if self._thread is not None:
+            self._records.put(None)
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def _writer(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._records.get()]
+            # 攒够一批或等满刷新间隔再压缩：块越大压缩率越高，查找时要解压的也越多
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._records.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+            if batch:
+                try:
+                    self._write_block(batch)
+                except OSError as exc:
+                    log.error(
+                        "archive write failed: %s",
+                        exc,
+                        extra={"event": "archive_error", "records": len(batch)},
+                    )
+                    self._close_segment()
+        self._close_segment()
+
+    def _write_block(self, batch: list[dict[str, Any]]) -> None:
+        now = time.time()
+        if (
+            self._data is None
+            or self._segment_size >= self.segment_max_bytes
+            or now - self._segment_started >= SEGMENT_MAX_SECONDS
+        ):
+            self._rotate(now)
+        assert self._data is not None and self._index is not None
+
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        block = gzip.compress(lines.encode("utf-8"), mtime=0)
+        offset = self._segment_size
+        self._data.write(block)
+        self._data.flush()
+        self._segment_size += len(block)
+        # 先写数据再写索引：读者看到的索引项总能找到对应的数据
+        self._index.write(
+            b"".join(
+                INDEX_RECORD.pack(record["chat_id"], record["msg_id"], record["ts"], offset, len(block))
+                for record in batch
+            )
+        )
+        self._index.flush()
+
+    def _rotate(self, now: float) -> None:
+        self._close_segment()
+        segments = list_segments(self.directory)
+        stamp = int(now * 1000)
+        if segments:
+            # 段名必须唯一且递增：同一毫秒内连续换段时顺延
+            stamp = max(stamp, int(segments[-1]) + 1)
+        name = f"{stamp:013d}"
+        self._data = open(self.directory / f"{name}{DATA_SUFFIX}", "ab")
+        self._index = open(self.directory / f"{name}{INDEX_SUFFIX}", "ab")
+        self._segment_started = now
+        self._segment_size = 0
+        self._enforce_limits(now, keep=name)
+
+    def _close_segment(self) -> None:
+        for fh in (self._data, self._index):
+            if fh is not None:
+                try:
+                    fh.close()
+                except OSError:
+                    pass
+        self._data = None
+        self._index = None
+
+    def _enforce_limits(self, now: float, keep: str) -> None:
+        segments = [name for name in list_segments(self.directory) if name != keep]
+        sizes = {name: _segment_size(self.directory, name) for name in segments}
+        total = sum(sizes.values())
+        for name in segments:
+            # 索引文件的修改时间就是本段最后一次写入的时间
+            expired = _segment_mtime(self.directory, name) < now - self.retention_seconds
+            if not expired and total <= self.max_total_bytes:
+                break
+            # 按时间从旧到新删除，当前正在写的段不删
+            for suffix in (DATA_SUFFIX, INDEX_SUFFIX):
+                (self.directory / f"{name}{suffix}").unlink(missing_ok=True)
+            total -= sizes[name]
+            log.info("archive segment removed", extra={"event": "archive_prune", "segment": name})
+
+
+def _segment_size(directory: Path, name: str) -> int:
+    size = 0
+    for suffix in (DATA_SUFFIX, INDEX_SUFFIX):
+        try:
+            size += (directory / f"{name}{suffix}").stat().st_size
+        except OSError:
+            pass
+    return size
+
+
+def _segment_mtime(directory: Path, name: str) -> float:
+    try:
+        return (directory / f"{name}{INDEX_SUFFIX}").stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def list_segments(directory: Path) -> list[str]:
+    """Segment names (start time in ms), oldest first."""
+    if not directory.exists():
+        return []
+    return sorted(
+        path.name[: -len(INDEX_SUFFIX)] for path in directory.glob(f"*{INDEX_SUFFIX}")
+    )
+
+
+def _read_index(directory: Path, name: str) -> Iterator[tuple[int, int, float, int, int]]:
+    data = (directory / f"{name}{INDEX_SUFFIX}").read_bytes()
+    # 正在写的段末尾可能有半条索引，截掉
+    usable = len(data) - len(data) % INDEX_RECORD.size
+    return INDEX_RECORD.iter_unpack(data[:usable])
+
+
+def _read_block(fh: BinaryIO, offset: int, length: int) -> list[dict[str, Any]]:
+    fh.seek(offset)
+    raw = zlib.decompress(fh.read(length), wbits=31)
+    # 不能用 splitlines()：ensure_ascii=False 时消息里的 U+2028 等字符原样保留
+    return [json.loads(line) for line in raw.decode("utf-8").split("\n") if line]
+
+
+def find(
+    directory: Path,
+    chat_id: int | None = None,
+    msg_id: int | None = None,
+    since: float | None = None,
+    until: float | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Archived records matching every given criterion, oldest first.
+
+    Only the index files are scanned; just the compressed blocks holding
+    matches are read and decompressed.
+    """
+    segments = list_segments(directory)
+    for pos, name in enumerate(segments):
+        # 记录在写入前就带上了接收时间，所以下一段的起始时间是本段记录时间的上限
+        if since is not None and pos + 1 < len(segments) and int(segments[pos + 1]) / 1000 < since:
+            continue
+        blocks: dict[int, int] = {}
+        for rec_chat, rec_msg, ts, offset, length in _read_index(directory, name):
+            if chat_id is not None and rec_chat != chat_id:
+                continue
+            if msg_id is not None and rec_msg != msg_id:
+                continue
+            if since is not None and ts < since:
+                continue
+            if until is not None and ts > until:
+                continue
+            blocks[offset] = length
+        if not blocks:
+            continue
+        with open(directory / f"{name}{DATA_SUFFIX}", "rb") as fh:
+            for offset, length in blocks.items():
+                for record in _read_block(fh, offset, length):
+                    if chat_id is not None and record["chat_id"] != chat_id:
+                        continue
+                    if msg_id is not None and record["msg_id"] != msg_id:
+                        continue
+                    if since is not None and record["ts"] < since:
+                        continue
+                    if until is not None and record["ts"] > until:
+                        continue
+                    yield record
+
+
+_AGE_UNITS = {"m": 60.0, "h": 3600.0, "d": 86400.0}
+
+
+def _parse_time(value: str) -> float:
+    # 接受 Unix 秒、本地时间 "YYYY-MM-DD[ HH:MM[:SS]]" 或距今时长 "30m" / "12h" / "7d"
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    unit = _AGE_UNITS.get(value[-1:])
+    if unit is not None:
+        try:
+            return time.time() - float(value[:-1]) * unit
+        except ValueError:
+            pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"invalid time: {value!r}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Look up archived messages and filter decisions.")
+    parser.add_argument(
+        "--dir",
+        default=None,
+        help=f"Archive directory (default: $DATA_DIR/{ARCHIVE_DIRNAME})",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="List segments with their size and record count")
+    get_parser = sub.add_parser("get", help="Show one message by chat id and message id")
+    get_parser.add_argument("chat_id", type=int)
+    get_parser.add_argument("msg_id", type=int)
+    range_parser = sub.add_parser("range", help="Show messages received in a time range")
+    range_parser.add_argument("--since", type=_parse_time, help="Unix seconds, 'YYYY-MM-DD HH:MM' or an age like 7d")
+    range_parser.add_argument("--until", type=_parse_time, help="Unix seconds, 'YYYY-MM-DD HH:MM' or an age like 7d")
+    range_parser.add_argument("--chat-id", type=int)
+    range_parser.add_argument("--decision", help="Only records with this decision, e.g. filter_drop")
+    args = parser.parse_args()
+
+    directory = Path(args.dir) if args.dir else resolve_data_dir() / ARCHIVE_DIRNAME
+    if not directory.exists():
+        print(f"Archive not found: {directory}")
+        return 1
+
+    if args.command == "stats":
+        for name in list_segments(directory):
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(int(name) / 1000))
+            count = sum(1 for _ in _read_index(directory, name))
+            print(f"{name}\t{started}\t{count}\t{_segment_size(directory, name)}")
+        return 0
+
+    if args.command == "get":
+        records = find(directory, chat_id=args.chat_id, msg_id=args.msg_id)
+    else:
+        records = find(directory, chat_id=args.chat_id, since=args.since, until=args.until)
+    found = False
+    for record in records:
+        if args.command == "range" and args.decision and record.get("decision") != args.decision:
+            continue
+        found = True
+        print(json.dumps(record, ensure_ascii=False))
+    if not found and args.command == "get":
+        print("Not found.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+from .delivery import DeliveryJob
+from .log import get_logger
+from .push import build_digest_payload
+
+
+COALESCE_SCOPES = ("chat", "global")
+# scope=global 时不同会话共用缓冲区，合并后的推送不属于任何单一会话
+GLOBAL_CHAT_ID = 0
+
+log = get_logger(__name__)
+
+# 第二个参数是推送要发往的 sink；None 表示按 job.chat_id 路由
+ForwardFunc = Callable[[DeliveryJob, "tuple[str, ...] | None"], Awaitable[object]]
+RouteFunc = Callable[[int], "tuple[str, ...]"]
+
+
+class Coalescer:
+    """Merge jobs that arrive within a time window into one digest job.
+
+    The first job for a buffer starts a ``window_seconds`` timer; the buffer
+    is flushed when the timer fires or once it holds ``max_messages`` jobs.
+    Urgent jobs, and every job when ``window_seconds`` is 0, are forwarded
+    immediately. In ``global`` scope there is one buffer per route (the sinks
+    ``route`` resolves a chat to), so a digest only goes where each of its
+    messages would have gone.
+    """
+
+    def __init__(
+        self,
+        forward: ForwardFunc,
+        window_seconds: float = 0.0,
+        max_messages: int = 10,
+        scope: str = "chat",
+        route: RouteFunc | None = None,
+    ) -> None:
+        if scope not in COALESCE_SCOPES:
+            raise ValueError(f"scope must be one of {', '.join(COALESCE_SCOPES)}")
+        if max_messages < 1:
+            raise ValueError("max_messages must be >= 1")
+
+        self._forward = forward
+        self._window = window_seconds
+        self._max_messages = max_messages
+        self._scope = scope
+        self._route = route
+        self._buffers: dict[Hashable, list[DeliveryJob]] = {}
+        self._timers: dict[Hashable, asyncio.Task[None]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._window > 0 and self._max_messages > 1
+
+    def pending(self) -> int:
+        return sum(len(jobs) for jobs in self._buffers.values())
+
+    async def submit(self, job: DeliveryJob, urgent: bool = False) -> None:
+        if urgent or not self.enabled:
+            await self._forward(job, None)
+            return
+
+        if self._scope == "chat":
+            key: Hashable = job.chat_id
+        else:
+            key = ("route", self._route(job.chat_id) if self._route is not None else None)
+        jobs = self._buffers.setdefault(key, [])
+        jobs.append(job)
+        if len(jobs) >= self._max_messages:
+            await self._flush(key)
+        elif len(jobs) == 1:
+            self._timers[key] = asyncio.create_task(self._flush_later(key))
+
+    async def close(self) -> None:
+        for key in list(self._buffers):
+            await self._flush(key)
+
+    async def _flush_later(self, key: Hashable) -> None:
+        await asyncio.sleep(self._window)
+        self._timers.pop(key, None)
+        pending = len(self._buffers.get(key, ()))
+        try:
+            await self._flush(key)
+        except Exception as exc:
+            # 定时任务没人等待结果：在这里记下丢失的消息，不能只留一句 "exception never retrieved"
+            log.error(
+                "coalesced flush failed: %s",
+                exc,
+                exc_info=True,
+                extra={"event": "coalesce_error", "jobs": pending},
+            )
+
+    async def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        jobs = self._buffers.pop(key, None)
+        if not jobs:
+            return
+        # global 缓冲区的键里带着入缓冲时解析好的路由
+        sinks = None if self._scope == "chat" else key[1]
+        if len(jobs) == 1:
+            await self._forward(jobs[0], sinks)
+            return
+
+        title, content = build_digest_payload([(job.title, job.content) for job in jobs])
+        origins = [job.origin_ts for job in jobs if job.origin_ts is not None]
+        chat_id = jobs[0].chat_id if self._scope == "chat" else GLOBAL_CHAT_ID
+        await self._forward(
+            DeliveryJob(
+                chat_id=chat_id,
+                title=title,
+                content=content,
+                origin_ts=min(origins) if origins else None,
+                priority=min(job.priority for job in jobs),
+            ),
+            sinks,
+        )
@@ -1,16 +1,70 @@
 import os
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+from .filter_syntax import MAX_PATTERNS, check_pattern, parse_expression
+
 
 @dataclass
 class ChatFilter:
     mode: str
     keywords: list[str]
     case_sensitive: bool = False
+    urgent: bool = False
+    dedup: bool = True
+    # JUDGE_ENABLED 时是否对该 chat 做机会判定
+    judge: bool = True
+    # 投递优先级，取值见 PRIORITIES
+    priority: str = "normal"
+    sinks: list[str] | None = None
+    # 正则列表与布尔表达式，和 keywords 一样作为 allow/deny 的命中条件（任一命中即算命中）
+    patterns: list[str] = field(default_factory=list)
+    expr: str = ""
+    # 针对 6551 消息解析字段的名单，键见 FIELD_RULE_KEYS
+    field_rules: dict[str, list[str]] = field(default_factory=dict)
+    # 优先由哪个 Telegram 会话接收；None 表示按哈希自动分配
+    session: str | None = None
+
+
+# events/usernames/groups 为白名单（用户名与分组任一命中即可），drop_* 为黑名单
+FIELD_RULE_KEYS = ("events", "usernames", "groups", "drop_events", "drop_usernames", "drop_groups")
+
+
+SINK_TYPES = ("pushplus", "webhook", "jsonl")
+# 投递优先级，从高到低
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_SINK = "pushplus"
+
+
+# TG_SESSION / TG_PHONE 配置的内置会话
+DEFAULT_SESSION = "main"
+
+
+@dataclass
+class SessionConfig:
+    name: str
+    session_name: str
+    phone: str
+
+
+@dataclass
+class SinkConfig:
+    name: str
+    type: str
+    concurrency: int = 2
+    queue_size: int = 1000
+    overflow: str = "block"
+    max_retries: int = 3
+    retry_base_delay_seconds: float = 1.0
+    timeout_seconds: float | None = None
+    url: str = ""
+    path: str = ""
+    token: str = ""
+    channel: str = "app"
+    headers: dict[str, str] = field(default_factory=dict)
 
 
 @dataclass
@@ -23,6 +77,57 @@ class Config:
     chat_filters: dict[str, ChatFilter]
     pushplus_token: str
     pushplus_timeout: int
+    delivery_workers: int = 4
+    delivery_queue_size: int = 1000
+    delivery_overflow: str = "block"
+    # >0 时投递放到这么多个独立进程里（见 workers.py），0 表示与接收同进程
+    delivery_processes: int = 0
+    delivery_scheduling: str = "strict"
+    delivery_priority_weights: tuple[int, ...] = (8, 4, 1)
+    delivery_shed_age_seconds: float = 0.0
+    delivery_shed_mode: str = "summarize"
+    coalesce_window_seconds: float = 0.0
+    coalesce_max_messages: int = 10
+    coalesce_scope: str = "chat"
+    pushplus_api_url: str = ""
+    pushplus_rate_per_second: float = 1.0
+    pushplus_rate_burst: int = 5
+    pushplus_breaker_threshold: int = 5
+    pushplus_breaker_reset_seconds: float = 30.0
+    data_dir: Path = Path("data")
+    outbox_enabled: bool = True
+    dedup_enabled: bool = False
+    dedup_ttl_seconds: float = 600.0
+    dedup_max_entries: int = 10000
+    dedup_persist: bool = False
+    archive_enabled: bool = False
+    archive_segment_bytes: int = 64 * 1024 * 1024
+    archive_max_bytes: int = 1024 * 1024 * 1024
+    archive_retention_seconds: float = 30 * 86400.0
+    search_enabled: bool = False
+    judge_enabled: bool = False
+    judge_budget_seconds: float = 1.5
+    judge_min_confidence: int = 70
+    judge_suppress: bool = False
+    judge_concurrency: int = 4
+    openai_api_key: str = ""
+    openai_model: str = "gpt-4.1-mini"
+    openai_api_url: str = "https://api.openai.com/v1/responses"
+    startup_concurrency: int = 4
+    backfill_max_messages: int = 200
+    entity_cache_enabled: bool = True
+    entity_cache_max_age_seconds: float = 86400.0
+    filter_config_path: Path | None = None
+    filter_reload_interval_seconds: float = 5.0
+    sinks: dict[str, SinkConfig] = field(default_factory=dict)
+    default_sinks: list[str] = field(default_factory=lambda: [DEFAULT_SINK])
+    metrics_port: int = 0
+    metrics_host: str = "0.0.0.0"
+    log_level: str = "INFO"
+    log_format: str = "json"
+    log_sample_per_second: int = 5
+    # 额外的 Telegram 会话（不含内置的 main），会话的 chat 按哈希分片
+    sessions: list[SessionConfig] = field(default_factory=list)
 
 
 def _load_chat_filters_from_json(config_path: Path) -> dict[str, ChatFilter]:
@@ -55,10 +160,64 @@ def _load_chat_filters_from_json(config_path: Path) -> dict[str, ChatFilter]:
         keywords = [str(item) for item in keywords_raw]
         case_sensitive = bool(entry.get("case_sensitive", False))
 
+        patterns_raw = entry.get("patterns", [])
+        if not isinstance(patterns_raw, list):
+            raise ValueError(f"Invalid filter config: chat_filters[{idx}].patterns must be a list")
+        if len(patterns_raw) > MAX_PATTERNS:
+            raise ValueError(
+                f"Invalid filter config: chat_filters[{idx}].patterns has more than {MAX_PATTERNS} entries"
+            )
+        patterns = [str(item) for item in patterns_raw]
+        for pattern_idx, pattern in enumerate(patterns, start=1):
+            try:
+                check_pattern(pattern)
+            except ValueError as exc:
+                raise ValueError(
+                    f"Invalid filter config: chat_filters[{idx}].patterns[{pattern_idx}]: {exc}"
+                ) from exc
+
+        expr = str(entry.get("expr", "")).strip()
+        if expr:
+            try:
+                parse_expression(expr, case_sensitive)
+            except ValueError as exc:
+                raise ValueError(f"Invalid filter config: chat_filters[{idx}].expr: {exc}") from exc
+
+        field_rules: dict[str, list[str]] = {}
+        for key in FIELD_RULE_KEYS:
+            values_raw = entry.get(key, [])
+            if not isinstance(values_raw, list):
+                raise ValueError(f"Invalid filter config: chat_filters[{idx}].{key} must be a list")
+            values = [str(item).strip() for item in values_raw if str(item).strip()]
+            if values:
+                field_rules[key] = values
+
+        session_raw = entry.get("session")
+        session = str(session_raw).strip() if session_raw is not None else None
+
+        urgent = bool(entry.get("urgent", False))
+        dedup = bool(entry.get("dedup", True))
+        judge = bool(entry.get("judge", True))
+        priority = str(entry.get("priority", "normal")).strip().lower()
+        if priority not in PRIORITIES:
+            raise ValueError(
+                f"Invalid filter config: chat_filters[{idx}].priority must be one of {', '.join(PRIORITIES)}"
+            )
+        sinks = _parse_sink_names(entry.get("sinks"), f"chat_filters[{idx}].sinks")
+
         chat_filters[chat] = ChatFilter(
             mode=mode,
             keywords=keywords,
             case_sensitive=case_sensitive,
+            urgent=urgent,
+            dedup=dedup,
+            judge=judge,
+            priority=priority,
+            sinks=sinks,
+            patterns=patterns,
+            expr=expr,
+            field_rules=field_rules,
+            session=session or None,
         )
 
     if not chat_filters:
@@ -67,9 +226,174 @@ def _load_chat_filters_from_json(config_path: Path) -> dict[str, ChatFilter]:
     return chat_filters
 
 
+def _parse_sink_names(raw: object, where: str) -> list[str] | None:
+    if raw is None:
+        return None
+    if not isinstance(raw, list) or not raw:
+        raise ValueError(f"Invalid filter config: {where} must be a non-empty list of sink names")
+    return [str(name).strip() for name in raw]
+
+
+def _load_sinks_from_json(config_path: Path) -> tuple[dict[str, SinkConfig], list[str]]:
+    """Sink definitions and the default route from the filter config file."""
+    data = json.loads(config_path.read_text(encoding="utf-8"))
+    sink_entries = data.get("sinks", [])
+    if not isinstance(sink_entries, list):
+        raise ValueError("Invalid filter config: 'sinks' must be a list")
+
+    sinks: dict[str, SinkConfig] = {}
+    for idx, entry in enumerate(sink_entries, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Invalid filter config: sinks[{idx}] must be an object")
+
+        name = str(entry.get("name", "")).strip()
+        if not name:
+            raise ValueError(f"Invalid filter config: sinks[{idx}].name is required")
+        if name in sinks:
+            raise ValueError(f"Invalid filter config: duplicate sink name '{name}'")
+
+        sink_type = str(entry.get("type", "")).strip().lower()
+        if sink_type not in SINK_TYPES:
+            raise ValueError(
+                f"Invalid filter config: sinks[{idx}].type must be one of {', '.join(SINK_TYPES)}"
+            )
+
+        headers_raw = entry.get("headers", {})
+        if not isinstance(headers_raw, dict):
+            raise ValueError(f"Invalid filter config: sinks[{idx}].headers must be an object")
+
+        # token 可以直接写，也可以用 token_env 指向环境变量，避免把密钥写进配置文件
+        token = str(entry.get("token", "")).strip()
+        token_env = str(entry.get("token_env", "")).strip()
+        if token_env:
+            token = os.getenv(token_env, "").strip()
+            if not token:
+                raise ValueError(f"Missing env: {token_env} (sinks[{idx}].token_env)")
+
+        try:
+            timeout_raw = entry.get("timeout_seconds")
+            sink = SinkConfig(
+                name=name,
+                type=sink_type,
+                concurrency=int(entry.get("concurrency", 2)),
+                queue_size=int(entry.get("queue_size", 1000)),
+                overflow=str(entry.get("overflow", "block")).strip().lower(),
+                max_retries=int(entry.get("max_retries", 3)),
+                retry_base_delay_seconds=float(entry.get("retry_base_delay_seconds", 1.0)),
+                timeout_seconds=float(timeout_raw) if timeout_raw is not None else None,
+                url=str(entry.get("url", "")).strip(),
+                path=str(entry.get("path", "")).strip(),
+                token=token,
+                channel=str(entry.get("channel", "app")).strip(),
+                headers={str(k): str(v) for k, v in headers_raw.items()},
+            )
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid filter config: sinks[{idx}] has an invalid number: {exc}") from exc
+
+        if sink.concurrency < 1 or sink.queue_size < 1 or sink.max_retries < 1:
+            raise ValueError(
+                f"Invalid filter config: sinks[{idx}] concurrency, queue_size and max_retries must be >= 1"
+            )
+        if sink.overflow not in {"block", "drop_oldest", "drop_newest"}:
+            raise ValueError(
+                f"Invalid filter config: sinks[{idx}].overflow must be 'block', 'drop_oldest' or 'drop_newest'"
+            )
+        if sink_type == "webhook" and not sink.url:
+            raise ValueError(f"Invalid filter config: sinks[{idx}].url is required for webhook sinks")
+        if sink_type == "jsonl" and not sink.path:
+            raise ValueError(f"Invalid filter config: sinks[{idx}].path is required for jsonl sinks")
+        sinks[name] = sink
+
+    default_sinks = _parse_sink_names(data.get("default_sinks"), "default_sinks") or [DEFAULT_SINK]
+    return sinks, default_sinks
+
+
+def _check_sink_routes(
+    chat_filters: dict[str, ChatFilter],
+    sink_names: set[str],
+    default_sinks: list[str],
+) -> None:
+    routes = [("default_sinks", default_sinks)]
+    routes += [(chat, f.sinks) for chat, f in chat_filters.items() if f.sinks is not None]
+    for where, names in routes:
+        unknown = [name for name in names if name not in sink_names]
+        if unknown:
+            raise ValueError(
+                f"Invalid filter config: {where} routes to unknown sinks: {', '.join(unknown)}"
+            )
+
+
+def _load_sessions_from_json(config_path: Path) -> list[SessionConfig]:
+    """Extra Telegram sessions from the filter config file."""
+    data = json.loads(config_path.read_text(encoding="utf-8"))
+    session_entries = data.get("sessions", [])
+    if not isinstance(session_entries, list):
+        raise ValueError("Invalid filter config: 'sessions' must be a list")
+
+    sessions: list[SessionConfig] = []
+    names = {DEFAULT_SESSION}
+    for idx, entry in enumerate(session_entries, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Invalid filter config: sessions[{idx}] must be an object")
+
+        name = str(entry.get("name", "")).strip()
+        if not name:
+            raise ValueError(f"Invalid filter config: sessions[{idx}].name is required")
+        if name in names:
+            raise ValueError(f"Invalid filter config: duplicate session name '{name}'")
+        names.add(name)
+
+        session_name = str(entry.get("session", "")).strip()
+        if not session_name:
+            raise ValueError(f"Invalid filter config: sessions[{idx}].session is required")
+
+        # 手机号同 sink 的 token 一样，可以用 phone_env 指向环境变量
+        phone = str(entry.get("phone", "")).strip()
+        phone_env = str(entry.get("phone_env", "")).strip()
+        if phone_env:
+            phone = os.getenv(phone_env, "").strip()
+            if not phone:
+                raise ValueError(f"Missing env: {phone_env} (sessions[{idx}].phone_env)")
+        if not phone:
+            raise ValueError(f"Invalid filter config: sessions[{idx}] needs phone or phone_env")
+
+        sessions.append(SessionConfig(name=name, session_name=session_name, phone=phone))
+    return sessions
+
+
+def _check_session_pins(chat_filters: dict[str, ChatFilter], session_names: set[str]) -> None:
+    for chat, chat_filter in chat_filters.items():
+        if chat_filter.session is not None and chat_filter.session not in session_names:
+            raise ValueError(
+                f"Invalid filter config: {chat} is pinned to unknown session: {chat_filter.session}"
+            )
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    if raw in {"1", "true", "yes", "on"}:
+        return True
+    if raw in {"0", "false", "no", "off"}:
+        return False
+    raise ValueError(f"Invalid env: {name} must be true or false")
+
+
+def resolve_data_dir() -> Path:
+    # 持久化数据（outbox 等）所在目录，相对路径以项目根目录为基准
+    load_dotenv(PROJECT_ROOT / ".env")
+    data_dir = Path(os.getenv("DATA_DIR", "data").strip() or "data")
+    if not data_dir.is_absolute():
+        data_dir = PROJECT_ROOT / data_dir
+    return data_dir
+
+
 def load_config() -> Config:
-    project_root = Path(__file__).resolve().parent.parent
-    load_dotenv(project_root / ".env")
+    load_dotenv(PROJECT_ROOT / ".env")
 
     api_id_raw = os.getenv("TG_API_ID", "").strip()
     api_hash = os.getenv("TG_API_HASH", "").strip()
@@ -78,6 +402,18 @@ def load_config() -> Config:
     pushplus_token = os.getenv("PUSHPLUS_TOKEN", "").strip()
     pushplus_timeout_raw = os.getenv("PUSHPLUS_TIMEOUT", "10").strip()
     session_name = os.getenv("TG_SESSION", "tg_forwarder").strip()
+    delivery_workers_raw = os.getenv("DELIVERY_WORKERS", "4").strip()
+    delivery_queue_size_raw = os.getenv("DELIVERY_QUEUE_SIZE", "1000").strip()
+    delivery_overflow = os.getenv("DELIVERY_OVERFLOW", "block").strip().lower()
+    delivery_processes_raw = os.getenv("DELIVERY_PROCESSES", "0").strip()
+    coalesce_window_raw = os.getenv("COALESCE_WINDOW_SECONDS", "0").strip()
+    coalesce_max_messages_raw = os.getenv("COALESCE_MAX_MESSAGES", "10").strip()
+    coalesce_scope = os.getenv("COALESCE_SCOPE", "chat").strip().lower()
+    pushplus_api_url = os.getenv("PUSHPLUS_API_URL", "").strip()
+    pushplus_rate_raw = os.getenv("PUSHPLUS_RATE_PER_SECOND", "1").strip()
+    pushplus_burst_raw = os.getenv("PUSHPLUS_RATE_BURST", "5").strip()
+    breaker_threshold_raw = os.getenv("PUSHPLUS_BREAKER_THRESHOLD", "5").strip()
+    breaker_reset_raw = os.getenv("PUSHPLUS_BREAKER_RESET_SECONDS", "30").strip()
 
     if not api_id_raw:
         raise ValueError("Missing env: TG_API_ID")
@@ -88,9 +424,14 @@ def load_config() -> Config:
         raise ValueError("Missing env: FILTER_CONFIG_PATH")
     filter_path = Path(filter_config_path_raw)
     if not filter_path.is_absolute():
-        filter_path = project_root / filter_path
+        filter_path = PROJECT_ROOT / filter_path
     chat_filters = _load_chat_filters_from_json(filter_path)
     chats = list(chat_filters.keys())
+    sinks, default_sinks = _load_sinks_from_json(filter_path)
+    # 内置的 pushplus sink 由环境变量配置，也可以在 sinks 中用同名条目覆盖
+    _check_sink_routes(chat_filters, set(sinks) | {DEFAULT_SINK}, default_sinks)
+    sessions = _load_sessions_from_json(filter_path)
+    _check_session_pins(chat_filters, {DEFAULT_SESSION} | {session.name for session in sessions})
 
     if not phone:
         raise ValueError("Missing env: TG_PHONE")
@@ -107,6 +448,187 @@ def load_config() -> Config:
     except ValueError as exc:
         raise ValueError("Invalid env: PUSHPLUS_TIMEOUT must be an integer") from exc
 
+    try:
+        delivery_workers = int(delivery_workers_raw)
+        delivery_queue_size = int(delivery_queue_size_raw)
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: DELIVERY_WORKERS and DELIVERY_QUEUE_SIZE must be integers"
+        ) from exc
+    if delivery_workers < 1 or delivery_queue_size < 1:
+        raise ValueError("Invalid env: DELIVERY_WORKERS and DELIVERY_QUEUE_SIZE must be >= 1")
+
+    delivery_scheduling = os.getenv("DELIVERY_SCHEDULING", "strict").strip().lower() or "strict"
+    if delivery_scheduling not in {"strict", "weighted"}:
+        raise ValueError("Invalid env: DELIVERY_SCHEDULING must be 'strict' or 'weighted'")
+    weights_raw = os.getenv("DELIVERY_PRIORITY_WEIGHTS", "8,4,1").strip() or "8,4,1"
+    try:
+        delivery_priority_weights = tuple(int(item) for item in weights_raw.split(","))
+    except ValueError as exc:
+        raise ValueError("Invalid env: DELIVERY_PRIORITY_WEIGHTS must be integers") from exc
+    if len(delivery_priority_weights) != len(PRIORITIES) or min(delivery_priority_weights) < 1:
+        raise ValueError(
+            f"Invalid env: DELIVERY_PRIORITY_WEIGHTS must be {len(PRIORITIES)} integers >= 1 "
+            f"({', '.join(PRIORITIES)})"
+        )
+    try:
+        delivery_shed_age_seconds = float(os.getenv("DELIVERY_SHED_AGE_SECONDS", "0").strip())
+    except ValueError as exc:
+        raise ValueError("Invalid env: DELIVERY_SHED_AGE_SECONDS must be a number") from exc
+    if delivery_shed_age_seconds < 0:
+        raise ValueError("Invalid env: DELIVERY_SHED_AGE_SECONDS must be >= 0")
+    delivery_shed_mode = os.getenv("DELIVERY_SHED_MODE", "summarize").strip().lower() or "summarize"
+    if delivery_shed_mode not in {"drop", "summarize"}:
+        raise ValueError("Invalid env: DELIVERY_SHED_MODE must be 'drop' or 'summarize'")
+
+    try:
+        delivery_processes = int(delivery_processes_raw)
+    except ValueError as exc:
+        raise ValueError("Invalid env: DELIVERY_PROCESSES must be an integer") from exc
+    if delivery_processes < 0:
+        raise ValueError("Invalid env: DELIVERY_PROCESSES must be >= 0")
+
+    if delivery_overflow not in {"block", "drop_oldest", "drop_newest"}:
+        raise ValueError(
+            "Invalid env: DELIVERY_OVERFLOW must be 'block', 'drop_oldest' or 'drop_newest'"
+        )
+
+    try:
+        coalesce_window_seconds = float(coalesce_window_raw)
+        coalesce_max_messages = int(coalesce_max_messages_raw)
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: COALESCE_WINDOW_SECONDS must be a number and COALESCE_MAX_MESSAGES an integer"
+        ) from exc
+    if coalesce_window_seconds < 0 or coalesce_max_messages < 1:
+        raise ValueError(
+            "Invalid env: COALESCE_WINDOW_SECONDS must be >= 0 and COALESCE_MAX_MESSAGES >= 1"
+        )
+
+    if coalesce_scope not in {"chat", "global"}:
+        raise ValueError("Invalid env: COALESCE_SCOPE must be 'chat' or 'global'")
+
+    try:
+        pushplus_rate_per_second = float(pushplus_rate_raw)
+        pushplus_rate_burst = int(pushplus_burst_raw)
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: PUSHPLUS_RATE_PER_SECOND must be a number and PUSHPLUS_RATE_BURST an integer"
+        ) from exc
+    if pushplus_rate_per_second <= 0 or pushplus_rate_burst < 1:
+        raise ValueError(
+            "Invalid env: PUSHPLUS_RATE_PER_SECOND must be > 0 and PUSHPLUS_RATE_BURST >= 1"
+        )
+
+    try:
+        pushplus_breaker_threshold = int(breaker_threshold_raw)
+        pushplus_breaker_reset_seconds = float(breaker_reset_raw)
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: PUSHPLUS_BREAKER_THRESHOLD must be an integer and "
+            "PUSHPLUS_BREAKER_RESET_SECONDS a number"
+        ) from exc
+    if pushplus_breaker_threshold < 1:
+        raise ValueError("Invalid env: PUSHPLUS_BREAKER_THRESHOLD must be >= 1")
+
+    outbox_enabled = _env_bool("OUTBOX_ENABLED", True)
+
+    dedup_enabled = _env_bool("DEDUP_ENABLED", False)
+    dedup_persist = _env_bool("DEDUP_PERSIST", False)
+    try:
+        dedup_ttl_seconds = float(os.getenv("DEDUP_TTL_SECONDS", "600").strip())
+        dedup_max_entries = int(os.getenv("DEDUP_MAX_ENTRIES", "10000").strip())
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: DEDUP_TTL_SECONDS must be a number and DEDUP_MAX_ENTRIES an integer"
+        ) from exc
+    if dedup_ttl_seconds <= 0 or dedup_max_entries < 1:
+        raise ValueError("Invalid env: DEDUP_TTL_SECONDS must be > 0 and DEDUP_MAX_ENTRIES >= 1")
+
+    archive_enabled = _env_bool("ARCHIVE_ENABLED", False)
+    try:
+        archive_segment_mb = int(os.getenv("ARCHIVE_SEGMENT_MB", "64").strip())
+        archive_max_mb = int(os.getenv("ARCHIVE_MAX_MB", "1024").strip())
+        archive_retention_days = float(os.getenv("ARCHIVE_RETENTION_DAYS", "30").strip())
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: ARCHIVE_SEGMENT_MB and ARCHIVE_MAX_MB must be integers"
+            " and ARCHIVE_RETENTION_DAYS a number"
+        ) from exc
+    if archive_segment_mb < 1 or archive_max_mb < archive_segment_mb or archive_retention_days <= 0:
+        raise ValueError(
+            "Invalid env: ARCHIVE_SEGMENT_MB must be >= 1, ARCHIVE_MAX_MB >= ARCHIVE_SEGMENT_MB"
+            " and ARCHIVE_RETENTION_DAYS > 0"
+        )
+
+    search_enabled = _env_bool("SEARCH_ENABLED", False)
+
+    judge_enabled = _env_bool("JUDGE_ENABLED", False)
+    judge_suppress = _env_bool("JUDGE_SUPPRESS", False)
+    try:
+        judge_budget_seconds = int(os.getenv("JUDGE_BUDGET_MS", "1500").strip()) / 1000
+        judge_min_confidence = int(os.getenv("JUDGE_MIN_CONFIDENCE", "70").strip())
+        judge_concurrency = int(os.getenv("JUDGE_CONCURRENCY", "4").strip())
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: JUDGE_BUDGET_MS, JUDGE_MIN_CONFIDENCE and JUDGE_CONCURRENCY must be integers"
+        ) from exc
+    if judge_budget_seconds <= 0 or judge_concurrency < 1:
+        raise ValueError("Invalid env: JUDGE_BUDGET_MS must be > 0 and JUDGE_CONCURRENCY >= 1")
+    if not 0 <= judge_min_confidence <= 100:
+        raise ValueError("Invalid env: JUDGE_MIN_CONFIDENCE must be between 0 and 100")
+    openai_api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    openai_model = os.getenv("OPENAI_MODEL", "gpt-4.1-mini").strip() or "gpt-4.1-mini"
+    openai_api_url = os.getenv("OPENAI_API_URL", "").strip() or "https://api.openai.com/v1/responses"
+    if judge_enabled and not openai_api_key:
+        raise ValueError("Invalid env: OPENAI_API_KEY is required when JUDGE_ENABLED is true")
+
+    try:
+        startup_concurrency = int(os.getenv("STARTUP_CONCURRENCY", "4").strip())
+        backfill_max_messages = int(os.getenv("BACKFILL_MAX_MESSAGES", "200").strip())
+    except ValueError as exc:
+        raise ValueError(
+            "Invalid env: STARTUP_CONCURRENCY and BACKFILL_MAX_MESSAGES must be integers"
+        ) from exc
+    if startup_concurrency < 1 or backfill_max_messages < 1:
+        raise ValueError("Invalid env: STARTUP_CONCURRENCY and BACKFILL_MAX_MESSAGES must be >= 1")
+
+    entity_cache_enabled = _env_bool("ENTITY_CACHE_ENABLED", True)
+    try:
+        entity_cache_max_age_seconds = float(
+            os.getenv("ENTITY_CACHE_MAX_AGE_SECONDS", "86400").strip()
+        )
+    except ValueError as exc:
+        raise ValueError("Invalid env: ENTITY_CACHE_MAX_AGE_SECONDS must be a number") from exc
+
+    try:
+        filter_reload_interval_seconds = float(
+            os.getenv("FILTER_RELOAD_INTERVAL_SECONDS", "5").strip()
+        )
+    except ValueError as exc:
+        raise ValueError("Invalid env: FILTER_RELOAD_INTERVAL_SECONDS must be a number") from exc
+
+    metrics_host = os.getenv("METRICS_HOST", "0.0.0.0").strip() or "0.0.0.0"
+    try:
+        metrics_port = int(os.getenv("METRICS_PORT", "0").strip())
+    except ValueError as exc:
+        raise ValueError("Invalid env: METRICS_PORT must be an integer") from exc
+    if not 0 <= metrics_port <= 65535:
+        raise ValueError("Invalid env: METRICS_PORT must be between 0 and 65535")
+
+    log_level = os.getenv("LOG_LEVEL", "INFO").strip().upper() or "INFO"
+    if log_level not in {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}:
+        raise ValueError("Invalid env: LOG_LEVEL must be DEBUG, INFO, WARNING, ERROR or CRITICAL")
+    log_format = os.getenv("LOG_FORMAT", "json").strip().lower() or "json"
+    if log_format not in {"json", "text"}:
+        raise ValueError("Invalid env: LOG_FORMAT must be 'json' or 'text'")
+    try:
+        log_sample_per_second = int(os.getenv("LOG_SAMPLE_PER_SECOND", "5").strip())
+    except ValueError as exc:
+        raise ValueError("Invalid env: LOG_SAMPLE_PER_SECOND must be an integer") from exc
+    if log_sample_per_second < 0:
+        raise ValueError("Invalid env: LOG_SAMPLE_PER_SECOND must be >= 0")
+
     return Config(
         api_id=api_id,
         api_hash=api_hash,
@@ -116,4 +638,53 @@ def load_config() -> Config:
         chat_filters=chat_filters,
         pushplus_token=pushplus_token,
         pushplus_timeout=pushplus_timeout,
+        delivery_workers=delivery_workers,
+        delivery_queue_size=delivery_queue_size,
+        delivery_overflow=delivery_overflow,
+        delivery_processes=delivery_processes,
+        delivery_scheduling=delivery_scheduling,
+        delivery_priority_weights=delivery_priority_weights,
+        delivery_shed_age_seconds=delivery_shed_age_seconds,
+        delivery_shed_mode=delivery_shed_mode,
+        coalesce_window_seconds=coalesce_window_seconds,
+        coalesce_max_messages=coalesce_max_messages,
+        coalesce_scope=coalesce_scope,
+        pushplus_api_url=pushplus_api_url,
+        pushplus_rate_per_second=pushplus_rate_per_second,
+        pushplus_rate_burst=pushplus_rate_burst,
+        pushplus_breaker_threshold=pushplus_breaker_threshold,
+        pushplus_breaker_reset_seconds=pushplus_breaker_reset_seconds,
+        data_dir=resolve_data_dir(),
+        outbox_enabled=outbox_enabled,
+        dedup_enabled=dedup_enabled,
+        dedup_ttl_seconds=dedup_ttl_seconds,
+        dedup_max_entries=dedup_max_entries,
+        dedup_persist=dedup_persist,
+        archive_enabled=archive_enabled,
+        archive_segment_bytes=archive_segment_mb * 1024 * 1024,
+        archive_max_bytes=archive_max_mb * 1024 * 1024,
+        archive_retention_seconds=archive_retention_days * 86400,
+        search_enabled=search_enabled,
+        judge_enabled=judge_enabled,
+        judge_budget_seconds=judge_budget_seconds,
+        judge_min_confidence=judge_min_confidence,
+        judge_suppress=judge_suppress,
+        judge_concurrency=judge_concurrency,
+        openai_api_key=openai_api_key,
+        openai_model=openai_model,
+        openai_api_url=openai_api_url,
+        startup_concurrency=startup_concurrency,
+        backfill_max_messages=backfill_max_messages,
+        entity_cache_enabled=entity_cache_enabled,
+        entity_cache_max_age_seconds=entity_cache_max_age_seconds,
+        filter_config_path=filter_path,
+        filter_reload_interval_seconds=filter_reload_interval_seconds,
+        sinks=sinks,
+        default_sinks=default_sinks,
+        metrics_port=metrics_port,
+        metrics_host=metrics_host,
+        log_level=log_level,
+        log_format=log_format,
+        log_sample_per_second=log_sample_per_second,
+        sessions=sessions,
     )
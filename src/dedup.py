@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from .format import Message
+from .log import get_logger
+
+
+DEDUP_FILENAME = "dedup.json"
+
+log = get_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def content_key(message: Message) -> str | None:
+    """Hash of the normalised text plus media URL; ``None`` for empty messages."""
+    text = unicodedata.normalize("NFKC", message.message).casefold()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    media_url = (message.media_url or "").strip()
+    if not text and not media_url:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(text.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(media_url.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DedupCache:
+    """Bounded set of content keys, each remembered for ``ttl_seconds`` from first sight.
+
+    A repeat does not extend the window, so an alert that keeps recurring is
+    pushed again once per TTL. Expiry times are wall-clock so the cache can
+    be saved and reloaded across restarts.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 600.0,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._expires: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def check(self, key: str) -> bool:
+        """Return True if ``key`` was seen within the TTL; records it either way."""
+        now = self._clock()
+        self._evict_expired(now)
+
+        if key in self._expires:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self._expires[key] = now + self.ttl_seconds
+        while len(self._expires) > self.max_entries:
+            self._expires.popitem(last=False)
+        return False
+
+    def _evict_expired(self, now: float) -> None:
+        # 过期时间从首次出现算起、命中不刷新，按插入顺序排列即按过期时间排列
+        expires = self._expires
+        while expires:
+            key, expires_at = next(iter(expires.items()))
+            if expires_at > now:
+                break
+            del expires[key]
+
+    def snapshot(self) -> list[tuple[str, float]]:
+        self._evict_expired(self._clock())
+        return list(self._expires.items())
+
+    def save(self, path: Path) -> None:
+        write_snapshot(path, self.snapshot())
+
+    def load(self, path: Path) -> int:
+        if not path.exists():
+            return 0
+        try:
+            entries = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            log.warning("ignoring unreadable dedup cache: %s", exc, extra={"path": str(path)})
+            return 0
+
+        now = self._clock()
+        for key, expires_at in sorted(entries, key=lambda item: item[1]):
+            if expires_at > now:
+                self._expires[key] = expires_at
+        while len(self._expires) > self.max_entries:
+            self._expires.popitem(last=False)
+        return len(self._expires)
+
+
+def write_snapshot(path: Path, entries: list[tuple[str, float]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(entries), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class SeenMessages:
+    """Bounded set of recently ingested ``(chat_id, msg_id)`` pairs.
+
+    Shared by all Telegram sessions, so a message that two sessions receive
+    (e.g. while a chat moves between them) is handled once.
+    """
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self._seen: OrderedDict[tuple[int, int], None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, chat_id: int, msg_id: int) -> bool:
+        """Remember the message; returns False if it was already seen."""
+        key = (chat_id, msg_id)
+        if key in self._seen:
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return True
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import html
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from .config import PRIORITIES
+from .log import get_logger
+
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+SCHEDULING_STRICT = "strict"
+SCHEDULING_WEIGHTED = "weighted"
+SCHEDULING_POLICIES = (SCHEDULING_STRICT, SCHEDULING_WEIGHTED)
+
+SHED_DROP = "drop"
+SHED_SUMMARIZE = "summarize"
+SHED_MODES = (SHED_DROP, SHED_SUMMARIZE)
+
+# 数值越小越优先，与 config.PRIORITIES 的顺序一致
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = range(len(PRIORITIES))
+DEFAULT_PRIORITY_WEIGHTS = (8, 4, 1)
+# 积压摘要里最多列出的标题数
+SHED_SUMMARY_MAX_TITLES = 20
+
+log = get_logger(__name__)
+
+
+@dataclass
+class DeliveryJob:
+    chat_id: int
+    title: str
+    content: str
+    outbox_id: int | None = None
+    sink: str = ""
+    # 源消息的 Telegram 时间（Unix 秒），合并推送取最早一条
+    origin_ts: float | None = None
+    priority: int = PRIORITY_NORMAL
+
+
+def priority_level(name: str) -> int:
+    return PRIORITIES.index(name)
+
+
+SendFunc = Callable[[DeliveryJob], Awaitable[None]]
+DropFunc = Callable[[DeliveryJob], None]
+
+
+_Item = tuple[float, DeliveryJob]
+
+
+class _PriorityLane(asyncio.Queue):  # type: ignore[type-arg]
+    """One worker's queue: a FIFO per priority class, served strictly or by weight.
+
+    Items are ``(enqueued_at, job)``. ``weights`` of ``None`` means strict
+    priority; otherwise classes are served by smooth weighted round-robin.
+    """
+
+    def __init__(self, maxsize: int, weights: tuple[int, ...] | None) -> None:
+        self._weights = weights
+        super().__init__(maxsize)
+
+    def _init(self, maxsize: int) -> None:
+        self._classes: list[collections.deque[_Item]] = [collections.deque() for _ in PRIORITIES]
+        self._credits = [0] * len(PRIORITIES)
+
+    # asyncio.Queue 的 qsize()/empty() 直接读 self._queue，这里按各类队列重新实现
+    def qsize(self) -> int:
+        return sum(len(items) for items in self._classes)
+
+    def empty(self) -> bool:
+        return not any(self._classes)
+
+    def _put(self, item: _Item) -> None:
+        self._classes[item[1].priority].append(item)
+
+    def _get(self) -> _Item:
+        if self._weights is None:
+            return next(items for items in self._classes if items).popleft()
+        # 平滑加权轮询：非空的类各加上自己的权重，取累计最高的，再减去本轮权重之和
+        active = [level for level, items in enumerate(self._classes) if items]
+        for level in range(len(self._credits)):
+            if level in active:
+                self._credits[level] += self._weights[level]
+            else:
+                self._credits[level] = 0
+        chosen = max(active, key=lambda level: self._credits[level])
+        self._credits[chosen] -= sum(self._weights[level] for level in active)
+        return self._classes[chosen].popleft()
+
+    def _removed(self, count: int) -> None:
+        for _ in range(count):
+            self.task_done()
+            self._wakeup_next(self._putters)  # type: ignore[attr-defined]
+
+    def evict_lowest(self, min_priority: int) -> DeliveryJob | None:
+        """Remove the oldest job of the lowest class at or below ``min_priority``."""
+        for level in range(len(self._classes) - 1, min_priority - 1, -1):
+            if self._classes[level]:
+                _, job = self._classes[level].popleft()
+                self._removed(1)
+                return job
+        return None
+
+    def take_stale(self, priority: int, cutoff: float) -> list[DeliveryJob]:
+        """Remove the jobs of class ``priority`` enqueued at or before ``cutoff``."""
+        items = self._classes[priority]
+        stale: list[DeliveryJob] = []
+        while items and items[0][0] <= cutoff:
+            stale.append(items.popleft()[1])
+        self._removed(len(stale))
+        return stale
+
+
+class DeliveryQueue:
+    """Bounded queue feeding a pool of delivery workers.
+
+    Jobs are sharded onto one lane per worker by ``chat_id``, so messages from
+    the same chat are always delivered in the order they were accepted, while
+    different chats are delivered concurrently.
+
+    Within a lane, higher-priority jobs are served first (``strict``) or more
+    often (``weighted``), and a full lane makes room for a job by evicting a
+    lower-priority one. With ``shed_age_seconds`` set, low-priority jobs that
+    waited longer than that are dropped or replaced by one summary push.
+    """
+
+    def __init__(
+        self,
+        send: SendFunc,
+        workers: int = 4,
+        maxsize: int = 1000,
+        overflow: str = OVERFLOW_BLOCK,
+        on_drop: DropFunc | None = None,
+        name: str = "delivery",
+        on_shed: DropFunc | None = None,
+        scheduling: str = SCHEDULING_STRICT,
+        weights: tuple[int, ...] = DEFAULT_PRIORITY_WEIGHTS,
+        shed_age_seconds: float = 0.0,
+        shed_mode: str = SHED_SUMMARIZE,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError(f"scheduling must be one of {', '.join(SCHEDULING_POLICIES)}")
+        if len(weights) != len(PRIORITIES) or min(weights) < 1:
+            raise ValueError(f"weights must be {len(PRIORITIES)} integers >= 1")
+        if shed_mode not in SHED_MODES:
+            raise ValueError(f"shed_mode must be one of {', '.join(SHED_MODES)}")
+
+        self.name = name
+        self._send = send
+        self._overflow = overflow
+        self._on_drop = on_drop
+        self._on_shed = on_shed
+        self._shed_age = shed_age_seconds
+        self._shed_mode = shed_mode
+        lane_size = max(1, maxsize // workers)
+        lane_weights = tuple(weights) if scheduling == SCHEDULING_WEIGHTED else None
+        self._lanes: list[_PriorityLane] = [
+            _PriorityLane(lane_size, lane_weights) for _ in range(workers)
+        ]
+        # block 策略下同一 lane 的 put 依次进行：腾出的空位先给最早等待的推送，新来的不能插队
+        self._put_locks = [asyncio.Lock() for _ in range(workers)]
+        self._tasks: list[asyncio.Task[None]] = []
+        self.dropped = 0
+        self.shed = 0
+
+    def qsize(self) -> int:
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(lane), name=f"{self.name}-worker-{idx}")
+            for idx, lane in enumerate(self._lanes)
+        ]
+
+    async def put(self, job: DeliveryJob) -> bool:
+        """Queue ``job``; returns False if the overflow policy dropped a job."""
+        index = hash(job.chat_id) % len(self._lanes)
+        lane = self._lanes[index]
+        item = (time.monotonic(), job)
+
+        if lane.full():
+            # 队列满时先挤掉优先级更低的推送，高优先级推送不因低优先级积压而等待或被丢弃
+            victim = lane.evict_lowest(job.priority + 1)
+            if victim is not None:
+                self.dropped += 1
+                self._drop(victim)
+                lane.put_nowait(item)
+                return False
+
+        if self._overflow == OVERFLOW_BLOCK:
+            async with self._put_locks[index]:
+                await lane.put(item)
+            return True
+
+        if not lane.full():
+            lane.put_nowait(item)
+            return True
+
+        self.dropped += 1
+        # drop_oldest 只挤掉同级的推送；队列里全是更高优先级时丢弃新来的
+        oldest = lane.evict_lowest(job.priority) if self._overflow == OVERFLOW_DROP_OLDEST else None
+        if oldest is None:
+            self._drop(job)
+            return False
+
+        self._drop(oldest)
+        lane.put_nowait(item)
+        return False
+
+    def _drop(self, job: DeliveryJob) -> None:
+        self._log_drop(job)
+        if self._on_drop is not None:
+            self._on_drop(job)
+
+    def _log_drop(self, job: DeliveryJob) -> None:
+        log.warning(
+            "queue drop",
+            extra={
+                "event": "queue_drop",
+                "queue": self.name,
+                "policy": self._overflow,
+                "chat_id": job.chat_id,
+                "title": job.title,
+                "priority": PRIORITIES[job.priority],
+            },
+        )
+
+    async def join(self) -> None:
+        for lane in self._lanes:
+            await lane.join()
+
+    async def close(self, drain: bool = True) -> None:
+        if drain and self._tasks:
+            await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, lane: _PriorityLane) -> None:
+        while True:
+            enqueued_at, job = await lane.get()
+            try:
+                cutoff = time.monotonic() - self._shed_age
+                if self._shed_age and job.priority == PRIORITY_LOW and enqueued_at < cutoff:
+                    # 一次带走同一 lane 里所有超龄的低优先级推送
+                    await self._shed_jobs([job, *lane.take_stale(PRIORITY_LOW, cutoff)])
+                else:
+                    await self._deliver(job)
+            finally:
+                lane.task_done()
+
+    async def _shed_jobs(self, jobs: list[DeliveryJob]) -> None:
+        self.shed += len(jobs)
+        for job in jobs:
+            log.warning(
+                "queue shed",
+                extra={
+                    "event": "queue_shed",
+                    "queue": self.name,
+                    "mode": self._shed_mode,
+                    "chat_id": job.chat_id,
+                    "title": job.title,
+                },
+            )
+            if self._on_shed is not None:
+                self._on_shed(job)
+        if self._shed_mode == SHED_SUMMARIZE:
+            # 摘要以 HTML 发给 PushPlus：标题按正文的方式转义
+            titles = [
+                html.escape(job.title, quote=False).replace("\n", "<br>")
+                for job in jobs[:SHED_SUMMARY_MAX_TITLES]
+            ]
+            if len(jobs) > len(titles):
+                titles.append(f"…… 另有 {len(jobs) - len(titles)} 条")
+            await self._deliver(
+                DeliveryJob(
+                    chat_id=jobs[0].chat_id,
+                    title=f"积压跳过 {len(jobs)} 条低优先级推送",
+                    content="<br>".join(titles),
+                    sink=jobs[0].sink,
+                    priority=PRIORITY_LOW,
+                )
+            )
+
+    async def _deliver(self, job: DeliveryJob) -> None:
+        started = time.monotonic()
+        try:
+            await self._send(job)
+        except Exception as exc:
+            log.error(
+                "push error: %s",
+                exc,
+                exc_info=True,
+                extra={
+                    "event": "push_error",
+                    "queue": self.name,
+                    "chat_id": job.chat_id,
+                    "title": job.title,
+                    "latency_ms": round((time.monotonic() - started) * 1000, 1),
+                },
+            )
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+from .log import get_logger
+
+
+ENTITY_CACHE_FILENAME = "entities.json"
+
+log = get_logger(__name__)
+
+
+def entity_cache_filename(session: str, default_session: str) -> str:
+    # access hash 按账号区分：额外会话各用一个缓存文件，内置会话沿用原文件名
+    if session == default_session:
+        return ENTITY_CACHE_FILENAME
+    return f"entities-{session}.json"
+
+
+@dataclass
+class CachedEntity:
+    kind: str
+    peer_id: int
+    raw_id: int
+    access_hash: int | None
+    title: str
+    resolved_at: float
+
+    def input_peer(self) -> Any:
+        if self.kind == "channel":
+            return InputPeerChannel(self.raw_id, self.access_hash or 0)
+        if self.kind == "user":
+            return InputPeerUser(self.raw_id, self.access_hash or 0)
+        return InputPeerChat(self.raw_id)
+
+
+def describe_entity(chat: str, entity: Any) -> CachedEntity:
+    peer = utils.get_input_peer(entity)
+    if isinstance(peer, InputPeerChannel):
+        kind, raw_id, access_hash = "channel", peer.channel_id, peer.access_hash
+    elif isinstance(peer, InputPeerUser):
+        kind, raw_id, access_hash = "user", peer.user_id, peer.access_hash
+    elif isinstance(peer, InputPeerChat):
+        kind, raw_id, access_hash = "chat", peer.chat_id, None
+    else:
+        raise ValueError(f"Unsupported entity for {chat}: {type(entity).__name__}")
+
+    return CachedEntity(
+        kind=kind,
+        peer_id=utils.get_peer_id(peer),
+        raw_id=raw_id,
+        access_hash=access_hash,
+        title=getattr(entity, "title", chat),
+        resolved_at=time.time(),
+    )
+
+
+class EntityCache:
+    """Resolved chat entities keyed by the chat string from the filter config.
+
+    Lets startup build input peers without a ``get_entity`` round-trip per
+    chat (invite links in particular always hit the network).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._entries: dict[str, CachedEntity] = {}
+        if path.exists():
+            try:
+                raw = json.loads(path.read_text(encoding="utf-8"))
+                self._entries = {chat: CachedEntity(**entry) for chat, entry in raw.items()}
+            except (OSError, ValueError, TypeError) as exc:
+                log.warning("ignoring unreadable entity cache: %s", exc, extra={"path": str(path)})
+
+    def get(self, chat: str) -> CachedEntity | None:
+        return self._entries.get(chat)
+
+    def put(self, chat: str, entity: Any) -> CachedEntity | None:
+        try:
+            cached = describe_entity(chat, entity)
+        except (TypeError, ValueError) as exc:
+            log.warning("not caching entity: %s", exc, extra={"chat": chat})
+            return None
+        self._entries[chat] = cached
+        return cached
+
+    def invalidate(self, chat: str) -> None:
+        if self._entries.pop(chat, None) is not None:
+            log.info("entity cache invalidated", extra={"event": "entity_invalidated", "chat": chat})
+
+    def is_stale(self, chat: str, max_age_seconds: float) -> bool:
+        cached = self._entries.get(chat)
+        return cached is None or time.time() - cached.resolved_at > max_age_seconds
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        data = {chat: asdict(entry) for chat, entry in self._entries.items()}
+        tmp_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
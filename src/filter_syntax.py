@@ -0,0 +1,545 @@
+"""Regex lists and boolean expressions for chat filter rules.
+
+Both are checked when the filter file is loaded. Patterns whose quantifiers
+can split the same text in many ways, and so backtrack exponentially or
+polynomially, are rejected. Only the first ``MAX_MATCH_CHARS`` characters of
+a message are evaluated.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any, Callable
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse  # type: ignore[no-redef]
+
+from .format import ParsedEvent, iter_events
+
+
+MAX_PATTERN_LENGTH = 500
+MAX_PATTERNS = 200
+MAX_EXPRESSION_LENGTH = 2000
+MAX_EXPRESSION_NODES = 100
+# 正则和表达式只看消息的前这么多字符；
+# Telegram 单条消息最多 4096 字符，正常消息不会被截断
+MAX_MATCH_CHARS = 4096
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+_BACKREFS = (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS)
+
+
+def _subpatterns(av: Any) -> list[Any]:
+    if isinstance(av, sre_parse.SubPattern):
+        return [av]
+    if isinstance(av, (list, tuple)):
+        return [sub for item in av for sub in _subpatterns(item)]
+    return []
+
+
+# 一个正则位置可能匹配的首字符集合：具体字符、\d \s \w 这类类别，或任意字符
+@dataclass(frozen=True)
+class _First:
+    chars: frozenset[str] = frozenset()
+    categories: frozenset[Any] = frozenset()
+    any: bool = False
+
+    def __or__(self, other: _First) -> _First:
+        return _First(self.chars | other.chars, self.categories | other.categories, self.any or other.any)
+
+    def __bool__(self) -> bool:
+        return self.any or bool(self.chars) or bool(self.categories)
+
+
+_ANY = _First(any=True)
+_EMPTY = _First()
+# 字符区间超过这个宽度就按任意字符处理
+_MAX_RANGE_CHARS = 256
+
+_CATEGORY_TESTS: dict[Any, Callable[[str], bool]] = {
+    sre_parse.CATEGORY_DIGIT: str.isdigit,
+    sre_parse.CATEGORY_NOT_DIGIT: lambda ch: not ch.isdigit(),
+    sre_parse.CATEGORY_SPACE: str.isspace,
+    sre_parse.CATEGORY_NOT_SPACE: lambda ch: not ch.isspace(),
+    sre_parse.CATEGORY_WORD: lambda ch: ch.isalnum() or ch == "_",
+    sre_parse.CATEGORY_NOT_WORD: lambda ch: not (ch.isalnum() or ch == "_"),
+}
+_DISJOINT_CATEGORIES = {
+    frozenset(pair)
+    for pair in (
+        (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_NOT_DIGIT),
+        (sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_NOT_SPACE),
+        (sre_parse.CATEGORY_WORD, sre_parse.CATEGORY_NOT_WORD),
+        (sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_DIGIT),
+        (sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_WORD),
+        (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_NOT_WORD),
+    )
+}
+
+
+def _overlaps(a: _First, b: _First) -> bool:
+    if not a or not b:
+        return False
+    if a.any or b.any or a.chars & b.chars:
+        return True
+    for cats, chars in ((a.categories, b.chars), (b.categories, a.chars)):
+        if any(_CATEGORY_TESTS.get(cat, lambda ch: True)(ch) for cat in cats for ch in chars):
+            return True
+    return any(
+        frozenset((x, y)) not in _DISJOINT_CATEGORIES or x == y
+        for x in a.categories
+        for y in b.categories
+    )
+
+
+def _literal(code: int) -> _First:
+    ch = chr(code)
+    # 不区分大小写的规则也会走这里，两种大小写都算上
+    return _First(chars=frozenset({ch, ch.lower(), ch.upper()}))
+
+
+def _first_of_set(items: Any) -> _First:
+    first = _EMPTY
+    for op, av in items:
+        if op == sre_parse.NEGATE:
+            return _ANY
+        if op == sre_parse.LITERAL:
+            first |= _literal(av)
+        elif op == sre_parse.RANGE:
+            low, high = av
+            if high - low > _MAX_RANGE_CHARS:
+                return _ANY
+            for code in range(low, high + 1):
+                first |= _literal(code)
+        elif op == sre_parse.CATEGORY:
+            first |= _First(categories=frozenset({av}))
+        else:
+            return _ANY
+    return first
+
+
+def _first(items: Any) -> tuple[_First, bool]:
+    """First characters a sequence can match, and whether it can match the empty string."""
+    first = _EMPTY
+    for op, av in items:
+        if op == sre_parse.LITERAL:
+            return first | _literal(av), False
+        if op == sre_parse.IN:
+            return first | _first_of_set(av), False
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # 断言不消耗字符
+            continue
+        if op == sre_parse.SUBPATTERN:
+            sub_first, nullable = _first(av[-1])
+        elif op == sre_parse.BRANCH:
+            sub_first, nullable = _EMPTY, False
+            for branch in av[1]:
+                branch_first, branch_nullable = _first(branch)
+                sub_first |= branch_first
+                nullable = nullable or branch_nullable
+        elif op in _REPEATS:
+            min_repeat, _, sub = av
+            sub_first, nullable = _first(sub)
+            nullable = nullable or min_repeat == 0
+        else:
+            # ANY、NOT_LITERAL 以及未识别的节点都按任意字符处理
+            return _ANY, False
+        first |= sub_first
+        if not nullable:
+            return first, False
+    return first, True
+
+
+_PASS, _STOP, _CLASH = range(3)
+
+
+def _scan_after(items: Any, body: _First) -> int:
+    """How ``items``, following a variable repeat of ``body``, relate to it.
+
+    ``_CLASH`` if another variable repeat overlapping ``body`` can be reached
+    through characters ``body`` can also match, ``_STOP`` if a character
+    ``body`` cannot match must come first, otherwise ``_PASS``.
+    """
+    for op, av in items:
+        if op == sre_parse.SUBPATTERN:
+            result = _scan_after(av[-1], body)
+        elif op == sre_parse.BRANCH:
+            results = [_scan_after(branch, body) for branch in av[1]]
+            result = _CLASH if _CLASH in results else _STOP if all(r == _STOP for r in results) else _PASS
+        elif op in _REPEATS:
+            min_repeat, max_repeat, sub = av
+            sub_first, _ = _first(sub)
+            if max_repeat > min_repeat and max_repeat > 1 and _overlaps(sub_first, body):
+                return _CLASH
+            result = _scan_after(sub, body)
+            if result == _STOP and min_repeat == 0:
+                result = _PASS
+        else:
+            first, nullable = _first([(op, av)])
+            result = _PASS if nullable or _overlaps(first, body) else _STOP
+        if result != _PASS:
+            return result
+    return _PASS
+
+
+def _check_tree(
+    items: Any, inside_repeat: bool, follow: _First = _EMPTY, tail: tuple[list[Any], ...] = ()
+) -> None:
+    """Reject constructs that make a repeated group ambiguous.
+
+    ``follow`` is what may come after ``items`` within the enclosing repeat,
+    i.e. the start of its next iteration. ``tail`` holds the rest of each
+    enclosing sequence, innermost first.
+    """
+    items = list(items)
+    for pos, (op, av) in enumerate(items):
+        rest_first, rest_nullable = _first(items[pos + 1:])
+        after = rest_first | follow if rest_nullable else rest_first
+        rest_tail = (items[pos + 1:], *tail)
+        if op in _BACKREFS:
+            raise ValueError("backreferences are not supported")
+        if op in _REPEATS:
+            min_repeat, max_repeat, sub = av
+            repeats = max_repeat > 1
+            if repeats and max_repeat > min_repeat:
+                # \d*\d*!、a.*b.*c 这类：后一个量词能接着匹配前一个量词的字符，
+                # 文本在它们之间有多种切法，不匹配时按多项式回溯
+                body_first, _ = _first(sub)
+                for rest in rest_tail:
+                    result = _scan_after(rest, body_first)
+                    if result == _CLASH:
+                        raise ValueError(
+                            "quantifiers that can match the same characters must be separated "
+                            "by a character the first one cannot match"
+                        )
+                    if result == _STOP:
+                        break
+            if repeats and inside_repeat:
+                # (a+)+、(\w+\s?)* 这类嵌套量词在不匹配时会指数级回溯
+                raise ValueError("nested quantifiers can backtrack exponentially")
+            if inside_repeat and min_repeat == 0:
+                # 重复体里的可选项：跳过和匹配两条路不能以同一个字符开头，否则 (a?a)* 同样指数级回溯
+                sub_first, sub_nullable = _first(sub)
+                if sub_nullable or _overlaps(sub_first, after):
+                    raise ValueError("optional part of a repeated group is ambiguous")
+            if repeats:
+                body_first, _ = _first(sub)
+                _check_tree(sub, True, body_first)
+            else:
+                _check_tree(sub, inside_repeat, after, rest_tail)
+            continue
+        if op == sre_parse.BRANCH and inside_repeat:
+            # 重复体里的分支必须互斥：(a|a)*、(.|\s)* 这类重叠分支在不匹配时会指数级回溯
+            firsts = []
+            for branch in av[1]:
+                branch_first, nullable = _first(branch)
+                if nullable or any(_overlaps(branch_first, other) for other in firsts):
+                    raise ValueError("alternatives inside a repeat must start with different characters")
+                firsts.append(branch_first)
+            for branch in av[1]:
+                _check_tree(branch, True, after, rest_tail)
+            continue
+        if op == sre_parse.BRANCH:
+            for branch in av[1]:
+                _check_tree(branch, inside_repeat, after, rest_tail)
+            continue
+        if op == sre_parse.SUBPATTERN:
+            _check_tree(av[-1], inside_repeat, after, rest_tail)
+            continue
+        for sub in _subpatterns(av):
+            _check_tree(sub, inside_repeat, after)
+
+
+def check_pattern(pattern: str, combined: bool = True) -> None:
+    """Raise ValueError if ``pattern`` is invalid or may backtrack catastrophically.
+
+    ``combined`` patterns must also work inside the per-chat alternation regex.
+    """
+    if not pattern:
+        raise ValueError("pattern is empty")
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError(f"pattern is longer than {MAX_PATTERN_LENGTH} characters")
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as exc:
+        raise ValueError(f"invalid regex: {exc}") from exc
+    if parsed.state.groupdict:
+        raise ValueError("named groups are not supported")
+    _check_tree(parsed, inside_repeat=False)
+    if not combined:
+        return
+    try:
+        # 合并成一个大正则时每个模式都包在命名分组里，这里提前暴露不兼容的写法（如全局内联标志）
+        re.compile(f"(?P<_r0>{pattern})")
+    except re.error as exc:
+        raise ValueError(f"cannot be combined with other patterns: {exc}") from exc
+
+
+class RegexMatcher:
+    """Keywords and regex patterns compiled into one alternation, searched in one pass."""
+
+    __slots__ = ("sources", "case_sensitive", "_regex")
+
+    def __init__(self, keywords: list[str], patterns: list[str], case_sensitive: bool = False) -> None:
+        sources: list[str] = []
+        branches: list[str] = []
+        for kw in keywords:
+            token = kw.strip()
+            if not token:
+                continue
+            if not case_sensitive:
+                token = token.lower()
+            if token not in sources:
+                sources.append(token)
+                branches.append(re.escape(token))
+        for pattern in patterns:
+            check_pattern(pattern)
+            if pattern not in sources:
+                sources.append(pattern)
+                branches.append(pattern)
+
+        self.sources: tuple[str, ...] = tuple(sources)
+        self.case_sensitive = case_sensitive
+        alternation = "|".join(f"(?P<_r{idx}>{branch})" for idx, branch in enumerate(branches))
+        self._regex = re.compile(alternation, 0 if case_sensitive else re.I) if branches else None
+
+    def __bool__(self) -> bool:
+        return self._regex is not None
+
+    def search(self, text: str) -> str | None:
+        """Return the keyword or pattern that matched ``text``, or ``None``."""
+        if self._regex is None:
+            return None
+        m = self._regex.search(text, 0, MAX_MATCH_CHARS)
+        if m is None:
+            return None
+        # 每个分支外层是命名分组，最后闭合的就是命中的那个分支
+        return self.sources[int(m.lastgroup[2:])]
+
+
+# ---------------------------------------------------------------- expressions
+
+# 可在表达式里引用的字段；除 text 外都来自 6551 消息的解析结果
+EXPRESSION_FIELDS = (
+    "text", "event", "username", "remark", "group",
+    "tweet", "parent", "reply", "quote", "content", "users",
+)
+_CONTENT_KEYS = ("tweet", "parent", "reply", "quote")
+_OPERATORS = ("==", "!=", "~", "contains")
+
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>==|!=|~|\(|\))
+      | (?P<word>[A-Za-z_]+)
+      | (?P<bad>\S)
+    )""",
+    re.X,
+)
+_ESCAPE_RE = re.compile(r"\\(.)")
+_WORD_OPERATORS = ("and", "or", "not", "contains")
+
+
+def _tokenize(source: str) -> list[tuple[str, str]]:
+    tokens: list[tuple[str, str]] = []
+    for m in _TOKEN_RE.finditer(source):
+        kind = m.lastgroup
+        if kind is None:
+            continue
+        value = m.group(kind)
+        if kind == "bad":
+            raise ValueError(f"unexpected character {value!r}")
+        if kind == "string":
+            value = _ESCAPE_RE.sub(r"\1", value[1:-1])
+        elif kind == "word" and value.lower() in _WORD_OPERATORS:
+            value = value.lower()
+            kind = "op" if value == "contains" else "keyword"
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Event:
+    """Field values of one parsed 6551 event, computed on first access."""
+
+    __slots__ = ("_parsed", "_fields")
+
+    def __init__(self, parsed: ParsedEvent | None) -> None:
+        self._parsed = parsed
+        self._fields: dict[str, str] = {}
+
+    def get(self, name: str) -> str:
+        value = self._fields.get(name)
+        if value is None:
+            value = self._fields[name] = self._compute(name)
+        return value
+
+    def _compute(self, name: str) -> str:
+        parsed = self._parsed
+        if parsed is None:
+            return ""
+        if name == "users":
+            return "\n".join(parsed.followed_users or ())
+        if name == "content":
+            return "\n".join(
+                value for value in (getattr(parsed, key) for key in _CONTENT_KEYS) if value is not None
+            )
+        return getattr(parsed, name) or ""
+
+
+_NO_EVENT = _Event(None)
+
+Predicate = Callable[[str, _Event], bool]
+
+
+@dataclass(frozen=True)
+class Expression:
+    """A compiled boolean filter expression; ``matches`` is true when it holds."""
+
+    source: str
+    case_sensitive: bool
+    uses_events: bool
+    _root: Predicate
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # 谓词是闭包无法 pickle；发往投递进程时按源码重新编译
+        return parse_expression, (self.source, self.case_sensitive)
+
+    def matches(self, text: str) -> bool:
+        text = text[:MAX_MATCH_CHARS]
+        if not self.case_sensitive:
+            text = text.lower()
+        if not self.uses_events:
+            return self._root(text, _NO_EVENT)
+        # 一条消息可能含多个事件：逐个解析，任一事件满足表达式即停止；非 6551 消息按空字段计算
+        parsed_any = False
+        for parsed in iter_events(text):
+            parsed_any = True
+            if self._root(text, _Event(parsed)):
+                return True
+        return not parsed_any and self._root(text, _NO_EVENT)
+
+
+class _Parser:
+    def __init__(self, source: str, case_sensitive: bool) -> None:
+        self.tokens = _tokenize(source)
+        self.pos = 0
+        self.nodes = 0
+        self.case_sensitive = case_sensitive
+        self.uses_events = False
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise ValueError("unexpected end of expression")
+        self.pos += 1
+        return token
+
+    def _count(self) -> None:
+        self.nodes += 1
+        if self.nodes > MAX_EXPRESSION_NODES:
+            raise ValueError(f"expression has more than {MAX_EXPRESSION_NODES} terms")
+
+    def parse(self) -> Predicate:
+        root = self.parse_or()
+        token = self.peek()
+        if token is not None:
+            raise ValueError(f"unexpected {token[1]!r}")
+        return root
+
+    def parse_or(self) -> Predicate:
+        terms = [self.parse_and()]
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            self._count()
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda text, event: any(term(text, event) for term in terms)
+
+    def parse_and(self) -> Predicate:
+        terms = [self.parse_not()]
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            self._count()
+            terms.append(self.parse_not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda text, event: all(term(text, event) for term in terms)
+
+    def parse_not(self) -> Predicate:
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            self._count()
+            inner = self.parse_not()
+            return lambda text, event: not inner(text, event)
+        return self.parse_atom()
+
+    def parse_atom(self) -> Predicate:
+        kind, value = self.take()
+        if (kind, value) == ("op", "("):
+            inner = self.parse_or()
+            if self.take() != ("op", ")"):
+                raise ValueError("missing ')'")
+            return inner
+        self._count()
+        if kind == "string":
+            # 单独的字符串等价于 text contains "..."
+            return self._predicate("text", "contains", value)
+        if kind != "word":
+            raise ValueError(f"unexpected {value!r}")
+        if value not in EXPRESSION_FIELDS:
+            raise ValueError(f"unknown field {value!r}; expected one of {', '.join(EXPRESSION_FIELDS)}")
+        op_kind, op = self.take()
+        if op_kind != "op" or op not in _OPERATORS:
+            raise ValueError(f"expected one of {', '.join(_OPERATORS)} after {value!r}")
+        arg_kind, arg = self.take()
+        if arg_kind != "string":
+            raise ValueError(f"expected a quoted string after {op!r}")
+        return self._predicate(value, op, arg)
+
+    def _predicate(self, field_name: str, op: str, arg: str) -> Predicate:
+        if field_name != "text":
+            self.uses_events = True
+        if op == "~":
+            check_pattern(arg, combined=False)
+            regex = re.compile(arg, 0 if self.case_sensitive else re.I)
+            if field_name == "text":
+                return lambda text, event: regex.search(text) is not None
+            return lambda text, event: regex.search(event.get(field_name)) is not None
+
+        # 不区分大小写时消息文本在求值前已整体转成小写，这里只需转换字面量
+        needle = arg if self.case_sensitive else arg.lower()
+        if field_name == "text":
+            if op == "contains":
+                return lambda text, event: needle in text
+            if op == "==":
+                return lambda text, event: text == needle
+            return lambda text, event: text != needle
+        if op == "contains":
+            return lambda text, event: needle in event.get(field_name)
+        if op == "==":
+            return lambda text, event: event.get(field_name) == needle
+        return lambda text, event: event.get(field_name) != needle
+
+
+def parse_expression(source: str, case_sensitive: bool = False) -> Expression:
+    """Compile a filter expression; raises ValueError describing the first problem.
+
+    Grammar: ``or`` / ``and`` / ``not`` / parentheses over predicates of the
+    form ``<field> == "..."``, ``!=``, ``contains`` or ``~`` (regex search),
+    where a bare string means ``text contains "..."``.
+    """
+    if not source.strip():
+        raise ValueError("expression is empty")
+    if len(source) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    parser = _Parser(source, case_sensitive)
+    root = parser.parse()
+    return Expression(
+        source=source, case_sensitive=case_sensitive, uses_events=parser.uses_events, _root=root
+    )
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+
+from .config import ChatFilter
+from .delivery import PRIORITY_NORMAL, priority_level
+from .filter_syntax import Expression, RegexMatcher, parse_expression
+from .format import ParsedEvent, is_6551_message, iter_events
+
+
+# 关键词数量少于该阈值时，直接逐个 `in` 扫描（C 实现，常数更小）；
+# 超过后切换到 Aho-Corasick 自动机，单次扫描文本，耗时与关键词数量无关。
+AHO_CORASICK_MIN_KEYWORDS = 128
+
+
+class KeywordMatcher:
+    """Multi-keyword substring matcher compiled once from a keyword list."""
+
+    __slots__ = ("keywords", "case_sensitive", "_goto", "_fail", "_out")
+
+    def __init__(self, keywords: list[str], case_sensitive: bool = False) -> None:
+        normalized: list[str] = []
+        seen: set[str] = set()
+        for kw in keywords:
+            token = kw.strip()
+            if not token:
+                continue
+            if not case_sensitive:
+                token = token.lower()
+            if token not in seen:
+                seen.add(token)
+                normalized.append(token)
+
+        self.keywords: tuple[str, ...] = tuple(normalized)
+        self.case_sensitive = case_sensitive
+        self._goto: list[dict[str, int]] = []
+        self._fail: list[int] = []
+        self._out: list[str | None] = []
+        if len(self.keywords) >= AHO_CORASICK_MIN_KEYWORDS:
+            self._build_automaton()
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+
+    def _build_automaton(self) -> None:
+        goto: list[dict[str, int]] = [{}]
+        out: list[str | None] = [None]
+        for kw in self.keywords:
+            node = 0
+            for ch in kw:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(None)
+                node = nxt
+            if out[node] is None:
+                out[node] = kw
+
+        # BFS 计算失败指针；节点输出继承失败指针上的命中，查找时无需回溯输出链
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[nxt] is None:
+                    out[nxt] = out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def search(self, text: str) -> str | None:
+        """Return a keyword contained in ``text``, or ``None``."""
+        if not self.keywords:
+            return None
+        if not self.case_sensitive:
+            text = text.lower()
+
+        if not self._goto:
+            return next((kw for kw in self.keywords if kw in text), None)
+
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        root = goto[0]
+        node = 0
+        for ch in text:
+            if node:
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+            else:
+                node = root.get(ch, 0)
+            if node and out[node] is not None:
+                return out[node]
+        return None
+
+
+def _name_set(names: list[str] | None) -> frozenset[str] | None:
+    return frozenset(name.casefold() for name in names) if names else None
+
+
+@dataclass(frozen=True)
+class FieldIndex:
+    """Hash-set lookups on the event, username and group of a parsed 6551 event.
+
+    ``None`` means the list is not configured. Usernames and groups are
+    compared case-insensitively.
+    """
+
+    events: frozenset[str] | None = None
+    usernames: frozenset[str] | None = None
+    groups: frozenset[str] | None = None
+    drop_events: frozenset[str] = frozenset()
+    drop_usernames: frozenset[str] = frozenset()
+    drop_groups: frozenset[str] = frozenset()
+
+    @classmethod
+    def from_rules(cls, rules: dict[str, list[str]]) -> FieldIndex | None:
+        if not rules:
+            return None
+        return cls(
+            events=frozenset(rules["events"]) if rules.get("events") else None,
+            usernames=_name_set(rules.get("usernames")),
+            groups=_name_set(rules.get("groups")),
+            drop_events=frozenset(rules.get("drop_events", ())),
+            drop_usernames=_name_set(rules.get("drop_usernames")) or frozenset(),
+            drop_groups=_name_set(rules.get("drop_groups")) or frozenset(),
+        )
+
+    def reject(self, event: ParsedEvent) -> str | None:
+        """Why ``event`` is dropped (e.g. ``"event=删除推文"``), or ``None`` if it passes."""
+        username = event.username.casefold()
+        group = event.group.casefold()
+        if event.event in self.drop_events:
+            return f"event={event.event}"
+        if username in self.drop_usernames:
+            return f"username={event.username}"
+        if group in self.drop_groups:
+            return f"group={event.group}"
+        if self.events is not None and event.event not in self.events:
+            return f"event={event.event}"
+        if self.usernames is None and self.groups is None:
+            return None
+        # 用户名或分组任一在白名单内即放行
+        if self.usernames is not None and username in self.usernames:
+            return None
+        if self.groups is not None and group in self.groups:
+            return None
+        return f"username={event.username}"
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    mode: str
+    matcher: KeywordMatcher | RegexMatcher
+    urgent: bool = False
+    dedup: bool = True
+    judge: bool = True
+    priority: int = PRIORITY_NORMAL
+    # None 表示使用默认路由（Config.default_sinks）
+    sinks: tuple[str, ...] | None = None
+    expression: Expression | None = None
+    fields: FieldIndex | None = None
+
+    def should_push(self, text: str) -> tuple[bool, str | None]:
+        # 字段名单只看第一个事件（即推送标题所用的事件），非 6551 消息不受影响
+        if self.fields is not None and is_6551_message(text):
+            event = next(iter_events(text), None)
+            if event is not None:
+                reason = self.fields.reject(event)
+                if reason is not None:
+                    return False, reason
+
+        if not self.matcher and self.expression is None:
+            return True, None
+
+        hit = self.matcher.search(text)
+        if hit is None and self.expression is not None and self.expression.matches(text):
+            hit = self.expression.source
+        if self.mode == "allow":
+            return hit is not None, hit
+        return hit is None, hit
+
+
+# 未配置规则的会话：放行所有消息
+PASS_ALL_RULE = CompiledRule(mode="allow", matcher=KeywordMatcher([]))
+
+
+def compile_rule(rule: ChatFilter) -> CompiledRule:
+    # 有正则时关键词一并并入同一个交替正则，一次扫描完成；否则沿用关键词匹配器
+    if rule.patterns:
+        matcher: KeywordMatcher | RegexMatcher = RegexMatcher(
+            rule.keywords, rule.patterns, rule.case_sensitive
+        )
+    else:
+        matcher = KeywordMatcher(rule.keywords, rule.case_sensitive)
+    return CompiledRule(
+        mode=rule.mode,
+        matcher=matcher,
+        urgent=rule.urgent,
+        dedup=rule.dedup,
+        judge=rule.judge,
+        priority=priority_level(rule.priority),
+        sinks=tuple(rule.sinks) if rule.sinks is not None else None,
+        expression=parse_expression(rule.expr, rule.case_sensitive) if rule.expr else None,
+        fields=FieldIndex.from_rules(rule.field_rules),
+    )
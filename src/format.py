@@ -3,7 +3,8 @@
 import re
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Pattern
 
 
 @dataclass
@@ -13,6 +14,8 @@ class Message:
     message: str
     media_url: Optional[str] = None
     media_description: Optional[str] = None
+    # Telegram 消息时间（Unix 秒），用于统计端到端延迟
+    date: Optional[float] = None
 
 
 def format_time(dt: Optional[datetime]) -> str:
@@ -34,8 +37,37 @@ def extract_media_description(msg: Any) -> Optional[str]:
     return getattr(webpage, "description", None) if webpage else None
 
 
+EVENT_MARKER = "🌟监控到"
+
+
+class MessageType(str, Enum):
+    NEW_TWEET = "新推文"
+    NEW_TWEET_REPLY = "新推文回复"
+    NEW_FOLLOW = "新关注动态"
+    DELETE_TWEET_REPLY = "删除推文回复"
+    DELETE_TWEET = "删除推文"
+    NEW_TWEET_QUOTE = "新推文引用"
+    UNKNOWN = ""
+
+
 def is_6551_message(raw: str) -> bool:
-    return "🌟监控到" in raw
+    return EVENT_MARKER in raw
+
+
+def _read_header(text: str, start: int = 0) -> str:
+    # 读取 “🌟监控到<event>” 行中的 event，不做任何正则匹配
+    end = text.find("\n", start)
+    return text[start + len(EVENT_MARKER):end if end >= 0 else len(text)]
+
+
+def detect_message_type(text: str) -> MessageType:
+    start = text.find(EVENT_MARKER)
+    if start < 0:
+        return MessageType.UNKNOWN
+    try:
+        return MessageType(_read_header(text, start))
+    except ValueError:
+        return MessageType.UNKNOWN
 
 
 def build_message(msg: Any) -> Message:
@@ -47,6 +79,7 @@ def build_message(msg: Any) -> Message:
         message=raw,
         media_url=extract_media_url(msg),
         media_description=extract_media_description(msg),
+        date=msg.date.timestamp() if isinstance(msg.date, datetime) else None,
     )
 
 # 公共头部（前三行）
@@ -88,21 +121,12 @@ PAT_NEW_FOLLOW = re.compile(
     re.X,
 )
 
-# 删除推文回复
-PAT_DELETE_TWEET_REPLY = re.compile(
-    r"""^🌟监控到删除推文\n
-你关注的用户:\s*(?P<username>.+?)\(备注:\s*(?P<remark>.+?)\)\s*(?:\([^)]+\))?\n
-用户所属分组:\s*(?P<group>[^\n]+)\n
-上文内容:\s*(?P<parent>[\s\S]*?)\n回帖内容:\s*(?P<reply>[\s\S]*)$
-""",
-    re.X,
-)
-
-# 删除推文
+# 删除推文 / 删除推文回复（两者头部相同，用可选的上文/回帖段区分，一次匹配完成）
 PAT_DELETE_TWEET = re.compile(
     r"""^🌟监控到删除推文\n
 你关注的用户:\s*(?P<username>.+?)\(备注:\s*(?P<remark>.+?)\)\s*(?:\([^)]+\))?\n
-用户所属分组:\s*(?P<group>[^\n]+)\s*$
+用户所属分组:\s*(?P<group>[^\n]+)
+(?:\n上文内容:\s*(?P<parent>[\s\S]*?)\n回帖内容:\s*(?P<reply>[\s\S]*))?\s*$
 """,
     re.X,
 )
@@ -118,23 +142,41 @@ PAT_NEW_QUOTE = re.compile(
 )
 
 
-TYPE_PATTERNS = [
-    ("新推文", PAT_NEW_TWEET),
-    ("新推文回复", PAT_NEW_REPLY),
-    ("新关注动态", PAT_NEW_FOLLOW),
-    ("删除推文回复", PAT_DELETE_TWEET_REPLY),
-    ("删除推文", PAT_DELETE_TWEET),
-    ("新推文引用", PAT_NEW_QUOTE),
-]
+# 按头部 event 直接分派到对应的正则，每个块只匹配一次
+PATTERN_BY_HEADER: Dict[str, Pattern[str]] = {
+    MessageType.NEW_TWEET.value: PAT_NEW_TWEET,
+    MessageType.NEW_TWEET_REPLY.value: PAT_NEW_REPLY,
+    MessageType.NEW_FOLLOW.value: PAT_NEW_FOLLOW,
+    MessageType.DELETE_TWEET.value: PAT_DELETE_TWEET,
+    MessageType.NEW_TWEET_QUOTE.value: PAT_NEW_QUOTE,
+}
+
+
+_BLOCK_START = "\n" + EVENT_MARKER
+
+
+def _iter_blocks(text: str) -> Iterator[str]:
+    # 按“行首的 🌟监控到”切块（不是按空行），逐块产出，调用方只要第一块时不必扫描全文
+    text = text.strip()
+    if text.startswith(EVENT_MARKER):
+        start = 0
+    else:
+        start = text.find(_BLOCK_START)
+        if start < 0:
+            return
+        start += 1
+    while True:
+        end = text.find(_BLOCK_START, start)
+        block = (text[start:] if end < 0 else text[start:end]).strip()
+        if block:
+            yield block
+        if end < 0:
+            return
+        start = end + 1
 
 
 def _split_blocks(text: str) -> List[str]:
-    # 正确切块：按“下一条消息开头”切，而不是按空行
-    return [
-        b.strip()
-        for b in re.findall(r"(?ms)^🌟监控到[\s\S]*?(?=^🌟监控到|\Z)", text.strip())
-        if b.strip()
-    ]
+    return list(_iter_blocks(text))
 
 
 def _parse_users_block(users_block: str) -> List[str]:
@@ -142,71 +184,94 @@ def _parse_users_block(users_block: str) -> List[str]:
     return re.findall(r"^\s*•\s*([^\n]+)\s*$", users_block, flags=re.M)
 
 
-def parse_message(text: str) -> List[Dict[str, Any]]:
-    results: List[Dict[str, Any]] = []
-
-    for block in _split_blocks(text):
-        parsed: Optional[Dict[str, Any]] = None
-
-        for event_name, pat in TYPE_PATTERNS:
-            m = pat.match(block)
-            if not m:
-                continue
-
-            gd = m.groupdict()
-            item: Dict[str, Any] = {
-                "event": event_name,
-                "username": gd["username"].strip(),
-                "remark": gd["remark"].strip(),
-                "group": gd["group"].strip(),
-                "data": {}
-            }
-
-            if event_name == "新推文":
-                item["data"]["tweet"] = gd["tweet"].strip()
-
-            elif event_name == "新推文回复":
-                item["data"]["parent"] = gd["parent"].strip()
-                item["data"]["reply"] = gd["reply"].strip()
-
-            elif event_name == "新关注动态":
-                item["data"]["followed_users"] = _parse_users_block(gd["users_block"])
-
-            elif event_name == "删除推文回复":
-                item["data"]["parent"] = gd["parent"].strip()
-                item["data"]["reply"] = gd["reply"].strip()
-
-            elif event_name == "删除推文":
-                pass
-
-            elif event_name == "新推文引用":
-                item["data"]["quote"] = gd["quote"].strip()
-
-            parsed = item
-            break
-
-        if parsed is None:
-            hm = HEADER_RE.search(block)
-            if hm:
-                gd = hm.groupdict()
-                parsed = {
-                    "event": gd["event"].strip(),
-                    "username": gd["username"].strip(),
-                    "remark": gd["remark"].strip(),
-                    "group": gd["group"].strip(),
-                    "data": {"raw": block}
-                }
-            else:
-                parsed = {
-                    "event": "",
-                    "username": "",
-                    "remark": "",
-                    "group": "",
-                    "data": {"raw": block}
-                }
-
-        results.append(parsed)
-
-    return results
+@dataclass(slots=True)
+class ParsedEvent:
+    """One 6551 event; only the fields of its event type are set."""
+
+    event: str
+    username: str = ""
+    remark: str = ""
+    group: str = ""
+    tweet: Optional[str] = None
+    parent: Optional[str] = None
+    reply: Optional[str] = None
+    quote: Optional[str] = None
+    followed_users: Optional[List[str]] = None
+    # 无法识别的事件保留整块原文
+    raw: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The legacy ``parse_message`` shape: header fields plus a ``data`` dict."""
+        data: Dict[str, Any] = {}
+        for key in _DATA_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        return {
+            "event": self.event,
+            "username": self.username,
+            "remark": self.remark,
+            "group": self.group,
+            "data": data,
+        }
+
+
+_DATA_FIELDS = ("tweet", "parent", "reply", "followed_users", "quote", "raw")
+
+
+def _parse_block(block: str) -> ParsedEvent:
+    header = _read_header(block)
+    pat = PATTERN_BY_HEADER.get(header)
+    m = pat.match(block) if pat is not None else None
+
+    if m:
+        gd = m.groupdict()
+        event = ParsedEvent(
+            event=header,
+            username=gd["username"].strip(),
+            remark=gd["remark"].strip(),
+            group=gd["group"].strip(),
+        )
+
+        if header == "新推文":
+            event.tweet = gd["tweet"].strip()
+
+        elif header in ("新推文回复", "删除推文"):
+            # 删除推文带上文/回帖段时即为删除推文回复
+            if gd["parent"] is not None:
+                if header == "删除推文":
+                    event.event = "删除推文回复"
+                event.parent = gd["parent"].strip()
+                event.reply = gd["reply"].strip()
+
+        elif header == "新关注动态":
+            event.followed_users = _parse_users_block(gd["users_block"])
+
+        elif header == "新推文引用":
+            event.quote = gd["quote"].strip()
+
+        return event
+
+    hm = HEADER_RE.match(block)
+    if hm:
+        gd = hm.groupdict()
+        return ParsedEvent(
+            event=gd["event"].strip(),
+            username=gd["username"].strip(),
+            remark=gd["remark"].strip(),
+            group=gd["group"].strip(),
+            raw=block,
+        )
+
+    return ParsedEvent(event="", raw=block)
+
+
+def iter_events(text: str) -> Iterator[ParsedEvent]:
+    """Parse 6551 events lazily, one block at a time."""
+    for block in _iter_blocks(text):
+        yield _parse_block(block)
 
 
+def parse_message(text: str) -> List[Dict[str, Any]]:
+    """All events as dicts; kept for callers of the original API."""
+    return [event.to_dict() for event in iter_events(text)]
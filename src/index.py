@@ -1,40 +1,21 @@
 import asyncio
+import signal
 import traceback
-from typing import Any
 
 import httpx
-from telethon import TelegramClient, events
-from telethon.errors import UsernameInvalidError, UsernameNotOccupiedError
-from telethon.utils import get_peer_id
+from telethon import TelegramClient
 
-from .config import load_config
-from .format import build_message
-from .push import build_pushplus_payload, pushplus_send
+from .config import DEFAULT_SESSION, DEFAULT_SINK, Config, SessionConfig, load_config
+from .entity_cache import EntityCache, entity_cache_filename
+from .log import get_logger, setup_logging
+from .metrics import MetricsServer
+from .pipeline import Pipeline
+from .reload import FilterWatcher
+from .shards import ShardedIngest
+from .watermark import WATERMARKS_FILENAME, WatermarkStore
+from .workers import WorkerPool
 
-ChatRule = tuple[str, list[str], bool]
-
-
-def _should_push(
-    text: str,
-    mode: str,
-    keywords: list[str],
-    case_sensitive: bool,
-) -> tuple[bool, str | None]:
-    normalized_keywords = []
-    for kw in keywords:
-        token = kw.strip()
-        if token:
-            normalized_keywords.append(token if case_sensitive else token.lower())
-
-    if not normalized_keywords:
-        return True, None
-
-    normalized_text = text if case_sensitive else text.lower()
-    hit = next((kw for kw in normalized_keywords if kw in normalized_text), None)
-
-    if mode == "allow":
-        return hit is not None, hit
-    return hit is None, hit
+log = get_logger(__name__)
 
 
 async def main() -> None:
@@ -45,99 +26,90 @@ async def main() -> None:
         traceback.print_exc()
         raise SystemExit(1) from exc
 
-    client = TelegramClient(cfg.session_name, cfg.api_id, cfg.api_hash)
-    start_result = client.start(phone=cfg.phone)
+    # 日志经队列交给后台线程写出，stdout 阻塞时不会卡住事件循环
+    log_listener = setup_logging(cfg.log_level, cfg.log_format, cfg.log_sample_per_second)
+    try:
+        await _run(cfg)
+    finally:
+        log_listener.stop()
+
+
+async def _start_client(session_name: str, phone: str, cfg: Config) -> TelegramClient:
+    client = TelegramClient(session_name, cfg.api_id, cfg.api_hash)
+    start_result = client.start(phone=phone)
     if asyncio.iscoroutine(start_result):
         await start_result
+    return client
 
-    entities: list[Any] = []
-    chat_title_by_id: dict[int, str] = {}
-    chat_rule_by_id: dict[int, ChatRule] = {}
-    for chat in cfg.chats:
-        try:
-            entity = await client.get_entity(chat)
-        except (UsernameInvalidError, UsernameNotOccupiedError) as exc:
-            print(f"Invalid chat entry: {chat}")
-            traceback.print_exc()
-            raise SystemExit(1) from exc
-        entities.append(entity)
-        chat_title = getattr(entity, "title", chat)
-        peer_id = get_peer_id(entity)
-        chat_title_by_id[peer_id] = chat_title
-        rule = cfg.chat_filters[chat]
-        chat_rule_by_id[peer_id] = (rule.mode, rule.keywords, rule.case_sensitive)
-
-    print(f"Connected. Chats: {', '.join(chat_title_by_id.values())}")
 
+async def _run(cfg: Config) -> None:
+    sessions = [SessionConfig(DEFAULT_SESSION, cfg.session_name, cfg.phone), *cfg.sessions]
+    # 依次登录：首次运行时每个会话都可能需要交互输入验证码
+    clients = [await _start_client(s.session_name, s.phone, cfg) for s in sessions]
+
+    watermarks = WatermarkStore(cfg.data_dir / WATERMARKS_FILENAME)
     timeout = httpx.Timeout(cfg.pushplus_timeout)
     async with httpx.AsyncClient(timeout=timeout) as http_client:
-        for entity in entities:
-            chat_id = get_peer_id(entity)
-            chat_title = chat_title_by_id.get(chat_id, str(chat_id))
-            previous_messages_raw = await client.get_messages(entity, limit=1)
-            if not previous_messages_raw:
-                print(f"No messages found in {chat_title}.")
-                continue
-
-            last_message_raw = previous_messages_raw[0]
-            last_message = build_message(last_message_raw)
-            mode, keywords, case_sensitive = chat_rule_by_id[chat_id]
-            should_push, hit = _should_push(
-                last_message.message,
-                mode,
-                keywords,
-                case_sensitive,
+        # 多进程投递时本进程只负责 Telegram 接收，消息按 chat 分给各投递进程
+        pipeline: Pipeline | WorkerPool = (
+            WorkerPool(cfg, cfg.delivery_processes)
+            if cfg.delivery_processes
+            else Pipeline(cfg, http_client, {}, {})
+        )
+        shards = ShardedIngest(cfg, pipeline, watermarks)
+        for session, client in zip(sessions, clients):
+            entity_cache = (
+                EntityCache(cfg.data_dir / entity_cache_filename(session.name, DEFAULT_SESSION))
+                if cfg.entity_cache_enabled
+                else None
             )
-            if not should_push:
-                print(
-                    f"[FILTER DROP] chat={chat_title} msg_id={last_message.msg_id} mode={mode} hit={hit}"
-                )
-                continue
-
-            title, content = build_pushplus_payload(chat_title, last_message)
-            await pushplus_send(
-                http_client,
-                cfg,
-                title=title,
-                content=content,
+            shards.add_session(session.name, client, entity_cache)
+
+        # docker stop 发送 SIGTERM：断开所有会话，让下面的 finally 把状态落盘
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(shards.stop()))
+        except NotImplementedError:
+            pass
+
+        await pipeline.start()
+        watermarks.start()
+        metrics_server = None
+        if cfg.metrics_port:
+            metrics_server = MetricsServer(pipeline.metrics, cfg.metrics_host, cfg.metrics_port)
+            await metrics_server.start()
+        watcher = None
+        if cfg.filter_config_path is not None:
+            watcher = FilterWatcher(
+                cfg.filter_config_path,
+                shards.apply_filters,
+                interval_seconds=cfg.filter_reload_interval_seconds,
+                sink_names=set(cfg.sinks) | {DEFAULT_SINK},
+                session_names=set(shards.shards),
             )
 
-        @client.on(events.NewMessage(chats=entities))
-        async def handler(event):
+        try:
             try:
-                latest_message_raw = event.message
-                latest_message = build_message(latest_message_raw)
-                event_chat_id = event.chat_id
-                chat_title = chat_title_by_id.get(event_chat_id, str(event_chat_id))
-                mode, keywords, case_sensitive = chat_rule_by_id.get(
-                    event_chat_id,
-                    ("allow", [], False),
-                )
-                should_push, hit = _should_push(
-                    latest_message.message,
-                    mode,
-                    keywords,
-                    case_sensitive,
-                )
-                if not should_push:
-                    print(
-                        f"[FILTER DROP] chat={chat_title} msg_id={latest_message.msg_id} mode={mode} hit={hit}"
-                    )
-                    return
-
-                title, content = build_pushplus_payload(chat_title, latest_message)
-                await pushplus_send(
-                    http_client,
-                    cfg,
-                    title=title,
-                    content=content,
-                )
-            except Exception as exc:
-                print(f"[PUSH ERROR] {exc}")
-                traceback.print_exc()
-
-        print("Listening for new messages. Press Ctrl+C to exit.")
-        await client.run_until_disconnected()
+                await shards.start(cfg.chat_filters)
+            except ValueError as exc:
+                log.error("%s", exc, exc_info=True, extra={"event": "startup_error"})
+                raise SystemExit(1) from exc
+
+            log.info(
+                "listening for new messages",
+                extra={"chats": list(pipeline.chat_title_by_id.values()), "sessions": list(shards.shards)},
+            )
+            if watcher is not None:
+                watcher.start()
+            await shards.run()
+        finally:
+            if watcher is not None:
+                await watcher.close()
+            await shards.close()
+            await pipeline.close()
+            await watermarks.close()
+            if metrics_server is not None:
+                await metrics_server.close()
 
  
 if __name__ == "__main__":
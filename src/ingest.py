@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Collection, TypeVar
+
+from telethon import TelegramClient, events
+from telethon.errors import RPCError, UsernameInvalidError, UsernameNotOccupiedError
+from telethon.utils import get_peer_id
+
+from .config import DEFAULT_SESSION, ChatFilter, Config
+from .dedup import SeenMessages
+from .entity_cache import EntityCache
+from .filters import CompiledRule, compile_rule
+from .format import build_message
+from .log import get_logger
+from .pipeline import Pipeline
+from .watermark import WatermarkStore
+
+T = TypeVar("T")
+
+# 回补按这个页大小从旧到新分批拉取
+BACKFILL_PAGE_SIZE = 100
+
+log = get_logger(__name__)
+
+
+async def _gather_bounded(limit: int, coros: list[Awaitable[T]]) -> list[T]:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro: Awaitable[T]) -> T:
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+
+class TelegramIngest:
+    """Resolve the configured chats on a client and feed their messages to the pipeline.
+
+    Owns the chat → entity table and the NewMessage subscription, so a new
+    filter config can be applied at runtime with :meth:`apply_filters`. With
+    several sessions, each one gets its own instance and ``on_publish``
+    merges their chat tables into the shared pipeline.
+    """
+
+    def __init__(
+        self,
+        cfg: Config,
+        client: TelegramClient,
+        pipeline: Pipeline,
+        watermarks: WatermarkStore,
+        entity_cache: EntityCache | None = None,
+        session: str = DEFAULT_SESSION,
+        seen: SeenMessages | None = None,
+        on_publish: Callable[[], None] | None = None,
+    ) -> None:
+        self.cfg = cfg
+        self.session = session
+        self.seen = seen
+        self._on_publish = on_publish
+        self.client = client
+        self.pipeline = pipeline
+        self.watermarks = watermarks
+        self.entity_cache = entity_cache
+        self.chat_filters: dict[str, ChatFilter] = {}
+        self.entity_by_chat: dict[str, Any] = {}
+        self.title_by_chat: dict[str, str] = {}
+        self.chat_title_by_id: dict[int, str] = {}
+        self.chat_rule_by_id: dict[int, CompiledRule] = {}
+        self._cached_chats: set[str] = set()
+        self._event_filter: events.NewMessage | None = None
+        # 补拉期间到达的新消息先按会话缓存，补拉完成后按顺序处理，既不漏也不重
+        self._live_buffer: dict[int, list[Any]] = {}
+        self._revalidation: asyncio.Task[None] | None = None
+
+    async def apply_filters(
+        self,
+        chat_filters: dict[str, ChatFilter],
+        backfill: Collection[str] = (),
+    ) -> None:
+        """Swap in a new filter config: resolve added chats, drop removed ones.
+
+        Added chats listed in ``backfill`` first catch up from their watermark
+        (used at startup and when a chat moves here from another session).
+        """
+        added = [chat for chat in chat_filters if chat not in self.entity_by_chat]
+        removed = [chat for chat in self.entity_by_chat if chat not in chat_filters]
+        resolved = await _gather_bounded(
+            self.cfg.startup_concurrency,
+            [self._resolve_or_none(chat) for chat in added],
+        )
+        if added and self.entity_cache is not None:
+            self.entity_cache.save()
+
+        entity_by_chat = {
+            chat: entity for chat, entity in self.entity_by_chat.items() if chat in chat_filters
+        }
+        title_by_chat = {chat: self.title_by_chat[chat] for chat in entity_by_chat}
+        for chat, result in zip(added, resolved):
+            if result is None:
+                continue
+            entity_by_chat[chat], title_by_chat[chat] = result
+
+        # 先登记缓存再订阅，补拉期间到达的新消息不会抢先推进水位
+        catch_up = [chat for chat in added if chat in backfill and chat in entity_by_chat]
+        for chat in catch_up:
+            self._live_buffer[get_peer_id(entity_by_chat[chat])] = []
+
+        self.chat_filters = chat_filters
+        self.entity_by_chat = entity_by_chat
+        self.title_by_chat = title_by_chat
+        self._publish()
+        self.subscribe()
+        if catch_up:
+            await _gather_bounded(
+                self.cfg.startup_concurrency,
+                [self._backfill(chat, entity_by_chat[chat]) for chat in catch_up],
+            )
+        log.info(
+            "chats assigned",
+            extra={
+                "event": "reload",
+                "session": self.session,
+                "chats": len(entity_by_chat),
+                "added": len(added),
+                "removed": len(removed),
+            },
+        )
+
+    def _publish(self) -> None:
+        # 一次性构建新表并整体替换，处理中的消息看到的要么是旧表，要么是新表
+        chat_title_by_id: dict[int, str] = {}
+        chat_rule_by_id: dict[int, CompiledRule] = {}
+        for chat, entity in self.entity_by_chat.items():
+            peer_id = get_peer_id(entity)
+            chat_title_by_id[peer_id] = self.title_by_chat[chat]
+            chat_rule_by_id[peer_id] = compile_rule(self.chat_filters[chat])
+        self.chat_title_by_id = chat_title_by_id
+        self.chat_rule_by_id = chat_rule_by_id
+        if self._on_publish is not None:
+            self._on_publish()
+        else:
+            self.pipeline.update_chats(chat_title_by_id, chat_rule_by_id)
+
+    def subscribe(self) -> None:
+        # 移除与注册之间没有 await，不会漏掉任何事件
+        if self._event_filter is not None:
+            self.client.remove_event_handler(self._on_new_message, self._event_filter)
+        self._event_filter = events.NewMessage(chats=list(self.entity_by_chat.values()))
+        self.client.add_event_handler(self._on_new_message, self._event_filter)
+
+    async def _fetch_entity(self, chat: str) -> Any:
+        try:
+            entity = await self.client.get_entity(chat)
+        except (UsernameInvalidError, UsernameNotOccupiedError) as exc:
+            raise ValueError(f"Invalid chat entry: {chat}") from exc
+        if self.entity_cache is not None:
+            self.entity_cache.put(chat, entity)
+        return entity
+
+    async def _resolve(self, chat: str) -> tuple[Any, str]:
+        # 命中缓存时直接用 peer id + access hash 构造 InputPeer，不走网络
+        cached = self.entity_cache.get(chat) if self.entity_cache is not None else None
+        if cached is not None:
+            self._cached_chats.add(chat)
+            return cached.input_peer(), cached.title
+        entity = await self._fetch_entity(chat)
+        return entity, getattr(entity, "title", chat)
+
+    async def _resolve_or_none(self, chat: str) -> tuple[Any, str] | None:
+        try:
+            return await self._resolve(chat)
+        except (RPCError, ValueError) as exc:
+            log.warning(
+                "skipping chat: %s",
+                exc,
+                extra={"event": "reload_skip", "chat": chat, "session": self.session},
+            )
+            return None
+
+    async def _fetch_missed(self, entity: Any, last_id: int | None, limit: int) -> list[Any]:
+        """Up to ``limit`` messages after ``last_id``, oldest first."""
+        if last_id is None:
+            # 首次运行没有水位：和以前一样只推送最新一条
+            return await self.client.get_messages(entity, limit=1)
+        return await self.client.get_messages(entity, min_id=last_id, limit=limit, reverse=True)
+
+    async def _backfill(self, chat: str, entity: Any) -> None:
+        chat_id = get_peer_id(entity)
+        chat_title = self.title_by_chat.get(chat, str(chat_id))
+        last_id = self.watermarks.get(chat_id)
+        cap = self.cfg.backfill_max_messages
+        try:
+            limit = min(BACKFILL_PAGE_SIZE, cap)
+            try:
+                page = await self._fetch_missed(entity, last_id, limit)
+            except (RPCError, ValueError):
+                if chat not in self._cached_chats:
+                    raise
+                # 缓存的 access hash 可能已失效：作废后重新解析一次再试
+                self.entity_cache.invalidate(chat)
+                self._cached_chats.discard(chat)
+                entity = await self._fetch_entity(chat)
+                self.entity_cache.save()
+                page = await self._fetch_missed(entity, last_id, limit)
+
+            # 从水位开始逐页向新拉取并立即处理，直到追上最新消息或达到上限
+            pushed = 0
+            while page:
+                for message_raw in page:
+                    await self.ingest(chat_id, message_raw)
+                pushed += len(page)
+                if last_id is None or len(page) < limit:
+                    break
+                cursor = page[-1].id
+                if pushed >= cap:
+                    if await self._fetch_missed(entity, cursor, 1):
+                        log.warning(
+                            "backfill stopped after %d messages; newer missed messages are not pushed",
+                            cap,
+                            extra={"event": "backfill_truncated", "chat": chat_title, "msg_id": cursor},
+                        )
+                    break
+                limit = min(BACKFILL_PAGE_SIZE, cap - pushed)
+                page = await self._fetch_missed(entity, cursor, limit)
+
+            log.info(
+                "backfill",
+                extra={
+                    "event": "backfill",
+                    "chat": chat_title,
+                    "messages": pushed,
+                    "msg_id": last_id,
+                },
+            )
+        except Exception as exc:
+            log.error(
+                "backfill failed: %s",
+                exc,
+                exc_info=True,
+                extra={"event": "backfill_error", "chat": chat_title},
+            )
+        finally:
+            # 缓存清空后再移除，期间新到的消息会继续追加到同一列表，保证顺序
+            buffered = self._live_buffer[chat_id]
+            while buffered:
+                await self.ingest(chat_id, buffered.pop(0))
+            del self._live_buffer[chat_id]
+
+    async def ingest(self, chat_id: int, message_raw: Any) -> None:
+        last_id = self.watermarks.get(chat_id)
+        if last_id is not None and message_raw.id <= last_id:
+            return
+        # 两个会话可能同时收到同一条消息：检查与登记之间没有 await，只有一个能通过
+        if self.seen is not None and not self.seen.add(chat_id, message_raw.id):
+            return
+        try:
+            await self.pipeline.handle(chat_id, build_message(message_raw))
+        except asyncio.CancelledError:
+            # 没交接完（如关闭时仍在等投递进程确认）：不推进水位，下次启动回补
+            raise
+        except Exception as exc:
+            log.error(
+                "handler error: %s",
+                exc,
+                exc_info=True,
+                extra={"event": "handler_error", "chat_id": chat_id, "msg_id": message_raw.id},
+            )
+        self.watermarks.advance(chat_id, message_raw.id)
+
+    async def _on_new_message(self, event: Any) -> None:
+        buffered = self._live_buffer.get(event.chat_id)
+        if buffered is not None:
+            buffered.append(event.message)
+            return
+        await self.ingest(event.chat_id, event.message)
+
+    def start_revalidation(self) -> None:
+        if self.entity_cache is not None and self._revalidation is None:
+            self._revalidation = asyncio.create_task(self._revalidate_stale())
+
+    async def close(self) -> None:
+        if self._revalidation is not None:
+            self._revalidation.cancel()
+            await asyncio.gather(self._revalidation, return_exceptions=True)
+            self._revalidation = None
+        if self._event_filter is not None:
+            self.client.remove_event_handler(self._on_new_message, self._event_filter)
+            self._event_filter = None
+
+    async def _revalidate(self, chat: str) -> None:
+        try:
+            entity = await self.client.get_entity(chat)
+        except Exception as exc:
+            log.warning(
+                "entity revalidation failed: %s", exc, extra={"event": "entity_revalidate", "chat": chat}
+            )
+            self.entity_cache.invalidate(chat)
+            return
+        cached = self.entity_cache.put(chat, entity)
+        if cached is not None and chat in self.title_by_chat:
+            self.title_by_chat[chat] = cached.title
+            self.chat_title_by_id[cached.peer_id] = cached.title
+            self.pipeline.chat_title_by_id[cached.peer_id] = cached.title
+
+    async def _revalidate_stale(self) -> None:
+        stale = [
+            chat
+            for chat in self._cached_chats
+            if self.entity_cache.is_stale(chat, self.cfg.entity_cache_max_age_seconds)
+        ]
+        if not stale:
+            return
+        await _gather_bounded(
+            self.cfg.startup_concurrency,
+            [self._revalidate(chat) for chat in stale],
+        )
+        self.entity_cache.save()
@@ -0,0 +1,149 @@
+"""Opportunity judging as a pipeline stage, bounded by a per-message latency budget.
+
+Each message that passed the filters is sent to the judge from
+``opportunity_judge_standalone``. If no verdict arrives within the budget the
+push goes out unjudged; the request keeps running in the background so its
+verdict lands in the cache for the next identical text.
+"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any
+
+from .config import Config
+from .log import get_logger
+from .metrics import Counter
+from .opportunity_judge_standalone import (
+    CACHE_DIRNAME,
+    DEFAULT_SYSTEM_PROMPT_FILE,
+    DEFAULT_USER_PROMPT_FILE,
+    Judge,
+    ResultCache,
+    read_prompt_file,
+)
+
+
+# 判定值得推送的消息在 PushPlus 标题前加这个标记
+PRIORITY_TITLE_PREFIX = "🔥 "
+# 排队等待判定的请求上限（按并发数的倍数）；超出后新消息直接不判定推送
+MAX_PENDING_PER_CONCURRENCY = 8
+
+log = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class Verdict:
+    should_push: bool
+    confidence: int
+    reason: str = ""
+
+    @classmethod
+    def from_result(cls, result: dict[str, Any]) -> Verdict:
+        try:
+            confidence = int(result.get("confidence", 0))
+        except (TypeError, ValueError):
+            confidence = 0
+        return cls(
+            should_push=result.get("should_push") is True,
+            confidence=confidence,
+            reason=str(result.get("reason", "")),
+        )
+
+
+class JudgeStage:
+    """Judges texts with a latency budget; identical texts in flight share one request.
+
+    :meth:`verdict` also keeps the messages of one chat in arrival order: a
+    message returns only after the previous message of its chat did, and since
+    every judge request starts on arrival, no message waits longer than the
+    budget.
+    """
+
+    def __init__(self, judge: Judge, budget_seconds: float, results: Counter) -> None:
+        self.judge = judge
+        self.budget_seconds = budget_seconds
+        self.results = results
+        self.max_pending = judge.concurrency * MAX_PENDING_PER_CONCURRENCY
+        self._inflight: dict[str, asyncio.Task[dict[str, Any]]] = {}
+        self._chat_tails: dict[int, asyncio.Future[None]] = {}
+
+    @classmethod
+    def from_config(cls, cfg: Config, results: Counter) -> JudgeStage:
+        judge = Judge(
+            cfg.openai_api_key,
+            cfg.openai_model,
+            read_prompt_file(DEFAULT_SYSTEM_PROMPT_FILE),
+            read_prompt_file(DEFAULT_USER_PROMPT_FILE),
+            api_url=cfg.openai_api_url,
+            concurrency=cfg.judge_concurrency,
+            cache=ResultCache(cfg.data_dir / CACHE_DIRNAME),
+        )
+        return cls(judge, cfg.judge_budget_seconds, results)
+
+    def _start(self, text: str) -> asyncio.Task[dict[str, Any]] | None:
+        key = self.judge.cache_key(text)
+        task = self._inflight.get(key)
+        if task is not None:
+            return task
+        if len(self._inflight) >= self.max_pending:
+            return None
+        task = asyncio.create_task(self._judge(text))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return task
+
+    def _finished(self, key: str, task: asyncio.Task[dict[str, Any]]) -> None:
+        self._inflight.pop(key, None)
+        # 超时后没人再等的请求：取走异常，避免 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _judge(self, text: str) -> dict[str, Any]:
+        result, _ = await self.judge.judge(text)
+        return result
+
+    async def verdict(self, chat_id: int, text: str) -> Verdict | None:
+        """The judge's verdict on ``text``, or ``None`` if it is unavailable within the budget."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget_seconds
+        task = self._start(text)
+
+        previous = self._chat_tails.get(chat_id)
+        tail = loop.create_future()
+        self._chat_tails[chat_id] = tail
+        try:
+            if previous is not None:
+                # shield：本消息被取消时不能连带取消前一条消息的 future
+                await asyncio.shield(previous)
+            return await self._wait(task, deadline - loop.time())
+        finally:
+            if not tail.done():
+                tail.set_result(None)
+            if self._chat_tails.get(chat_id) is tail:
+                del self._chat_tails[chat_id]
+
+    async def _wait(self, task: asyncio.Task[dict[str, Any]] | None, timeout: float) -> Verdict | None:
+        if task is None:
+            self.results.inc("overload")
+            return None
+        try:
+            # shield：超时只放弃等待，请求继续完成并写入缓存
+            result = await asyncio.wait_for(asyncio.shield(task), max(0.0, timeout))
+        except asyncio.TimeoutError:
+            self.results.inc("timeout")
+            return None
+        except Exception as exc:
+            self.results.inc("error")
+            log.warning("judge failed: %s", exc, extra={"event": "judge_error"})
+            return None
+        verdict = Verdict.from_result(result)
+        self.results.inc("push" if verdict.should_push else "skip")
+        return verdict
+
+    async def close(self) -> None:
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.judge.close()
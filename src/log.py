@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+
+LOG_FORMATS = ("json", "text")
+# 量大的丢弃类日志按事件限速采样，其余日志全部输出
+SAMPLED_EVENTS = frozenset({"filter_drop", "dedup_drop", "judge_drop", "queue_drop", "queue_shed", "push_deferred"})
+
+# LogRecord 自带的属性；其余属性都是调用方通过 extra 传入的结构化字段
+_RESERVED = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"tg_forwarder.{name.rsplit('.', 1)[-1]}")
+
+
+def _fields(record: logging.LogRecord) -> dict[str, object]:
+    return {key: value for key, value in record.__dict__.items() if key not in _RESERVED}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, the ``extra`` fields, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, object] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(_fields(record))
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """``time LEVEL msg key=value ...`` for reading logs by eye."""
+
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s %(levelname)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in _fields(record).items())
+        if not fields:
+            return line
+        head, sep, tail = line.partition("\n")
+        return f"{head} {fields}{sep}{tail}"
+
+
+class SamplingFilter(logging.Filter):
+    """Let through at most ``per_second`` records per sampled event each second.
+
+    The next record let through for an event carries ``suppressed``, the
+    number of records dropped since the previous one.
+    """
+
+    def __init__(self, per_second: int, events: frozenset[str] = SAMPLED_EVENTS) -> None:
+        super().__init__()
+        self.per_second = per_second
+        self.events = events
+        self._windows: dict[str, list[int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if self.per_second <= 0 or event not in self.events:
+            return True
+
+        second = int(record.created)
+        # [当前秒, 本秒已输出条数, 累计被丢弃条数]
+        window = self._windows.setdefault(event, [second, 0, 0])
+        if window[0] != second:
+            window[0], window[1] = second, 0
+        if window[1] >= self.per_second:
+            window[2] += 1
+            return False
+
+        window[1] += 1
+        if window[2]:
+            record.suppressed = window[2]
+            window[2] = 0
+        return True
+
+
+class _LoopSafeQueueHandler(logging.handlers.QueueHandler):
+    # 默认的 prepare 会在调用线程里格式化整条记录（包括 traceback）；
+    # 这里只合并 msg/args，格式化和 I/O 都留给后台线程
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    sample_per_second: int = 0,
+    stream: object = None,
+) -> logging.handlers.QueueListener:
+    """Route ``tg_forwarder.*`` loggers through a queue to a background writer thread.
+
+    Returns the started listener; call ``stop()`` on shutdown to flush it.
+    """
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(LOG_FORMATS)}")
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handler = _LoopSafeQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_per_second))
+
+    logger = logging.getLogger("tg_forwarder")
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    return listener
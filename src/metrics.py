@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import math
+from typing import Callable, Iterable, TypeVar
+
+from .log import get_logger
+
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+SEND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+LOOP_LAG_INTERVAL_SECONDS = 0.5
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = tuple[str, ...]
+
+log = get_logger(__name__)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+
+    def _labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Counter incremented directly or, for totals owned elsewhere, read at scrape time."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[LabelValues, float] = {}
+        self._collect: Callable[[], Iterable[tuple[LabelValues, float]]] | None = None
+
+    def set_function(self, collect: Callable[[], Iterable[tuple[LabelValues, float]]]) -> None:
+        self._collect = collect
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def total(self, **match: str) -> float:
+        """Sum over all label sets, optionally only those with the given label values."""
+        positions = [(self.labelnames.index(name), value) for name, value in match.items()]
+        return sum(
+            value
+            for labels, value in self._values.items()
+            if all(labels[idx] == expected for idx, expected in positions)
+        )
+
+    def _samples(self) -> Iterable[str]:
+        values = dict(self._values)
+        if self._collect is not None:
+            values.update(self._collect())
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{self._labels(labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Gauge set directly or, for values owned elsewhere, read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[LabelValues, float] = {}
+        self._collect: Callable[[], Iterable[tuple[LabelValues, float]]] | None = None
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def set_function(self, collect: Callable[[], Iterable[tuple[LabelValues, float]]]) -> None:
+        self._collect = collect
+
+    def _samples(self) -> Iterable[str]:
+        values = dict(self._values)
+        if self._collect is not None:
+            values.update(self._collect())
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{self._labels(labels)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签一个计数数组（最后一格是 +Inf）和总和；观测只做一次二分和两次加法
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def _samples(self) -> Iterable[str]:
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{self._labels(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {_format_value(self._sums[labels])}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Metrics:
+    """The forwarder's metric set; every hot-path update is a dict lookup and an add."""
+
+    def __init__(self) -> None:
+        self.registry = Registry()
+        r = self.registry
+        self.e2e_latency = r.register(Histogram(
+            "tg_forwarder_e2e_latency_seconds",
+            "Time from the Telegram message date to successful delivery.",
+            ("sink",),
+            LATENCY_BUCKETS,
+        ))
+        self.send_duration = r.register(Histogram(
+            "tg_forwarder_send_duration_seconds",
+            "Duration of one sink send (e.g. pushplus_send), retries included.",
+            ("sink",),
+            SEND_BUCKETS,
+        ))
+        self.sent = r.register(Counter(
+            "tg_forwarder_sent_total", "Pushes delivered.", ("sink",)
+        ))
+        self.send_failures = r.register(Counter(
+            "tg_forwarder_send_failures_total", "Pushes that failed after all retries.", ("sink",)
+        ))
+        self.send_retries = r.register(Counter(
+            "tg_forwarder_send_retries_total", "Send attempts that were retried.", ("sink",)
+        ))
+        self.queue_dropped = r.register(Counter(
+            "tg_forwarder_queue_dropped_total", "Pushes dropped by a full delivery queue.", ("sink",)
+        ))
+        self.queue_shed = r.register(Counter(
+            "tg_forwarder_queue_shed_total",
+            "Low-priority pushes shed after waiting longer than DELIVERY_SHED_AGE_SECONDS.",
+            ("sink",),
+        ))
+        self.filtered = r.register(Counter(
+            "tg_forwarder_filter_total",
+            "Filter decisions per chat and mode.",
+            ("chat", "mode", "result"),
+        ))
+        self.dedup_dropped = r.register(Counter(
+            "tg_forwarder_dedup_dropped_total", "Messages dropped as duplicates.", ("chat",)
+        ))
+        self.dedup_hits = r.register(Counter(
+            "tg_forwarder_dedup_hits_total", "Dedup cache lookups that found the content key."
+        ))
+        self.dedup_misses = r.register(Counter(
+            "tg_forwarder_dedup_misses_total", "Dedup cache lookups that recorded a new content key."
+        ))
+        self.judged = r.register(Counter(
+            "tg_forwarder_judge_total",
+            "Opportunity judge outcomes (push, skip, timeout, error, overload).",
+            ("result",),
+        ))
+        self.judge_suppressed = r.register(Counter(
+            "tg_forwarder_judge_suppressed_total", "Pushes suppressed by the opportunity judge.", ("chat",)
+        ))
+        self.breaker_state = r.register(Gauge(
+            "tg_forwarder_breaker_state",
+            "PushPlus circuit breaker state: 0 closed, 1 half-open, 2 open.",
+            ("sink",),
+        ))
+        self.breaker_opened = r.register(Counter(
+            "tg_forwarder_breaker_opened_total", "Times the PushPlus circuit breaker opened.", ("sink",)
+        ))
+        self.limiter_wait = r.register(Counter(
+            "tg_forwarder_limiter_wait_seconds_total",
+            "Time sends waited for a PushPlus rate limiter token.",
+            ("sink",),
+        ))
+        self.limiter_waits = r.register(Counter(
+            "tg_forwarder_limiter_waits_total", "Sends that had to wait for a rate limiter token.", ("sink",)
+        ))
+        self.queue_depth = r.register(Gauge(
+            "tg_forwarder_queue_depth", "Pushes waiting in each queue.", ("queue",)
+        ))
+        self.session_up = r.register(Gauge(
+            "tg_forwarder_session_up", "1 while a Telegram session is connected.", ("session",)
+        ))
+        self.session_chats = r.register(Gauge(
+            "tg_forwarder_session_chats", "Chats currently assigned to each Telegram session.", ("session",)
+        ))
+        self.loop_lag = r.register(Histogram(
+            "tg_forwarder_event_loop_lag_seconds",
+            "How late the event loop woke a periodic probe.",
+            (),
+            LOOP_LAG_BUCKETS,
+        ))
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+async def watch_loop_lag(histogram: Histogram, interval: float = LOOP_LAG_INTERVAL_SECONDS) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, loop.time() - started - interval))
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint serving ``GET /metrics`` in Prometheus text format."""
+
+    def __init__(self, metrics: Metrics, host: str = "0.0.0.0", port: int = 9464) -> None:
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server: asyncio.AbstractServer | None = None
+        self._lag_task: asyncio.Task[None] | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        self._lag_task = asyncio.create_task(watch_loop_lag(self.metrics.loop_lag))
+        log.info("metrics endpoint listening", extra={"host": self.host, "port": self.port})
+
+    async def close(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            await asyncio.gather(self._lag_task, return_exceptions=True)
+            self._lag_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            parts = request.split(b" ", 2)
+            path = parts[1].decode("latin-1") if len(parts) > 1 else ""
+            if parts[0] == b"GET" and path.split("?", 1)[0] == "/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, self.metrics.render()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+            data = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                + data
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -2,15 +2,17 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import hashlib
 import json
 import os
 import re
 import sys
-import urllib.error
-import urllib.request
+import threading
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, AsyncIterator
 
+import httpx
 from dotenv import load_dotenv
 
 
@@ -19,6 +21,23 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 DEFAULT_SYSTEM_PROMPT_FILE = SCRIPT_DIR / "prompts" / "system_prompt.txt"
 DEFAULT_USER_PROMPT_FILE = SCRIPT_DIR / "prompts" / "user_prompt.txt"
+CACHE_DIRNAME = "judge_cache"
+
+DEFAULT_CONCURRENCY = 8
+REQUEST_TIMEOUT_SECONDS = 30.0
+MAX_RETRIES = 3
+RETRY_BASE_DELAY_SECONDS = 1.0
+# 429 和 5xx 是暂时性错误，值得重试；其余 4xx（如 key 无效）重试也没用
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class JudgeError(Exception):
+    """The judging API answered with an error status."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(f"HTTPError {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
 
 
 def read_prompt_file(path: Path) -> str:
@@ -57,7 +76,18 @@ def parse_json_maybe_wrapped(raw: str) -> dict[str, Any]:
         return json.loads(match.group(0))
 
 
-def call_openai(api_key: str, model: str, system_prompt: str, user_prompt: str) -> dict[str, Any]:
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def call_openai(
+    client: httpx.AsyncClient,
+    api_url: str,
+    api_key: str,
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+) -> dict[str, Any]:
     body = {
         "model": model,
         "input": [
@@ -65,17 +95,165 @@ def call_openai(api_key: str, model: str, system_prompt: str, user_prompt: str)
             {"role": "user", "content": user_prompt},
         ],
     }
-    req = urllib.request.Request(
-        API_URL,
-        data=json.dumps(body).encode("utf-8"),
-        method="POST",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-    )
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    headers = {"Authorization": f"Bearer {api_key}"}
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            resp = await client.post(api_url, json=body, headers=headers)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if resp.status_code < 400:
+                return resp.json()
+            if resp.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                raise JudgeError(resp.status_code, resp.text)
+        await asyncio.sleep(RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1))
+    raise AssertionError("unreachable")
+
+
+class ResultCache:
+    """Judge results on disk, one JSON file per hash of model, prompts and text.
+
+    An unchanged message judged with the same prompts and model is answered
+    from here without calling the API.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, result: dict[str, Any]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再改名，并发写同一个 key 或中途被杀都不会留下半截文件
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+class Judge:
+    """Judges texts concurrently over one pooled HTTP client, with an optional result cache."""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        system_prompt: str,
+        user_template: str,
+        api_url: str = API_URL,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        cache: ResultCache | None = None,
+        http_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.api_key = api_key
+        self.model = model
+        self.system_prompt = system_prompt
+        self.user_template = user_template
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.cache = cache
+        self.prompt_hash = _sha256(f"{system_prompt}\x00{user_template}")
+        self._owns_client = http_client is None
+        self.http_client = http_client or httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def cache_key(self, text: str) -> str:
+        return _sha256(f"{self.model}\x00{self.prompt_hash}\x00{_sha256(text)}")
+
+    async def judge(self, text: str) -> tuple[dict[str, Any], bool]:
+        """Return the verdict for ``text`` and whether it came from the cache."""
+        key = self.cache_key(text)
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached, True
+
+        async with self._semaphore:
+            payload = await call_openai(
+                self.http_client,
+                self.api_url,
+                self.api_key,
+                self.model,
+                self.system_prompt,
+                build_user_prompt(self.user_template, text),
+            )
+        result = parse_json_maybe_wrapped(extract_text_from_response(payload))
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, key, result)
+        return result, False
+
+    async def close(self) -> None:
+        if self._owns_client:
+            await self.http_client.aclose()
+
+
+async def _read_batch(stream: IO[str]) -> AsyncIterator[tuple[Any, str | None]]:
+    # 每行一个 JSON：{"id": ..., "text": "..."} 或直接是字符串；没有 id 时用行号，无法解析的行给出 None
+    line_no = 0
+    while True:
+        line = await asyncio.to_thread(stream.readline)
+        if not line:
+            return
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            yield line_no, None
+            continue
+        if isinstance(item, str):
+            yield line_no, item
+        elif isinstance(item, dict):
+            yield item.get("id", line_no), str(item.get("text", ""))
+        else:
+            yield line_no, None
+
+
+async def _judge_one(judge: Judge, item_id: Any, text: str | None) -> dict[str, Any]:
+    if text is None:
+        return {"id": item_id, "error": "line is not a JSON object or string"}
+    try:
+        result, cached = await judge.judge(text)
+    except Exception as exc:
+        return {"id": item_id, "error": str(exc)}
+    return {"id": item_id, "result": result, "cached": cached}
+
+
+async def judge_batch(judge: Judge, stream: IO[str], out: IO[str], window: int) -> int:
+    """Judge every line of ``stream`` and write one JSON line per input, in input order.
+
+    At most ``window`` texts are read ahead, so arbitrarily long streams run in
+    constant memory. Returns the number of texts that failed.
+    """
+    pending: list[asyncio.Task[dict[str, Any]]] = []
+    failed = 0
+
+    async def flush_oldest() -> None:
+        nonlocal failed
+        record = await pending.pop(0)
+        failed += "error" in record
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    async for item_id, text in _read_batch(stream):
+        pending.append(asyncio.create_task(_judge_one(judge, item_id, text)))
+        if len(pending) >= window:
+            await flush_oldest()
+    while pending:
+        await flush_oldest()
+    return failed
 
 
 def get_input_text(args: argparse.Namespace) -> str:
@@ -88,17 +266,80 @@ def get_input_text(args: argparse.Namespace) -> str:
     return ""
 
 
+def default_cache_dir() -> Path:
+    # 与主程序一样放在 DATA_DIR 下，相对路径以项目根目录为基准
+    data_dir = Path(os.getenv("DATA_DIR", "data").strip() or "data")
+    if not data_dir.is_absolute():
+        data_dir = PROJECT_ROOT / data_dir
+    return data_dir / CACHE_DIRNAME
+
+
+async def _run(args: argparse.Namespace, api_key: str, system_prompt: str, user_template: str) -> int:
+    judge = Judge(
+        api_key,
+        args.model,
+        system_prompt,
+        user_template,
+        api_url=args.api_url,
+        concurrency=args.concurrency,
+        cache=None if args.no_cache else ResultCache(Path(args.cache_dir)),
+    )
+    try:
+        if args.batch:
+            if args.batch == "-":
+                failed = await judge_batch(judge, sys.stdin, sys.stdout, args.concurrency * 4)
+            else:
+                with open(args.batch, encoding="utf-8") as stream:
+                    failed = await judge_batch(judge, stream, sys.stdout, args.concurrency * 4)
+            return 1 if failed else 0
+
+        input_text = get_input_text(args)
+        if not input_text:
+            print("Error: no input text. Use --text, --file, --batch, or pipe stdin.", file=sys.stderr)
+            return 2
+        try:
+            result, _ = await judge.judge(input_text)
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+    finally:
+        await judge.close()
+
+
 def main() -> int:
     load_dotenv(PROJECT_ROOT / ".env")
 
     parser = argparse.ArgumentParser(description="Judge monitored text with prompts from local .txt files.")
     parser.add_argument("--text", help="Text to analyze")
     parser.add_argument("--file", help="File path of text to analyze")
+    parser.add_argument(
+        "--batch",
+        help='JSONL file of texts to judge, "-" for stdin; each line is {"id": ..., "text": ...} or a JSON string',
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Max parallel API requests in batch mode (default: {DEFAULT_CONCURRENCY})",
+    )
     parser.add_argument(
         "--model",
         default=os.getenv("OPENAI_MODEL", "gpt-4.1-mini"),
         help="OpenAI model name, default from OPENAI_MODEL or gpt-4.1-mini",
     )
+    parser.add_argument(
+        "--api-url",
+        default=os.getenv("OPENAI_API_URL", "").strip() or API_URL,
+        help="Responses endpoint, default from OPENAI_API_URL or the OpenAI API (point it at a mock for testing)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=str(default_cache_dir()),
+        help="Directory of cached verdicts (default: $DATA_DIR/judge_cache)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API and do not store verdicts")
     parser.add_argument(
         "--system-prompt-file",
         default=str(DEFAULT_SYSTEM_PROMPT_FILE),
@@ -110,10 +351,8 @@ def main() -> int:
         help=f"User prompt txt file path (default: {DEFAULT_USER_PROMPT_FILE.name})",
     )
     args = parser.parse_args()
-
-    input_text = get_input_text(args)
-    if not input_text:
-        print("Error: no input text. Use --text, --file, or pipe stdin.", file=sys.stderr)
+    if args.concurrency < 1:
+        print("Error: --concurrency must be >= 1.", file=sys.stderr)
         return 2
 
     api_key = os.getenv("OPENAI_API_KEY", "").strip()
@@ -128,22 +367,7 @@ def main() -> int:
         print(f"Error loading prompt files: {e}", file=sys.stderr)
         return 2
 
-    user_prompt = build_user_prompt(user_template, input_text)
-
-    try:
-        response_payload = call_openai(api_key, args.model, system_prompt, user_prompt)
-        model_text = extract_text_from_response(response_payload)
-        result = parse_json_maybe_wrapped(model_text)
-    except urllib.error.HTTPError as e:
-        detail = e.read().decode("utf-8", errors="ignore")
-        print(f"HTTPError {e.code}: {detail}", file=sys.stderr)
-        return 1
-    except Exception as e:
-        print(f"Error: {e}", file=sys.stderr)
-        return 1
-
-    print(json.dumps(result, ensure_ascii=False, indent=2))
-    return 0
+    return asyncio.run(_run(args, api_key, system_prompt, user_template))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from .config import DEFAULT_SINK, resolve_data_dir
+from .delivery import PRIORITY_NORMAL, DeliveryJob
+from .log import get_logger
+
+
+OUTBOX_FILENAME = "outbox.sqlite3"
+OUTBOX_BATCH_SIZE = 256
+# 已送达的记录保留这么久（便于用 list --status done 排查）再由写线程删除
+OUTBOX_DONE_RETENTION_SECONDS = 3600.0
+OUTBOX_PRUNE_INTERVAL_SECONDS = 60.0
+
+log = get_logger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    sink TEXT NOT NULL DEFAULT 'pushplus',
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 1,
+    origin_ts REAL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_status_id ON outbox (status, id);
+"""
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    # 旧版本的数据库没有 sink 列：补上，已有记录视为发往默认的 pushplus
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+    if "sink" not in columns:
+        conn.execute("ALTER TABLE outbox ADD COLUMN sink TEXT NOT NULL DEFAULT 'pushplus'")
+    # 同样补上优先级和源消息时间：已有记录按 normal 重放，不计端到端延迟
+    if "priority" not in columns:
+        conn.execute(f"ALTER TABLE outbox ADD COLUMN priority INTEGER NOT NULL DEFAULT {PRIORITY_NORMAL}")
+    if "origin_ts" not in columns:
+        conn.execute("ALTER TABLE outbox ADD COLUMN origin_ts REAL")
+    return conn
+
+
+def _resolve(fut: asyncio.Future[int], row_id: int) -> None:
+    if not fut.done():
+        fut.set_result(row_id)
+
+
+def _fail(fut: asyncio.Future[int], exc: BaseException) -> None:
+    if not fut.done():
+        fut.set_exception(exc)
+
+
+class Outbox:
+    """Durable SQLite (WAL) outbox for rendered pushes.
+
+    All writes go through one background thread. It drains whatever has
+    queued up since its last commit and applies it in a single transaction
+    (group commit), so a burst of pushes costs one fsync, not one per push.
+    Delivered records are deleted by the same thread once they are older
+    than ``OUTBOX_DONE_RETENTION_SECONDS``.
+    """
+
+    def __init__(self, path: Path, batch_size: int = OUTBOX_BATCH_SIZE) -> None:
+        self.path = path
+        self._batch_size = batch_size
+        self._conn = _connect(path)
+        self._ops: queue.SimpleQueue[tuple[Any, ...] | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._next_prune = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(target=self._writer, name="outbox-writer", daemon=True)
+        self._thread.start()
+
+    def pending(self) -> list[DeliveryJob]:
+        """Jobs left pending by a previous run, oldest first; call before start()."""
+        rows = self._conn.execute(
+            "SELECT id, chat_id, sink, title, content, priority, origin_ts"
+            " FROM outbox WHERE status = ? ORDER BY id",
+            (STATUS_PENDING,),
+        ).fetchall()
+        return [
+            DeliveryJob(
+                chat_id=chat_id,
+                title=title,
+                content=content,
+                outbox_id=row_id,
+                sink=sink,
+                origin_ts=origin_ts,
+                priority=priority,
+            )
+            for row_id, chat_id, sink, title, content, priority, origin_ts in rows
+        ]
+
+    def prune_done(self) -> int:
+        """Delete delivered records; call before start()."""
+        cur = self._conn.execute("DELETE FROM outbox WHERE status = ?", (STATUS_DONE,))
+        return cur.rowcount
+
+    async def add(self, job: DeliveryJob) -> int:
+        """Persist ``job`` and return its outbox id once the batch is committed."""
+        assert self._loop is not None, "Outbox.start() must be called first"
+        fut: asyncio.Future[int] = self._loop.create_future()
+        self._ops.put(("add", job, fut))
+        job.outbox_id = await fut
+        return job.outbox_id
+
+    def mark_done(self, row_id: int | None) -> None:
+        if row_id is not None:
+            self._ops.put(("status", row_id, STATUS_DONE, None))
+
+    def mark_dead(self, row_id: int | None, error: str) -> None:
+        if row_id is not None:
+            self._ops.put(("status", row_id, STATUS_DEAD, error))
+
+    async def close(self) -> None:
+        if self._thread is not None:
+            self._ops.put(None)
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        self._conn.close()
+
+    def _writer(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._ops.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._ops.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [op for op in batch if op is not None]
+            if batch:
+                self._apply(batch)
+
+    def _apply(self, batch: list[tuple[Any, ...]]) -> None:
+        now = time.time()
+        added: list[tuple[asyncio.Future[int], int]] = []
+        try:
+            self._conn.execute("BEGIN")
+            for op in batch:
+                if op[0] == "add":
+                    _, job, fut = op
+                    cur = self._conn.execute(
+                        "INSERT INTO outbox (chat_id, sink, title, content, priority, origin_ts,"
+                        " status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            job.chat_id, job.sink or DEFAULT_SINK, job.title, job.content,
+                            job.priority, job.origin_ts, STATUS_PENDING, now, now,
+                        ),
+                    )
+                    added.append((fut, int(cur.lastrowid)))
+                else:
+                    _, row_id, status, error = op
+                    self._conn.execute(
+                        "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?,"
+                        " updated_at = ? WHERE id = ?",
+                        (status, error, now, row_id),
+                    )
+            if now >= self._next_prune:
+                # 长期运行时已送达的记录会一直累积：定期随批次一起删掉过了保留期的
+                self._conn.execute(
+                    "DELETE FROM outbox WHERE status = ? AND updated_at <= ?",
+                    (STATUS_DONE, now - OUTBOX_DONE_RETENTION_SECONDS),
+                )
+                self._next_prune = now + OUTBOX_PRUNE_INTERVAL_SECONDS
+            self._conn.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            log.error("outbox write failed: %s", exc, extra={"event": "outbox_error", "ops": len(batch)})
+            for op in batch:
+                if op[0] == "add":
+                    self._call_soon(_fail, op[2], exc)
+            return
+
+        for fut, row_id in added:
+            self._call_soon(_resolve, fut, row_id)
+
+    def _call_soon(self, callback: Any, *args: Any) -> None:
+        assert self._loop is not None
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # 事件循环已关闭（进程退出中），数据已落盘，忽略回调
+            pass
+
+
+def _print_rows(rows: list[tuple[Any, ...]]) -> None:
+    for row_id, chat_id, sink, title, status, attempts, last_error, updated_at in rows:
+        updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(updated_at))
+        print(f"{row_id}\t{chat_id}\t{sink}\t{status}\t{attempts}\t{updated}\t{title}\t{last_error or ''}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Inspect and manage the push outbox.")
+    parser.add_argument(
+        "--db",
+        default=None,
+        help=f"Outbox database path (default: $DATA_DIR/{OUTBOX_FILENAME})",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Count records by status")
+    list_parser = sub.add_parser("list", help="List records")
+    list_parser.add_argument("--status", default=STATUS_DEAD, choices=[STATUS_PENDING, STATUS_DONE, STATUS_DEAD])
+    list_parser.add_argument("--limit", type=int, default=50)
+    purge_parser = sub.add_parser("purge", help="Delete dead letters (and optionally delivered records)")
+    purge_parser.add_argument("--include-done", action="store_true")
+    sub.add_parser("retry", help="Mark dead letters pending so the next start replays them")
+    args = parser.parse_args()
+
+    path = Path(args.db) if args.db else resolve_data_dir() / OUTBOX_FILENAME
+    if not path.exists():
+        print(f"Outbox not found: {path}")
+        return 1
+
+    conn = _connect(path)
+    try:
+        if args.command == "stats":
+            for status, count in conn.execute(
+                "SELECT status, COUNT(*) FROM outbox GROUP BY status ORDER BY status"
+            ):
+                print(f"{status}\t{count}")
+        elif args.command == "list":
+            rows = conn.execute(
+                "SELECT id, chat_id, sink, title, status, attempts, last_error, updated_at"
+                " FROM outbox WHERE status = ? ORDER BY id DESC LIMIT ?",
+                (args.status, args.limit),
+            ).fetchall()
+            _print_rows(rows)
+        elif args.command == "purge":
+            statuses = [STATUS_DEAD, STATUS_DONE] if args.include_done else [STATUS_DEAD]
+            placeholders = ",".join("?" for _ in statuses)
+            cur = conn.execute(f"DELETE FROM outbox WHERE status IN ({placeholders})", statuses)
+            print(f"Purged {cur.rowcount} records.")
+        elif args.command == "retry":
+            cur = conn.execute(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_DEAD),
+            )
+            print(f"Re-queued {cur.rowcount} dead letters.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
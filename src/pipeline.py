@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import functools
+import logging
+import time
+from typing import Callable
+
+import httpx
+
+from .archive import ARCHIVE_DIRNAME, MessageArchive
+from .coalesce import Coalescer
+from .config import Config
+from .dedup import DEDUP_FILENAME, DedupCache, content_key, write_snapshot
+from .delivery import DeliveryJob, DeliveryQueue
+from .filters import PASS_ALL_RULE, CompiledRule
+from .format import Message
+from .judging import PRIORITY_TITLE_PREFIX, JudgeStage
+from .log import get_logger
+from .metrics import Metrics
+from .outbox import OUTBOX_FILENAME, Outbox
+from .push import (
+    BREAKER_STATE_VALUES,
+    CircuitBreaker,
+    CircuitOpenError,
+    TokenBucket,
+    build_pushplus_payload,
+)
+from .search import SEARCH_FILENAME, SearchIndex
+from .sinks import PushPlusSink, Sink, build_sinks
+
+
+DEDUP_SAVE_INTERVAL_SECONDS = 60.0
+
+log = get_logger(__name__)
+
+
+class Pipeline:
+    """Filter → render → coalesce → outbox → per-sink delivery for received messages.
+
+    ``index.main`` feeds it from Telethon; anything else that produces
+    ``format.Message`` objects can drive it through :meth:`handle`.
+    """
+
+    def __init__(
+        self,
+        cfg: Config,
+        http_client: httpx.AsyncClient,
+        chat_title_by_id: dict[int, str],
+        chat_rule_by_id: dict[int, CompiledRule],
+    ) -> None:
+        self.cfg = cfg
+        self.http_client = http_client
+        self.chat_title_by_id = chat_title_by_id
+        self.chat_rule_by_id = chat_rule_by_id
+
+        self.metrics = Metrics()
+        self.dedup = (
+            DedupCache(ttl_seconds=cfg.dedup_ttl_seconds, max_entries=cfg.dedup_max_entries)
+            if cfg.dedup_enabled
+            else None
+        )
+        self._dedup_saver: asyncio.Task[None] | None = None
+        # 被熔断器拒绝、等待重新入队的推送
+        self._deferred: set[asyncio.Task[None]] = set()
+        self.judging = (
+            JudgeStage.from_config(cfg, self.metrics.judged) if cfg.judge_enabled else None
+        )
+        # 等待判定后再提交的后台任务；每个 chat 只记最后一个，后来的消息排在它后面
+        self._judge_tails: dict[int, asyncio.Task[None]] = {}
+        self._judge_pending: set[asyncio.Task[None]] = set()
+        self.outbox = Outbox(cfg.data_dir / OUTBOX_FILENAME) if cfg.outbox_enabled else None
+        self.archive = (
+            MessageArchive(
+                cfg.data_dir / ARCHIVE_DIRNAME,
+                segment_max_bytes=cfg.archive_segment_bytes,
+                max_total_bytes=cfg.archive_max_bytes,
+                retention_seconds=cfg.archive_retention_seconds,
+            )
+            if cfg.archive_enabled
+            else None
+        )
+        self.search = SearchIndex(cfg.data_dir / SEARCH_FILENAME) if cfg.search_enabled else None
+        # 每个 sink 一条独立队列和 worker 池：慢的 sink 只会堆积自己的队列
+        self.sinks: dict[str, Sink] = build_sinks(
+            cfg, http_client, on_retry=self.metrics.send_retries.inc
+        )
+        self.queues: dict[str, DeliveryQueue] = {
+            name: DeliveryQueue(
+                functools.partial(self._send, sink),
+                workers=sink.cfg.concurrency,
+                maxsize=sink.cfg.queue_size,
+                overflow=sink.cfg.overflow,
+                on_drop=self._on_drop,
+                name=f"sink-{name}",
+                on_shed=self._on_shed,
+                scheduling=cfg.delivery_scheduling,
+                weights=cfg.delivery_priority_weights,
+                shed_age_seconds=cfg.delivery_shed_age_seconds,
+                shed_mode=cfg.delivery_shed_mode,
+            )
+            for name, sink in self.sinks.items()
+        }
+        self.default_sinks = tuple(cfg.default_sinks)
+        self.coalescer = Coalescer(
+            self._enqueue,
+            window_seconds=cfg.coalesce_window_seconds,
+            max_messages=cfg.coalesce_max_messages,
+            scope=cfg.coalesce_scope,
+            route=self.route,
+        )
+        self.metrics.queue_depth.set_function(self._queue_depths)
+        if self.dedup is not None:
+            dedup = self.dedup
+            self.metrics.dedup_hits.set_function(lambda: [((), dedup.hits)])
+            self.metrics.dedup_misses.set_function(lambda: [((), dedup.misses)])
+        for metric, read in (
+            (self.metrics.breaker_state, lambda limiter, breaker: BREAKER_STATE_VALUES[breaker.state]),
+            (self.metrics.breaker_opened, lambda limiter, breaker: breaker.times_opened),
+            (self.metrics.limiter_wait, lambda limiter, breaker: limiter.total_wait_seconds),
+            (self.metrics.limiter_waits, lambda limiter, breaker: limiter.waits),
+        ):
+            metric.set_function(functools.partial(self._guard_values, read))
+
+    def update_chats(
+        self,
+        chat_title_by_id: dict[int, str],
+        chat_rule_by_id: dict[int, CompiledRule],
+    ) -> None:
+        # handle() 内部没有 await 穿插在两次读取之间，整体替换即为原子切换
+        self.chat_title_by_id = chat_title_by_id
+        self.chat_rule_by_id = chat_rule_by_id
+
+    async def start(self) -> None:
+        if self.dedup is not None and self.cfg.dedup_persist:
+            self.dedup.load(self.cfg.data_dir / DEDUP_FILENAME)
+            self._dedup_saver = asyncio.create_task(self._save_dedup_periodically())
+
+        if self.archive is not None:
+            self.archive.start()
+        if self.search is not None:
+            self.search.start()
+
+        replay: list[DeliveryJob] = []
+        if self.outbox is not None:
+            self.outbox.prune_done()
+            replay = self.outbox.pending()
+            self.outbox.start()
+
+        for queue in self.queues.values():
+            queue.start()
+        if replay:
+            log.info(
+                "replaying undelivered pushes from outbox",
+                extra={"event": "outbox_replay", "count": len(replay)},
+            )
+        for job in replay:
+            queue = self.queues.get(job.sink)
+            if queue is None:
+                log.error(
+                    "outbox record for unknown sink",
+                    extra={"event": "outbox_error", "outbox_id": job.outbox_id, "sink": job.sink},
+                )
+                self.outbox.mark_dead(job.outbox_id, f"unknown sink: {job.sink}")
+                continue
+            await queue.put(job)
+
+    async def close(self) -> None:
+        if self._judge_pending:
+            await asyncio.wait(set(self._judge_pending))
+        await self.coalescer.close()
+        # 等熔断恢复的推送不再等：它们在 outbox 里仍是 pending，下次启动重放
+        for task in self._deferred:
+            task.cancel()
+        await asyncio.gather(*self._deferred, return_exceptions=True)
+        await asyncio.gather(*(queue.close() for queue in self.queues.values()))
+        for sink in self.sinks.values():
+            await sink.close()
+        if self.outbox is not None:
+            await self.outbox.close()
+        if self._dedup_saver is not None:
+            self._dedup_saver.cancel()
+            self.dedup.save(self.cfg.data_dir / DEDUP_FILENAME)
+        if self.judging is not None:
+            await self.judging.close()
+        if self.archive is not None:
+            await self.archive.close()
+        if self.search is not None:
+            await self.search.close()
+
+    async def handle(self, chat_id: int, message: Message) -> None:
+        chat_title = self.chat_title_by_id.get(chat_id, str(chat_id))
+        rule = self.chat_rule_by_id.get(chat_id, PASS_ALL_RULE)
+        should_push, hit = rule.should_push(message.message)
+        if not should_push:
+            self.metrics.filtered.inc(chat_title, rule.mode, "drop")
+            log.info(
+                "filter drop",
+                extra={
+                    "event": "filter_drop",
+                    "chat": chat_title,
+                    "msg_id": message.msg_id,
+                    "mode": rule.mode,
+                    "hit": hit,
+                },
+            )
+            self._record(chat_id, chat_title, message, "filter_drop", hit)
+            return
+        self.metrics.filtered.inc(chat_title, rule.mode, "pass")
+
+        if self.dedup is not None and rule.dedup:
+            key = content_key(message)
+            if key is not None and self.dedup.check(key):
+                self.metrics.dedup_dropped.inc(chat_title)
+                log.info(
+                    "dedup drop",
+                    extra={"event": "dedup_drop", "chat": chat_title, "msg_id": message.msg_id},
+                )
+                self._record(chat_id, chat_title, message, "dedup_drop", hit)
+                return
+
+        title, content = build_pushplus_payload(chat_title, message)
+        job = DeliveryJob(
+            chat_id=chat_id,
+            title=title,
+            content=content,
+            origin_ts=message.date,
+            priority=rule.priority,
+        )
+        judge = self.judging is not None and rule.judge
+        previous = self._judge_tails.get(chat_id)
+        if not judge and previous is None:
+            await self.coalescer.submit(job, urgent=rule.urgent)
+            self._record(chat_id, chat_title, message, "push", hit)
+            return
+
+        # 判定放在后台任务里，handle 立即返回：逐条调用 handle 的回补和 worker 不会每条都等满预算。
+        # 同一 chat 的后续消息（包括不判定的）排在前一个任务之后提交，保持顺序
+        task = asyncio.create_task(
+            self._judge_and_submit(previous, chat_id, chat_title, message, hit, job, rule.urgent, judge)
+        )
+        self._judge_tails[chat_id] = task
+        self._judge_pending.add(task)
+        task.add_done_callback(functools.partial(self._judge_done, chat_id))
+        if len(self._judge_pending) > self.judging.max_pending:
+            # 下游堵塞时任务会越积越多：超过上限就在这里等，和不判定时一样把背压传回接收端
+            await asyncio.wait({task})
+
+    async def _judge_and_submit(
+        self,
+        previous: asyncio.Task[None] | None,
+        chat_id: int,
+        chat_title: str,
+        message: Message,
+        hit: str | None,
+        job: DeliveryJob,
+        urgent: bool,
+        judge: bool,
+    ) -> None:
+        verdict = None
+        if judge:
+            # 预算内拿不到判定（超时、出错、积压）就按原样推送，不为判定推迟告警
+            verdict = await self.judging.verdict(chat_id, message.message)
+        if previous is not None:
+            await asyncio.wait({previous})
+        if verdict is not None and verdict.confidence >= self.cfg.judge_min_confidence:
+            if verdict.should_push:
+                job.title = PRIORITY_TITLE_PREFIX + job.title
+            elif self.cfg.judge_suppress:
+                self.metrics.judge_suppressed.inc(chat_title)
+                log.info(
+                    "judge drop",
+                    extra={
+                        "event": "judge_drop",
+                        "chat": chat_title,
+                        "msg_id": message.msg_id,
+                        "confidence": verdict.confidence,
+                        "reason": verdict.reason,
+                    },
+                )
+                self._record(chat_id, chat_title, message, "judge_drop", hit)
+                return
+        await self.coalescer.submit(job, urgent=urgent)
+        self._record(chat_id, chat_title, message, "push", hit)
+
+    def _judge_done(self, chat_id: int, task: asyncio.Task[None]) -> None:
+        self._judge_pending.discard(task)
+        if self._judge_tails.get(chat_id) is task:
+            del self._judge_tails[chat_id]
+        if not task.cancelled() and task.exception() is not None:
+            log.error(
+                "judged push failed: %s",
+                task.exception(),
+                extra={"event": "judge_error", "chat_id": chat_id},
+            )
+
+    def _record(
+        self, chat_id: int, chat_title: str, message: Message, decision: str, hit: str | None
+    ) -> None:
+        if self.archive is None and self.search is None:
+            return
+        # 只入队，压缩、解析和写盘都在各自的后台线程里做
+        record = {
+            "ts": time.time(),
+            "chat_id": chat_id,
+            "chat": chat_title,
+            "msg_id": message.msg_id,
+            "date": message.date,
+            "message": message.message,
+            "media_url": message.media_url,
+            "media_description": message.media_description,
+            "decision": decision,
+            "hit": hit,
+        }
+        if self.archive is not None:
+            self.archive.append(record)
+        if self.search is not None:
+            self.search.add(record)
+
+    def route(self, chat_id: int) -> tuple[str, ...]:
+        rule = self.chat_rule_by_id.get(chat_id)
+        names = rule.sinks if rule is not None and rule.sinks is not None else self.default_sinks
+        known = tuple(name for name in names if name in self.queues)
+        if len(known) != len(names):
+            # 热加载的配置可能引用了启动时不存在的 sink（sink 定义只在启动时读取）
+            log.warning(
+                "ignoring unknown sinks",
+                extra={"event": "route_unknown_sink", "chat_id": chat_id, "sinks": list(names)},
+            )
+        return known
+
+    async def _enqueue(self, job: DeliveryJob, sinks: tuple[str, ...] | None = None) -> None:
+        if sinks is None:
+            sinks = self.route(job.chat_id)
+        jobs = [dataclasses.replace(job, sink=name) for name in sinks]
+        # 先落盘再投递：进程重启或重试耗尽后，未送达的推送仍可从 outbox 找回
+        if self.outbox is not None:
+            await asyncio.gather(*(self.outbox.add(sink_job) for sink_job in jobs))
+        # 各 sink 并发入队，一个 sink 的队列满（block 策略）不会推迟其他 sink 收到副本
+        await asyncio.gather(*(self.queues[sink_job.sink].put(sink_job) for sink_job in jobs))
+
+    async def _send(self, sink: Sink, job: DeliveryJob) -> None:
+        started = time.monotonic()
+        try:
+            await sink.send(job)
+        except CircuitOpenError as exc:
+            # 熔断只说明 PushPlus 暂时不可用，不算死信：记录保持 pending，等熔断器允许探测后重新入队
+            self.metrics.send_duration.observe(time.monotonic() - started, sink.name)
+            log.warning(
+                "push deferred: %s",
+                exc,
+                extra={"event": "push_deferred", "sink": sink.name, "chat_id": job.chat_id},
+            )
+            task = asyncio.create_task(self._requeue_later(job))
+            self._deferred.add(task)
+            task.add_done_callback(self._deferred.discard)
+            return
+        except Exception as exc:
+            self.metrics.send_duration.observe(time.monotonic() - started, sink.name)
+            self.metrics.send_failures.inc(sink.name)
+            if self.outbox is not None:
+                self.outbox.mark_dead(job.outbox_id, str(exc))
+            raise
+        latency = time.monotonic() - started
+        self.metrics.send_duration.observe(latency, sink.name)
+        self.metrics.sent.inc(sink.name)
+        e2e = max(0.0, time.time() - job.origin_ts) if job.origin_ts is not None else None
+        if e2e is not None:
+            self.metrics.e2e_latency.observe(e2e, sink.name)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "push sent",
+                extra={
+                    "event": "push_sent",
+                    "sink": sink.name,
+                    "chat_id": job.chat_id,
+                    "latency_ms": round(latency * 1000, 1),
+                    "e2e_ms": round(e2e * 1000, 1) if e2e is not None else None,
+                },
+            )
+        if self.outbox is not None:
+            self.outbox.mark_done(job.outbox_id)
+
+    async def _requeue_later(self, job: DeliveryJob) -> None:
+        await asyncio.sleep(self.cfg.pushplus_breaker_reset_seconds)
+        await self.queues[job.sink].put(job)
+
+    def _queue_depths(self) -> list[tuple[tuple[str, ...], float]]:
+        depths: list[tuple[tuple[str, ...], float]] = [
+            ((f"sink-{name}",), queue.qsize()) for name, queue in self.queues.items()
+        ]
+        depths.append((("coalescer",), self.coalescer.pending()))
+        return depths
+
+    def _guard_values(
+        self, read: Callable[[TokenBucket, CircuitBreaker], float]
+    ) -> list[tuple[tuple[str, ...], float]]:
+        # 共享限流器和熔断器的 sink 各报一份同样的值，按 sink 查看时不必知道谁和谁共享
+        return [
+            ((name,), read(sink.limiter, sink.breaker))
+            for name, sink in self.sinks.items()
+            if isinstance(sink, PushPlusSink)
+        ]
+
+    async def _save_dedup_periodically(self) -> None:
+        path = self.cfg.data_dir / DEDUP_FILENAME
+        while True:
+            await asyncio.sleep(DEDUP_SAVE_INTERVAL_SECONDS)
+            # 快照在事件循环内生成，写文件放到线程中
+            await asyncio.to_thread(write_snapshot, path, self.dedup.snapshot())
+
+    def _on_drop(self, job: DeliveryJob) -> None:
+        self.metrics.queue_dropped.inc(job.sink)
+        if self.outbox is not None:
+            self.outbox.mark_dead(job.outbox_id, f"dropped: {job.sink} queue full")
+
+    def _on_shed(self, job: DeliveryJob) -> None:
+        self.metrics.queue_shed.inc(job.sink)
+        if self.outbox is not None:
+            self.outbox.mark_dead(job.outbox_id, f"shed: waited in {job.sink} queue too long")
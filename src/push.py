@@ -1,50 +1,203 @@
 import asyncio
+import heapq
 import html
+import itertools
+import time
+from typing import Callable
+
 import httpx
 
 from .config import Config
-from .format import Message, is_6551_message, parse_message
+from .format import Message, is_6551_message, iter_events
+from .log import get_logger
 
 
 PUSHPLUS_API_URL = "https://www.pushplus.plus/send"
 PUSHPLUS_MAX_RETRIES = 3
 PUSHPLUS_RETRY_BASE_DELAY_SECONDS = 1.0
 
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+# tg_forwarder_breaker_state 指标里各状态的取值
+BREAKER_STATE_VALUES = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+log = get_logger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    """Shared async token bucket: ``rate`` tokens per second, up to ``burst``.
+
+    Waiters take tokens in order of ``priority`` (lower first), then arrival.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        if burst < 1:
+            raise ValueError("burst must be >= 1")
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._busy = False
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._arrivals = itertools.count()
+        self.total_wait_seconds = 0.0
+        self.waits = 0
+
+    async def _enter(self, priority: int) -> None:
+        if not self._busy and not self._waiters:
+            self._busy = True
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # 已轮到自己却被取消：把令牌机会交给下一个等待者
+            if fut.done() and not fut.cancelled():
+                self._leave()
+            raise
+
+    def _leave(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._busy = False
+
+    async def acquire(self, priority: int = 0) -> float:
+        """Take one token, sleeping until one is available; returns the wait."""
+        # 同一时间只有一个等待者在取令牌，其余按优先级和到达顺序排队
+        await self._enter(priority)
+        try:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+
+            wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+            self._tokens = 0.0
+            self._updated = self._clock()
+            self.total_wait_seconds += wait
+            self.waits += 1
+            return wait
+        finally:
+            self._leave()
+
+
+class CircuitBreaker:
+    """Open after ``failure_threshold`` consecutive failures; probe after ``reset_timeout``."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be >= 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = BREAKER_CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+        self._probe_started_at: float | None = None
+
+    def allow(self) -> bool:
+        if self.state == BREAKER_CLOSED:
+            return True
+
+        now = self._clock()
+        if self.state == BREAKER_OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self._set_state(BREAKER_HALF_OPEN)
+
+        # 半开状态只放行一个探测请求；探测被取消而未回报时，超时后允许重新探测
+        if self._probe_started_at is not None and now - self._probe_started_at < self.reset_timeout:
+            return False
+        self._probe_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._probe_started_at = None
+        if self.state != BREAKER_CLOSED:
+            self._set_state(BREAKER_CLOSED)
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_started_at = None
+        if self.state == BREAKER_HALF_OPEN or (
+            self.state == BREAKER_CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self._opened_at = self._clock()
+            self.times_opened += 1
+            self._set_state(BREAKER_OPEN)
+
+    def _set_state(self, state: str) -> None:
+        log.warning(
+            "circuit breaker %s -> %s",
+            self.state,
+            state,
+            extra={"event": "breaker", "consecutive_failures": self.consecutive_failures},
+        )
+        self.state = state
+
+
 def _safe_text(s: object) -> str:
     return html.escape(str(s), quote=False).replace("\n", "<br>")
 
 def build_pushplus_payload(chat_title: str, message: Message) -> tuple[str, str]:
-    if is_6551_message(message.message):
-        parsed = parse_message(message.message)
+    # 只用第一个事件：iter_events 逐块解析，取到第一块即停止，批量消息不必整体解析
+    event = next(iter_events(message.message), None) if is_6551_message(message.message) else None
+    if event is not None:
+        title = f"{event.username} [{event.event}]"
 
-        title = f"{parsed[0]['username']} [{parsed[0]['event']}]"
-
-        if parsed[0]["event"] == "新推文":
+        if event.event == "新推文":
             parts = [
-                f"{parsed[0]['data']['tweet']}",
+                f"{event.tweet}",
             ]
-        elif parsed[0]["event"] == "新推文回复":
+        elif event.event == "新推文回复":
             parts = [
-                f"上文内容:\n{parsed[0]['data']['parent']}",
-                f"回帖内容:\n{parsed[0]['data']['reply']}",
+                f"上文内容:\n{event.parent}",
+                f"回帖内容:\n{event.reply}",
             ]
-        elif parsed[0]["event"] == "新关注动态":
-            followed_users = "\n".join(parsed[0]["data"]["followed_users"])
+        elif event.event == "新关注动态":
+            followed_users = "\n".join(event.followed_users)
             parts = [
                 f"关注用户:\n{followed_users}",
             ]
-        elif parsed[0]["event"] == "删除推文回复":
+        elif event.event == "删除推文回复":
             parts = [
-                f"上文内容:\n{parsed[0]['data']['parent']}",
-                f"回帖内容:\n{parsed[0]['data']['reply']}",
+                f"上文内容:\n{event.parent}",
+                f"回帖内容:\n{event.reply}",
             ]
-        elif parsed[0]["event"] == "删除推文":
+        elif event.event == "删除推文":
             parts = [
                 f"",
             ]
-        elif parsed[0]["event"] == "新推文引用":
+        elif event.event == "新推文引用":
             parts = [
-                f"引用内容:\n{parsed[0]['data']['quote']}",
+                f"引用内容:\n{event.quote}",
             ]
         else:
             parts = [
@@ -73,36 +226,76 @@ def build_pushplus_payload(chat_title: str, message: Message) -> tuple[str, str]
     return title, content
 
 
+def build_digest_payload(items: list[tuple[str, str]]) -> tuple[str, str]:
+    # 合并多条推送：标题取第一条并标注条数，正文每条一个小节
+    if len(items) == 1:
+        return items[0]
+
+    title = f"{items[0][0]} (+{len(items) - 1})"
+    sections = [
+        f"<h4>{_safe_text(item_title)}</h4>{item_content}"
+        for item_title, item_content in items
+    ]
+    content = "<hr>".join(sections)
+    return title, content
+
+
 async def pushplus_send(
     http_client: httpx.AsyncClient,
     cfg: Config,
     title: str,
     content: str,
+    limiter: TokenBucket | None = None,
+    breaker: CircuitBreaker | None = None,
+    api_url: str = PUSHPLUS_API_URL,
+    token: str | None = None,
+    channel: str = "app",
+    max_retries: int | None = None,
+    retry_base_delay: float | None = None,
+    on_retry: Callable[[], None] | None = None,
+    priority: int = 0,
 ) -> None:
     payload = {
-        "token": cfg.pushplus_token,
+        "token": token or cfg.pushplus_token,
         "title": title,
         "content": content,
         "template": "html",
-        "channel": "app",
+        "channel": channel,
     }
+    if max_retries is None:
+        max_retries = PUSHPLUS_MAX_RETRIES
+    if retry_base_delay is None:
+        retry_base_delay = PUSHPLUS_RETRY_BASE_DELAY_SECONDS
     last_error: Exception | None = None
 
-    for attempt in range(1, PUSHPLUS_MAX_RETRIES + 1):
+    for attempt in range(1, max_retries + 1):
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(
+                f"PushPlus circuit open after {breaker.consecutive_failures} failures: {last_error}"
+            ) from last_error
+        if limiter is not None:
+            await limiter.acquire(priority)
+
         try:
-            resp = await http_client.post(PUSHPLUS_API_URL, json=payload)
+            resp = await http_client.post(api_url, json=payload)
             resp.raise_for_status()
             data = resp.json()
             if data.get("code") != 200:
                 raise RuntimeError(f"PushPlus failed: {data}")
+            if breaker is not None:
+                breaker.record_success()
             return
-        except (httpx.HTTPError, RuntimeError) as exc:
+        except (httpx.HTTPError, RuntimeError, ValueError) as exc:
             last_error = exc
-            if attempt == PUSHPLUS_MAX_RETRIES:
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt == max_retries:
                 break
-            backoff = PUSHPLUS_RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1))
+            if on_retry is not None:
+                on_retry()
+            backoff = retry_base_delay * (2 ** (attempt - 1))
             await asyncio.sleep(backoff)
 
     raise RuntimeError(
-        f"PushPlus failed after {PUSHPLUS_MAX_RETRIES} attempts: {last_error}"
+        f"PushPlus failed after {max_retries} attempts: {last_error}"
     ) from last_error
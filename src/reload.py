@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from .config import ChatFilter, _check_session_pins, _check_sink_routes, _load_chat_filters_from_json
+from .log import get_logger
+
+
+log = get_logger(__name__)
+
+ApplyFunc = Callable[[dict[str, ChatFilter]], Awaitable[None]]
+
+
+def _stat_key(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class FilterWatcher:
+    """Poll the filter file and hand every valid new version to ``apply``.
+
+    Invalid edits are reported and ignored, so the running rule set stays in
+    place until the file is fixed. With ``sink_names`` / ``session_names``
+    given, per-chat ``sinks`` routes and ``session`` pins must name a sink or
+    session that exists in the running process.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        apply: ApplyFunc,
+        interval_seconds: float = 5.0,
+        sink_names: set[str] | None = None,
+        session_names: set[str] | None = None,
+    ) -> None:
+        self.path = path
+        self._apply = apply
+        self._interval = interval_seconds
+        self._sink_names = sink_names
+        self._session_names = session_names
+        self._last_key = _stat_key(path)
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run(), name="filter-watcher")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def check(self) -> bool:
+        """Reload if the file changed since the last check; returns True if applied."""
+        key = _stat_key(self.path)
+        if key is None or key == self._last_key:
+            return False
+        self._last_key = key
+
+        try:
+            chat_filters = _load_chat_filters_from_json(self.path)
+            # sink 和会话只在启动时建立，热加载不会新增：路由和固定会话只能指向已有的
+            if self._sink_names is not None:
+                _check_sink_routes(chat_filters, self._sink_names, [])
+            if self._session_names is not None:
+                _check_session_pins(chat_filters, self._session_names)
+        except ValueError as exc:
+            log.warning(
+                "keeping current rules, invalid filter config: %s",
+                exc,
+                extra={"event": "reload_invalid", "path": str(self.path)},
+            )
+            return False
+
+        await self._apply(chat_filters)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.check()
+            except Exception as exc:
+                log.error("reload failed: %s", exc, exc_info=True, extra={"event": "reload_error"})
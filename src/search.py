@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+from .archive import _parse_time
+from .config import resolve_data_dir
+from .format import iter_events
+from .log import get_logger
+
+
+SEARCH_FILENAME = "search.sqlite3"
+SEARCH_BATCH_SIZE = 512
+# trigram 分词器的查询词至少 3 个字符才能走索引，更短的词退化为 LIKE 扫描
+MIN_INDEXED_TERM_CHARS = 3
+
+log = get_logger(__name__)
+
+# 每条消息的每个 6551 事件一行（普通消息一行，event 为空）；
+# 元数据走 B-tree 索引，文本走 FTS5，两者以 rowid 关联
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    chat_id INTEGER NOT NULL,
+    chat TEXT NOT NULL,
+    msg_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    username TEXT NOT NULL COLLATE NOCASE,
+    grp TEXT NOT NULL,
+    decision TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_chat_msg ON messages (chat_id, msg_id, seq);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+CREATE INDEX IF NOT EXISTS messages_event_ts ON messages (event, ts);
+CREATE INDEX IF NOT EXISTS messages_username_ts ON messages (username, ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, media_description, username, grp, event, tokenize = 'trigram'
+);
+"""
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def index_rows(record: dict[str, Any]) -> Iterator[tuple[int, str, str, str, str]]:
+    """``(seq, event, username, group, content)`` for every event of an archived record."""
+    text = record.get("message") or ""
+    found = False
+    for seq, event in enumerate(iter_events(text)):
+        found = True
+        parts = [event.tweet, event.parent, event.reply, event.quote, event.raw]
+        if event.followed_users:
+            parts.append("\n".join(event.followed_users))
+        content = "\n".join(part for part in parts if part)
+        yield seq, event.event, event.username, event.group, content
+    if not found:
+        yield 0, "", "", "", text
+
+
+class SearchIndex:
+    """SQLite FTS5 index of received messages and their parsed 6551 fields.
+
+    Like the outbox, every write goes through one background thread that
+    drains the queue and inserts a whole batch in one transaction. Parsing
+    also happens on that thread, so :meth:`add` costs the event loop only a
+    queue put.
+    """
+
+    def __init__(self, path: Path, batch_size: int = SEARCH_BATCH_SIZE) -> None:
+        self.path = path
+        self._batch_size = batch_size
+        self._conn = _connect(path)
+        self._records: queue.SimpleQueue[dict[str, Any] | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._writer, name="search-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, record: dict[str, Any]) -> None:
+        """Queue an archive record (see ``Pipeline._record``); never blocks."""
+        self._records.put(record)
+
+    async def close(self) -> None:
+        if self._thread is not None:
+            self._records.put(None)
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        self._conn.close()
+
+    def _writer(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._records.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._records.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+            if batch:
+                self._apply(batch)
+
+    def _apply(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            self._conn.execute("BEGIN")
+            for record in batch:
+                for seq, event, username, group, content in index_rows(record):
+                    # 回补可能重复处理同一条消息：已索引的跳过
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO messages"
+                        " (ts, chat_id, chat, msg_id, seq, event, username, grp, decision)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            record["ts"], record["chat_id"], record.get("chat", ""), record["msg_id"],
+                            seq, event, username, group, record.get("decision", ""),
+                        ),
+                    )
+                    if cur.rowcount != 1:
+                        continue
+                    self._conn.execute(
+                        "INSERT INTO messages_fts"
+                        " (rowid, content, media_description, username, grp, event)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (cur.lastrowid, content, record.get("media_description") or "", username, group, event),
+                    )
+            self._conn.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            log.error(
+                "search index write failed: %s",
+                exc,
+                extra={"event": "search_error", "records": len(batch)},
+            )
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search(
+    conn: sqlite3.Connection,
+    terms: list[str] | None = None,
+    event: str | None = None,
+    username: str | None = None,
+    group: str | None = None,
+    chat_id: int | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    limit: int = 50,
+) -> list[dict[str, Any]]:
+    """Newest matching rows first. Every term must occur, case-insensitively, in any text column."""
+    where: list[str] = []
+    params: list[Any] = []
+    long_terms = [term for term in terms or [] if len(term) >= MIN_INDEXED_TERM_CHARS]
+    short_terms = [term for term in terms or [] if term and len(term) < MIN_INDEXED_TERM_CHARS]
+    if long_terms:
+        # 写成子查询：先由 FTS 一次求出命中的 rowid 集合，避免规划器按元数据索引逐行调用 MATCH
+        where.append("m.id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+        params.append(" AND ".join(_phrase(term) for term in long_terms))
+    for term in short_terms:
+        columns = ("f.content", "f.media_description", "f.username", "f.grp")
+        where.append("(" + " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in columns) + ")")
+        params.extend([f"%{_escape_like(term)}%"] * len(columns))
+    for clause, value in (
+        ("m.event = ?", event),
+        ("m.username = ?", username),
+        ("m.grp = ?", group),
+        ("m.chat_id = ?", chat_id),
+        ("m.ts >= ?", since),
+        ("m.ts <= ?", until),
+    ):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+
+    sql = (
+        "SELECT m.ts, m.chat_id, m.chat, m.msg_id, m.event, m.username, m.grp, m.decision,"
+        " f.content, f.media_description"
+        " FROM messages AS m JOIN messages_fts AS f ON f.rowid = m.id"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY m.ts DESC LIMIT ?"
+    params.append(limit)
+    keys = (
+        "ts", "chat_id", "chat", "msg_id", "event", "username", "group", "decision",
+        "content", "media_description",
+    )
+    return [dict(zip(keys, row)) for row in conn.execute(sql, params)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Search received messages by text and 6551 fields.")
+    parser.add_argument(
+        "--db",
+        default=None,
+        help=f"Search index path (default: $DATA_DIR/{SEARCH_FILENAME})",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Count indexed rows by event")
+    query_parser = sub.add_parser("query", help="Find messages; all terms must match")
+    query_parser.add_argument("terms", nargs="*", help="Words or phrases, matched as substrings")
+    query_parser.add_argument("--event", help="6551 event, e.g. 新推文引用")
+    query_parser.add_argument("--user", help="6551 username (case-insensitive)")
+    query_parser.add_argument("--group", help="6551 user group")
+    query_parser.add_argument("--chat-id", type=int)
+    query_parser.add_argument("--since", type=_parse_time, help="Unix seconds, 'YYYY-MM-DD HH:MM' or an age like 7d")
+    query_parser.add_argument("--until", type=_parse_time, help="Unix seconds, 'YYYY-MM-DD HH:MM' or an age like 12h")
+    query_parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    path = Path(args.db) if args.db else resolve_data_dir() / SEARCH_FILENAME
+    if not path.exists():
+        print(f"Search index not found: {path}")
+        return 1
+
+    conn = _connect(path)
+    try:
+        if args.command == "stats":
+            for event, count in conn.execute(
+                "SELECT event, COUNT(*) FROM messages GROUP BY event ORDER BY COUNT(*) DESC"
+            ):
+                print(f"{event or '-'}\t{count}")
+            return 0
+
+        rows = search(
+            conn,
+            terms=args.terms,
+            event=args.event,
+            username=args.user,
+            group=args.group,
+            chat_id=args.chat_id,
+            since=args.since,
+            until=args.until,
+            limit=args.limit,
+        )
+    finally:
+        conn.close()
+    for row in rows:
+        received = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["ts"]))
+        content = " ".join(row["content"].split())
+        print(
+            f"{received}\t{row['chat_id']}\t{row['msg_id']}\t{row['event'] or '-'}"
+            f"\t{row['username'] or '-'}\t{row['decision']}\t{content[:200]}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
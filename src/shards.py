@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Collection, Iterable
+
+from telethon import TelegramClient
+
+from .config import ChatFilter, Config
+from .dedup import SeenMessages
+from .entity_cache import EntityCache
+from .filters import CompiledRule
+from .ingest import TelegramIngest
+from .log import get_logger
+from .pipeline import Pipeline
+from .watermark import WatermarkStore
+
+
+RECONNECT_BASE_DELAY_SECONDS = 5.0
+RECONNECT_MAX_DELAY_SECONDS = 300.0
+SEEN_MAX_ENTRIES = 10000
+
+log = get_logger(__name__)
+
+
+def _score(chat: str, session: str) -> int:
+    digest = hashlib.blake2b(f"{session}\x00{chat}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def rank_sessions(chat: str, sessions: Iterable[str], pinned: str | None = None) -> list[str]:
+    """Sessions in the order they should own ``chat``: the pinned one, then by rendezvous hash."""
+    # 最高随机权重哈希：某个会话掉线时只有它的 chat 需要迁移，恢复后也只迁回这些
+    ranked = sorted(sessions, key=lambda name: _score(chat, name), reverse=True)
+    if pinned in ranked:
+        ranked.remove(pinned)
+        ranked.insert(0, pinned)
+    return ranked
+
+
+def assign_chats(
+    chat_filters: dict[str, ChatFilter],
+    healthy: Collection[str],
+    unavailable: dict[str, set[str]],
+) -> dict[str, str]:
+    """Chat → session; chats that no healthy session can read are left out."""
+    assignment: dict[str, str] = {}
+    for chat, chat_filter in chat_filters.items():
+        excluded = unavailable.get(chat, set())
+        for session in rank_sessions(chat, healthy, chat_filter.session):
+            if session not in excluded:
+                assignment[chat] = session
+                break
+    return assignment
+
+
+@dataclass
+class Shard:
+    name: str
+    client: TelegramClient
+    ingest: TelegramIngest
+    healthy: bool = True
+    supervisor: asyncio.Task[None] | None = None
+
+
+class ShardedIngest:
+    """Several Telegram sessions feeding one pipeline, with the chats partitioned across them.
+
+    When a session disconnects, its chats move to the remaining sessions and
+    catch up from their watermarks; when it reconnects they move back. A
+    message received by two sessions during a move is handled once.
+    """
+
+    def __init__(self, cfg: Config, pipeline: Pipeline, watermarks: WatermarkStore) -> None:
+        self.cfg = cfg
+        self.pipeline = pipeline
+        self.watermarks = watermarks
+        self.seen = SeenMessages(SEEN_MAX_ENTRIES)
+        self.shards: dict[str, Shard] = {}
+        self.chat_filters: dict[str, ChatFilter] = {}
+        self.owner_by_chat: dict[str, str] = {}
+        # 会话解析失败的 chat（如该账号未加入的私有群）不再分给这个会话
+        self._unavailable: dict[str, set[str]] = {}
+        self._lock = asyncio.Lock()
+        self._started = False
+        self._stopping = False
+        self._done = asyncio.Event()
+
+    def add_session(self, name: str, client: TelegramClient, entity_cache: EntityCache | None) -> None:
+        ingest = TelegramIngest(
+            self.cfg,
+            client,
+            self.pipeline,
+            self.watermarks,
+            entity_cache,
+            session=name,
+            seen=self.seen,
+            on_publish=self._publish,
+        )
+        self.shards[name] = Shard(name=name, client=client, ingest=ingest)
+        self.pipeline.metrics.session_up.set(1, name)
+
+    def _publish(self) -> None:
+        chat_title_by_id: dict[int, str] = {}
+        chat_rule_by_id: dict[int, CompiledRule] = {}
+        for shard in self.shards.values():
+            chat_title_by_id.update(shard.ingest.chat_title_by_id)
+            chat_rule_by_id.update(shard.ingest.chat_rule_by_id)
+        self.pipeline.update_chats(chat_title_by_id, chat_rule_by_id)
+
+    async def start(self, chat_filters: dict[str, ChatFilter]) -> None:
+        """Assign, resolve and backfill every chat; raises ValueError if no session can read one."""
+        async with self._lock:
+            self.chat_filters = chat_filters
+            await self._rebalance()
+            self._started = True
+        missing = [chat for chat in chat_filters if chat not in self.owner_by_chat]
+        if missing:
+            raise ValueError(f"Invalid chat entry: {', '.join(missing)}")
+
+        for shard in self.shards.values():
+            shard.ingest.start_revalidation()
+            shard.supervisor = asyncio.create_task(
+                self._supervise(shard), name=f"session-{shard.name}"
+            )
+
+    async def apply_filters(self, chat_filters: dict[str, ChatFilter]) -> None:
+        async with self._lock:
+            self.chat_filters = chat_filters
+            # 重新加载配置时给之前拒绝过的会话一次重试机会
+            self._unavailable = {}
+            await self._rebalance()
+
+    async def run(self) -> None:
+        """Block until :meth:`stop` is called or every session is down."""
+        await self._done.wait()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._done.set()
+        for shard in self.shards.values():
+            await shard.client.disconnect()
+
+    async def close(self) -> None:
+        self._stopping = True
+        for shard in self.shards.values():
+            if shard.supervisor is not None:
+                shard.supervisor.cancel()
+                await asyncio.gather(shard.supervisor, return_exceptions=True)
+                shard.supervisor = None
+            await shard.ingest.close()
+            await shard.client.disconnect()
+
+    async def _rebalance(self) -> None:
+        owners = dict(self.owner_by_chat)
+        assignment: dict[str, str] = {}
+        # 被某个会话拒绝的 chat 在下一轮交给排名其后的会话；分配中途掉线的会话也在下一轮让出 chat
+        for _ in range(len(self.shards) + 1):
+            healthy = [name for name, shard in self.shards.items() if shard.healthy]
+            assignment = assign_chats(self.chat_filters, healthy, self._unavailable)
+            await asyncio.gather(
+                *(self._assign(shard, assignment, owners) for shard in self.shards.values())
+            )
+            taken = {
+                chat: name
+                for chat, name in assignment.items()
+                if chat in self.shards[name].ingest.entity_by_chat
+            }
+            owners.update(taken)
+            failed = False
+            for chat, name in assignment.items():
+                if chat in taken:
+                    continue
+                failed = True
+                if self.shards[name].healthy:
+                    self._unavailable.setdefault(chat, set()).add(name)
+            if not failed:
+                break
+
+        self.owner_by_chat = {
+            chat: name
+            for chat, name in assignment.items()
+            if chat in self.shards[name].ingest.entity_by_chat
+        }
+        unassigned = [chat for chat in self.chat_filters if chat not in self.owner_by_chat]
+        if unassigned and self._started and any(shard.healthy for shard in self.shards.values()):
+            log.error(
+                "no session can read these chats",
+                extra={"event": "session_unassigned", "chats": unassigned},
+            )
+        for name in self.shards:
+            count = sum(1 for owner in self.owner_by_chat.values() if owner == name)
+            self.pipeline.metrics.session_chats.set(count, name)
+
+    async def _assign(self, shard: Shard, assignment: dict[str, str], owners: dict[str, str]) -> None:
+        chat_filters = {
+            chat: chat_filter
+            for chat, chat_filter in self.chat_filters.items()
+            if assignment.get(chat) == shard.name
+        }
+        # 启动时所有 chat 都补拉；之后只补拉从其他会话迁来的 chat，热加载新增的 chat 不补拉
+        if self._started:
+            backfill = {chat for chat in chat_filters if owners.get(chat, shard.name) != shard.name}
+        else:
+            backfill = set(chat_filters)
+        try:
+            await shard.ingest.apply_filters(chat_filters, backfill=backfill)
+        except Exception as exc:
+            log.error(
+                "session failed to take chats: %s",
+                exc,
+                exc_info=True,
+                extra={"event": "session_error", "session": shard.name},
+            )
+            self._mark(shard, healthy=False)
+
+    def _mark(self, shard: Shard, healthy: bool) -> None:
+        shard.healthy = healthy
+        self.pipeline.metrics.session_up.set(1 if healthy else 0, shard.name)
+        log.warning(
+            "session %s %s",
+            shard.name,
+            "up" if healthy else "down",
+            extra={"event": "session_up" if healthy else "session_down", "session": shard.name},
+        )
+
+    async def _supervise(self, shard: Shard) -> None:
+        while not self._stopping:
+            # Telethon 自己会重连几次；这个 future 完成说明它已放弃
+            try:
+                await shard.client.disconnected
+            except Exception as exc:
+                log.warning(
+                    "session disconnected: %s",
+                    exc,
+                    extra={"event": "session_error", "session": shard.name},
+                )
+            if self._stopping:
+                return
+            self._mark(shard, healthy=False)
+            async with self._lock:
+                await self._rebalance()
+            if not any(other.healthy for other in self.shards.values()):
+                # 所有会话都断开：和单会话时一样退出，交给容器重启
+                self._done.set()
+                return
+
+            if not await self._reconnect(shard):
+                return
+            self._mark(shard, healthy=True)
+            async with self._lock:
+                await self._rebalance()
+
+    async def _reconnect(self, shard: Shard) -> bool:
+        delay = RECONNECT_BASE_DELAY_SECONDS
+        while not self._stopping:
+            await asyncio.sleep(delay)
+            try:
+                await shard.client.connect()
+                if await shard.client.is_user_authorized():
+                    return True
+                # 会话被注销需要重新登录，自动重连无意义
+                log.error(
+                    "session is no longer authorized; log in again",
+                    extra={"event": "session_unauthorized", "session": shard.name},
+                )
+                await shard.client.disconnect()
+                return False
+            except Exception as exc:
+                log.warning(
+                    "session reconnect failed: %s",
+                    exc,
+                    extra={"event": "session_reconnect", "session": shard.name, "retry_in": delay},
+                )
+            delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+        return False
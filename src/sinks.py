@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import abc
+import asyncio
+import functools
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, TextIO
+
+import httpx
+
+from .config import DEFAULT_SINK, Config, SinkConfig
+from .delivery import DeliveryJob
+from .push import (
+    PUSHPLUS_API_URL,
+    PUSHPLUS_MAX_RETRIES,
+    PUSHPLUS_RETRY_BASE_DELAY_SECONDS,
+    CircuitBreaker,
+    TokenBucket,
+    pushplus_send,
+)
+
+
+class Sink(abc.ABC):
+    """One delivery destination.
+
+    ``cfg`` carries the per-sink queue size, concurrency cap and retry policy;
+    the pipeline gives every sink its own ``DeliveryQueue`` so a slow sink
+    never holds back the others.
+    """
+
+    def __init__(self, cfg: SinkConfig) -> None:
+        self.cfg = cfg
+        self.name = cfg.name
+        self.on_retry: Callable[[], None] | None = None
+
+    @abc.abstractmethod
+    async def send(self, job: DeliveryJob) -> None:
+        """Deliver ``job``; raise once the sink's own retries are exhausted."""
+
+    async def close(self) -> None:
+        pass
+
+
+async def _with_retries(
+    sink: Sink,
+    attempt_once: Callable[[], Awaitable[None]],
+    retry_on: tuple[type[BaseException], ...],
+) -> None:
+    last_error: BaseException | None = None
+    for attempt in range(1, sink.cfg.max_retries + 1):
+        try:
+            await attempt_once()
+            return
+        except retry_on as exc:
+            last_error = exc
+            if attempt == sink.cfg.max_retries:
+                break
+            if sink.on_retry is not None:
+                sink.on_retry()
+            await asyncio.sleep(sink.cfg.retry_base_delay_seconds * (2 ** (attempt - 1)))
+
+    raise RuntimeError(
+        f"Sink {sink.name} failed after {sink.cfg.max_retries} attempts: {last_error}"
+    ) from last_error
+
+
+class PushPlusSink(Sink):
+    def __init__(
+        self,
+        cfg: SinkConfig,
+        app_cfg: Config,
+        http_client: httpx.AsyncClient,
+        limiter: TokenBucket,
+        breaker: CircuitBreaker,
+    ) -> None:
+        super().__init__(cfg)
+        self.app_cfg = app_cfg
+        self.http_client = http_client
+        self.limiter = limiter
+        self.breaker = breaker
+
+    async def send(self, job: DeliveryJob) -> None:
+        await pushplus_send(
+            self.http_client,
+            self.app_cfg,
+            title=job.title,
+            content=job.content,
+            limiter=self.limiter,
+            breaker=self.breaker,
+            api_url=self.cfg.url or PUSHPLUS_API_URL,
+            token=self.cfg.token or None,
+            channel=self.cfg.channel,
+            max_retries=self.cfg.max_retries,
+            retry_base_delay=self.cfg.retry_base_delay_seconds,
+            on_retry=self.on_retry,
+            priority=job.priority,
+        )
+
+
+class WebhookSink(Sink):
+    """POST each push as JSON to ``cfg.url``; any 2xx counts as delivered."""
+
+    def __init__(self, cfg: SinkConfig, http_client: httpx.AsyncClient) -> None:
+        super().__init__(cfg)
+        self.http_client = http_client
+
+    async def send(self, job: DeliveryJob) -> None:
+        payload = {"chat_id": job.chat_id, "title": job.title, "content": job.content}
+        kwargs = {"timeout": self.cfg.timeout_seconds} if self.cfg.timeout_seconds else {}
+
+        async def attempt_once() -> None:
+            resp = await self.http_client.post(
+                self.cfg.url, json=payload, headers=self.cfg.headers, **kwargs
+            )
+            resp.raise_for_status()
+
+        await _with_retries(self, attempt_once, (httpx.HTTPError,))
+
+
+class JsonlFileSink(Sink):
+    """Append each push as one JSON line; writes happen off the event loop."""
+
+    def __init__(self, cfg: SinkConfig, path: Path) -> None:
+        super().__init__(cfg)
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh: TextIO | None = None
+
+    async def send(self, job: DeliveryJob) -> None:
+        line = json.dumps(
+            {"ts": time.time(), "chat_id": job.chat_id, "title": job.title, "content": job.content},
+            ensure_ascii=False,
+        )
+
+        async def attempt_once() -> None:
+            await asyncio.to_thread(self._write, line)
+
+        await _with_retries(self, attempt_once, (OSError,))
+
+    def _write(self, line: str) -> None:
+        with self._lock:
+            if self._fh is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fh = self.path.open("a", encoding="utf-8")
+            try:
+                self._fh.write(line + "\n")
+                self._fh.flush()
+            except OSError:
+                # 句柄可能已失效（文件被移走等），下次重试时重新打开
+                self._fh.close()
+                self._fh = None
+                raise
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+def default_sink_config(cfg: Config) -> SinkConfig:
+    """The built-in ``pushplus`` sink configured from the PUSHPLUS_* / DELIVERY_* env vars."""
+    return SinkConfig(
+        name=DEFAULT_SINK,
+        type="pushplus",
+        concurrency=cfg.delivery_workers,
+        queue_size=cfg.delivery_queue_size,
+        overflow=cfg.delivery_overflow,
+        max_retries=PUSHPLUS_MAX_RETRIES,
+        retry_base_delay_seconds=PUSHPLUS_RETRY_BASE_DELAY_SECONDS,
+        url=cfg.pushplus_api_url,
+        token=cfg.pushplus_token,
+    )
+
+
+def build_sinks(
+    cfg: Config,
+    http_client: httpx.AsyncClient,
+    on_retry: Callable[[str], None] | None = None,
+) -> dict[str, Sink]:
+    sink_cfgs = {DEFAULT_SINK: default_sink_config(cfg), **cfg.sinks}
+
+    # 同一 token + 接口的 PushPlus sink 共享限流器和熔断器：配额和故障都是按账号算的
+    guards: dict[tuple[str, str], tuple[TokenBucket, CircuitBreaker]] = {}
+    sinks: dict[str, Sink] = {}
+    for name, sink_cfg in sink_cfgs.items():
+        if sink_cfg.type == "pushplus":
+            key = (sink_cfg.token or cfg.pushplus_token, sink_cfg.url or PUSHPLUS_API_URL)
+            if key not in guards:
+                guards[key] = (
+                    TokenBucket(cfg.pushplus_rate_per_second, cfg.pushplus_rate_burst),
+                    CircuitBreaker(
+                        failure_threshold=cfg.pushplus_breaker_threshold,
+                        reset_timeout=cfg.pushplus_breaker_reset_seconds,
+                    ),
+                )
+            limiter, breaker = guards[key]
+            sinks[name] = PushPlusSink(sink_cfg, cfg, http_client, limiter, breaker)
+        elif sink_cfg.type == "webhook":
+            sinks[name] = WebhookSink(sink_cfg, http_client)
+        elif sink_cfg.type == "jsonl":
+            path = Path(sink_cfg.path)
+            if not path.is_absolute():
+                path = cfg.data_dir / path
+            sinks[name] = JsonlFileSink(sink_cfg, path)
+        else:
+            raise ValueError(f"Unknown sink type for {name}: {sink_cfg.type}")
+        if on_retry is not None:
+            sinks[name].on_retry = functools.partial(on_retry, name)
+    return sinks
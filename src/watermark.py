@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from .log import get_logger
+
+
+WATERMARKS_FILENAME = "watermarks.json"
+WATERMARK_SAVE_INTERVAL_SECONDS = 5.0
+
+log = get_logger(__name__)
+
+
+def _write_json(path: Path, data: dict[str, int]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class WatermarkStore:
+    """Last processed ``msg_id`` per chat, persisted to a small JSON file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._last: dict[int, int] = {}
+        self._dirty = False
+        self._saver: asyncio.Task[None] | None = None
+        if path.exists():
+            try:
+                raw = json.loads(path.read_text(encoding="utf-8"))
+                self._last = {int(chat_id): int(msg_id) for chat_id, msg_id in raw.items()}
+            except (OSError, ValueError, AttributeError) as exc:
+                log.warning(
+                    "ignoring unreadable watermark file: %s", exc, extra={"path": str(path)}
+                )
+
+    def get(self, chat_id: int) -> int | None:
+        return self._last.get(chat_id)
+
+    def advance(self, chat_id: int, msg_id: int) -> None:
+        if msg_id > self._last.get(chat_id, 0):
+            self._last[chat_id] = msg_id
+            self._dirty = True
+
+    def start(self) -> None:
+        if self._saver is None:
+            self._saver = asyncio.create_task(self._save_periodically())
+
+    def save(self) -> None:
+        _write_json(self.path, {str(k): v for k, v in self._last.items()})
+        self._dirty = False
+
+    async def close(self) -> None:
+        if self._saver is not None:
+            self._saver.cancel()
+            self._saver = None
+        if self._dirty:
+            self.save()
+
+    async def _save_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(WATERMARK_SAVE_INTERVAL_SECONDS)
+            if not self._dirty:
+                continue
+            snapshot = {str(k): v for k, v in self._last.items()}
+            self._dirty = False
+            await asyncio.to_thread(_write_json, self.path, snapshot)
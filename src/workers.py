@@ -0,0 +1,352 @@
+"""Delivery in separate worker processes, fed by the Telegram ingest process.
+
+With ``DELIVERY_PROCESSES`` > 0 the main process keeps the Telegram sessions
+and hands each ``format.Message`` to one of N worker processes over a
+``multiprocessing`` queue; every worker runs its own :class:`Pipeline`
+(filter → render → coalesce → outbox → sinks). Chats are sharded by id, so
+all messages of one chat go to the same worker in the order they were read.
+A worker acknowledges each message once its pipeline has taken it, and only
+then does :meth:`WorkerPool.handle` return and ingest advance the watermark.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import dataclasses
+import itertools
+import multiprocessing
+import queue
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+import httpx
+
+from .config import Config
+from .filters import CompiledRule
+from .format import Message
+from .log import get_logger, setup_logging
+from .metrics import Metrics, MetricsServer
+from .pipeline import Pipeline
+
+
+WORKER_QUEUE_SIZE = 1000
+# 一次从进程队列取出的最大条数：阻塞的 get 在线程里执行，批量取摊薄线程切换的开销
+WORKER_BATCH_SIZE = 100
+WORKER_STOP_TIMEOUT_SECONDS = 30.0
+WORKER_CHECK_INTERVAL_SECONDS = 1.0
+
+log = get_logger(__name__)
+
+_MESSAGE = "message"
+_CHATS = "chats"
+_STOP = "stop"
+
+
+def worker_index(chat_id: int, processes: int) -> int:
+    return chat_id % processes
+
+
+def worker_config(cfg: Config, index: int, processes: int) -> Config:
+    """The config worker ``index`` runs its pipeline with.
+
+    Each worker keeps its outbox and dedup snapshot in ``data_dir/worker-<index>``,
+    serves metrics on ``METRICS_PORT + 1 + index``, and gets an equal share of
+    the PushPlus rate limit so the workers together stay within it.
+    """
+    return dataclasses.replace(
+        cfg,
+        data_dir=cfg.data_dir / f"worker-{index}",
+        metrics_port=cfg.metrics_port + 1 + index if cfg.metrics_port else 0,
+        pushplus_rate_per_second=cfg.pushplus_rate_per_second / processes,
+        pushplus_rate_burst=max(1, cfg.pushplus_rate_burst // processes),
+    )
+
+
+def _worker_main(
+    index: int,
+    cfg: Config,
+    inbox: multiprocessing.Queue[Any],
+    acks: multiprocessing.Queue[Any],
+    chat_title_by_id: dict[int, str],
+    chat_rule_by_id: dict[int, CompiledRule],
+) -> None:
+    # spawn 出的进程不继承日志配置
+    log_listener = setup_logging(cfg.log_level, cfg.log_format, cfg.log_sample_per_second)
+    try:
+        asyncio.run(_worker_run(index, cfg, inbox, acks, chat_title_by_id, chat_rule_by_id))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_listener.stop()
+
+
+async def _worker_run(
+    index: int,
+    cfg: Config,
+    inbox: multiprocessing.Queue[Any],
+    acks: multiprocessing.Queue[Any],
+    chat_title_by_id: dict[int, str],
+    chat_rule_by_id: dict[int, CompiledRule],
+) -> None:
+    loop = asyncio.get_running_loop()
+    timeout = httpx.Timeout(cfg.pushplus_timeout)
+    async with httpx.AsyncClient(timeout=timeout) as http_client:
+        pipeline = Pipeline(cfg, http_client, chat_title_by_id, chat_rule_by_id)
+        await pipeline.start()
+        metrics_server = None
+        if cfg.metrics_port:
+            metrics_server = MetricsServer(pipeline.metrics, cfg.metrics_host, cfg.metrics_port)
+            await metrics_server.start()
+        log.info("delivery worker started", extra={"event": "worker_start", "worker": index})
+        try:
+            while True:
+                batch = [await loop.run_in_executor(None, inbox.get)]
+                try:
+                    while len(batch) < WORKER_BATCH_SIZE:
+                        batch.append(inbox.get_nowait())
+                except queue.Empty:
+                    pass
+                handled: list[int] = []
+                try:
+                    for item in batch:
+                        kind = item[0]
+                        if kind == _MESSAGE:
+                            await pipeline.handle(item[1], item[2])
+                            handled.append(item[3])
+                        elif kind == _CHATS:
+                            pipeline.update_chats(item[1], item[2])
+                        else:
+                            return
+                finally:
+                    # 一批确认一次：handle 返回即与进程内流水线一样已接手这条消息
+                    if handled:
+                        acks.put((index, handled))
+        finally:
+            await pipeline.close()
+            if metrics_server is not None:
+                await metrics_server.close()
+            log.info("delivery worker stopped", extra={"event": "worker_stop", "worker": index})
+
+
+class WorkerPool:
+    """Stands in for :class:`Pipeline` in the ingest process and forwards to worker processes.
+
+    Implements the part of the pipeline interface that ingest uses
+    (``handle``, ``update_chats``, ``metrics``, ``chat_title_by_id``). A worker
+    that exits unexpectedly is restarted on a fresh queue that starts with
+    every message it had not acknowledged, so none is lost, including those
+    the old worker had already taken.
+    """
+
+    def __init__(self, cfg: Config, processes: int) -> None:
+        self.cfg = cfg
+        self.processes = processes
+        # 只含会话相关指标；投递指标由各 worker 进程自己暴露
+        self.metrics = Metrics()
+        self.chat_title_by_id: dict[int, str] = {}
+        self.chat_rule_by_id: dict[int, CompiledRule] = {}
+        # spawn：子进程不继承 Telethon 连接、事件循环和日志线程
+        self._context = multiprocessing.get_context("spawn")
+        self._inboxes: list[multiprocessing.Queue[Any]] = [
+            self._context.Queue(WORKER_QUEUE_SIZE) for _ in range(processes)
+        ]
+        self._workers: list[BaseProcess | None] = [None] * processes
+        # 进程队列满时在本地排队，由每个 worker 一个的发送任务按序写入：
+        # 消息和会话表更新走同一条路径，worker 收到它们的顺序与调用顺序一致
+        self._pending: list[collections.deque[tuple[Any, asyncio.Future[None] | None]]] = [
+            collections.deque() for _ in range(processes)
+        ]
+        self._senders: list[asyncio.Task[None] | None] = [None] * processes
+        # 已写入进程队列、尚未确认的消息，按序号排列；worker 重启时据此重发
+        self._unacked: list[dict[int, tuple[Any, asyncio.Future[None]]]] = [{} for _ in range(processes)]
+        self._seq = itertools.count()
+        self._acks: multiprocessing.Queue[Any] = self._context.Queue()
+        self._ack_reader: asyncio.Task[None] | None = None
+        self._monitor: asyncio.Task[None] | None = None
+        self._closing = False
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index,
+                worker_config(self.cfg, index, self.processes),
+                self._inboxes[index],
+                self._acks,
+                self.chat_title_by_id,
+                self.chat_rule_by_id,
+            ),
+            name=f"delivery-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[index] = process
+
+    async def start(self) -> None:
+        for index in range(self.processes):
+            self._spawn(index)
+        self._ack_reader = asyncio.create_task(self._read_acks())
+        self._monitor = asyncio.create_task(self._watch_workers())
+
+    def update_chats(
+        self,
+        chat_title_by_id: dict[int, str],
+        chat_rule_by_id: dict[int, CompiledRule],
+    ) -> None:
+        self.chat_title_by_id = chat_title_by_id
+        self.chat_rule_by_id = chat_rule_by_id
+        for index in range(self.processes):
+            # 排在已提交的消息之后；之后提交的消息也一定排在它后面，不必等待写入完成
+            self._send(index, (_CHATS, chat_title_by_id, chat_rule_by_id))
+
+    async def handle(self, chat_id: int, message: Message) -> None:
+        """Return once the worker's pipeline has taken ``message``.
+
+        Until then the message may still sit in a process queue, so ingest
+        must not advance the watermark past it; a worker that falls behind
+        makes receiving wait, as with the in-process block policy.
+        """
+        acked = asyncio.get_running_loop().create_future()
+        index = worker_index(chat_id, self.processes)
+        self._send(index, (_MESSAGE, chat_id, message, next(self._seq)), acked)
+        await acked
+
+    def _send(self, index: int, item: Any, acked: asyncio.Future[None] | None = None) -> None:
+        """Put ``item`` on worker ``index``'s queue, behind everything sent before it."""
+        pending = self._pending[index]
+        if not pending:
+            try:
+                self._inboxes[index].put_nowait(item)
+                self._track(index, item, acked)
+                return
+            except queue.Full:
+                pass
+        pending.append((item, acked))
+        self._start_sender(index)
+
+    def _track(self, index: int, item: Any, acked: asyncio.Future[None] | None) -> None:
+        if acked is not None:
+            self._unacked[index][item[3]] = (item, acked)
+
+    def _start_sender(self, index: int) -> None:
+        if self._senders[index] is None and self._pending[index]:
+            self._senders[index] = asyncio.create_task(
+                self._drain(index), name=f"delivery-{index}-sender"
+            )
+
+    async def _drain(self, index: int) -> None:
+        pending = self._pending[index]
+        try:
+            while pending:
+                item, acked = pending[0]
+                inbox = self._inboxes[index]
+                try:
+                    # 阻塞的 put 交给线程等待，不阻塞事件循环；限时等待以便发现 worker 已换了队列
+                    await asyncio.to_thread(inbox.put, item, True, WORKER_CHECK_INTERVAL_SECONDS)
+                except queue.Full:
+                    continue
+                except ValueError:
+                    # 旧队列在 worker 重启时已关闭
+                    if inbox is self._inboxes[index]:
+                        raise
+                    continue
+                if inbox is not self._inboxes[index]:
+                    # 写入期间 worker 被重启：旧队列已丢弃，这条随其余未确认的消息重发
+                    continue
+                pending.popleft()
+                self._track(index, item, acked)
+        except Exception as exc:
+            log.error(
+                "delivery worker queue put failed: %s",
+                exc,
+                extra={"event": "worker_error", "worker": index, "items": len(pending)},
+            )
+            while pending:
+                _, acked = pending.popleft()
+                if acked is not None and not acked.done():
+                    acked.set_exception(exc)
+        finally:
+            self._senders[index] = None
+
+    async def _read_acks(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            acked = await loop.run_in_executor(None, self._acks.get)
+            if acked is None:
+                return
+            index, seqs = acked
+            unacked = self._unacked[index]
+            for seq in seqs:
+                entry = unacked.pop(seq, None)
+                if entry is not None and not entry[1].done():
+                    entry[1].set_result(None)
+
+    def _restart(self, index: int) -> None:
+        # 已被旧 worker 取走但没处理完的消息只能从这里找回：换一个新队列，
+        # 先按序放入所有未确认的消息，旧队列里剩下的不再读取，也就不会重复
+        old_inbox = self._inboxes[index]
+        self._inboxes[index] = self._context.Queue(WORKER_QUEUE_SIZE)
+        unacked = self._unacked[index]
+        self._unacked[index] = {}
+        self._pending[index].extendleft(reversed(list(unacked.values())))
+        old_inbox.close()
+        old_inbox.cancel_join_thread()
+        self._spawn(index)
+        self._start_sender(index)
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        await asyncio.gather(*(sender for sender in self._senders if sender is not None))
+        # 停止信号排在已入队的消息之后，worker 处理完积压再退出
+        for index, inbox in enumerate(self._inboxes):
+            try:
+                await asyncio.to_thread(inbox.put, (_STOP,), True, WORKER_STOP_TIMEOUT_SECONDS)
+            except queue.Full:
+                log.error(
+                    "delivery worker queue is still full at shutdown",
+                    extra={"event": "worker_error", "worker": index},
+                )
+        for index, process in enumerate(self._workers):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, WORKER_STOP_TIMEOUT_SECONDS)
+            if process.is_alive():
+                log.error(
+                    "delivery worker did not stop in time",
+                    extra={"event": "worker_error", "worker": index},
+                )
+                process.terminate()
+                await asyncio.to_thread(process.join)
+            self._workers[index] = None
+        for inbox in self._inboxes:
+            # worker 都已退出，残留数据没有读者，不等后台线程写完
+            inbox.close()
+            inbox.cancel_join_thread()
+        if self._ack_reader is not None:
+            # worker 退出前已把确认写完，读完它们再停
+            self._acks.put(None)
+            await self._ack_reader
+            self._ack_reader = None
+        self._acks.close()
+        # 仍未确认的消息不推进水位：取消等待中的 handle，下次启动由回补补上
+        for unacked in self._unacked:
+            for _, acked in unacked.values():
+                acked.cancel()
+            unacked.clear()
+
+    async def _watch_workers(self) -> None:
+        while not self._closing:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL_SECONDS)
+            for index, process in enumerate(self._workers):
+                if self._closing or process is None or process.is_alive():
+                    continue
+                log.error(
+                    "delivery worker exited with code %s; restarting",
+                    process.exitcode,
+                    extra={"event": "worker_error", "worker": index},
+                )
+                self._restart(index)
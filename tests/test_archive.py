@@ -0,0 +1,87 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from pathlib import Path
+
+import httpx
+
+from src.archive import ARCHIVE_DIRNAME, DATA_SUFFIX, MessageArchive, find, list_segments
+from src.config import ChatFilter, Config, SinkConfig
+from src.filters import compile_rule
+from src.format import Message
+from src.pipeline import Pipeline
+
+
+def test_pipeline_archives_every_message_with_its_decision(tmp_path: Path) -> None:
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=[], chat_filters={},
+        pushplus_token="", pushplus_timeout=5, data_dir=tmp_path,
+        outbox_enabled=False, archive_enabled=True, dedup_enabled=True,
+        sinks={"file": SinkConfig(name="file", type="jsonl", path=str(tmp_path / "out.jsonl"))},
+        default_sinks=["file"],
+    )
+    rule = compile_rule(ChatFilter(mode="deny", keywords=["广告"]))
+
+    async def run() -> None:
+        async with httpx.AsyncClient() as client:
+            pipeline = Pipeline(cfg, client, {1: "alerts"}, {1: rule})
+            await pipeline.start()
+            await pipeline.handle(1, Message(msg_id=10, time="", message="ETF approved"))
+            await pipeline.handle(1, Message(msg_id=11, time="", message="广告 推广"))
+            await pipeline.handle(1, Message(msg_id=12, time="", message="ETF approved"))
+            await pipeline.queues["file"].join()
+            await pipeline.close()
+            text = pipeline.metrics.render()
+            assert "tg_forwarder_dedup_hits_total 1" in text
+            assert "tg_forwarder_dedup_misses_total 1" in text
+
+    asyncio.run(run())
+    directory = tmp_path / ARCHIVE_DIRNAME
+    records = list(find(directory, chat_id=1))
+    assert [(r["msg_id"], r["decision"]) for r in records] == [
+        (10, "push"), (11, "filter_drop"), (12, "dedup_drop"),
+    ]
+    assert records[1]["message"] == "广告 推广" and records[1]["hit"] == "广告"
+    assert [r["msg_id"] for r in find(directory, chat_id=1, msg_id=11)] == [11]
+    assert list(find(directory, chat_id=2)) == []
+
+
+def test_archive_rotates_looks_up_by_index_and_enforces_caps(tmp_path: Path) -> None:
+    archive = MessageArchive(
+        tmp_path, segment_max_bytes=1, max_total_bytes=10**9, batch_size=2, flush_interval=0.5
+    )
+    # 接收时间总早于写入时间，测试数据放在过去
+    now = time.time() - 60
+
+    async def run() -> None:
+        archive.start()
+        for i in range(6):
+            archive.append({"ts": now + i, "chat_id": -100 - i % 2, "msg_id": i, "message": f"m{i}"})
+        await archive.close()
+
+    asyncio.run(run())
+    # 每批一个 gzip 块，超过分段大小即换段：3 批 → 3 段，整段可直接 gunzip
+    segments = list_segments(tmp_path)
+    assert len(segments) == 3
+    lines = gzip.decompress((tmp_path / f"{segments[0]}{DATA_SUFFIX}").read_bytes()).splitlines()
+    assert [json.loads(line)["msg_id"] for line in lines] == [0, 1]
+
+    assert [r["msg_id"] for r in find(tmp_path, chat_id=-101, msg_id=3)] == [3]
+    assert [r["msg_id"] for r in find(tmp_path, since=now + 2, until=now + 4)] == [2, 3, 4]
+    assert [r["msg_id"] for r in find(tmp_path, chat_id=-100, since=now + 1)] == [2, 4]
+
+    # 总大小上限只留下当前段；保留期过后旧段也会在换段时删除
+    capped = MessageArchive(tmp_path, segment_max_bytes=1, max_total_bytes=1, batch_size=1)
+    capped._rotate(time.time() + 1)
+    capped._close_segment()
+    assert len(list_segments(tmp_path)) == 1
+
+    (remaining,) = list_segments(tmp_path)
+    old = time.time() - 3600
+    os.utime(tmp_path / f"{remaining}.idx", (old, old))
+    expiring = MessageArchive(tmp_path, retention_seconds=60, batch_size=1)
+    expiring._rotate(time.time() + 2)
+    expiring._close_segment()
+    assert list_segments(tmp_path) != [remaining]
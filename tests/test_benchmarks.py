@@ -0,0 +1,37 @@
+from benchmarks.bench_pipeline import compare
+from benchmarks.corpus import KIND_MULTI, KIND_PLAIN, KIND_UNKNOWN, KIND_WEIGHTS, make_corpus
+from src.format import is_6551_message, parse_message
+
+
+def test_corpus_covers_every_event_type() -> None:
+    corpus = make_corpus(50, seed=1)
+    assert {item.kind for item in corpus} == set(KIND_WEIGHTS)
+    assert make_corpus(50, seed=1) == corpus
+
+    for item in corpus:
+        if item.kind == KIND_PLAIN:
+            assert not is_6551_message(item.text)
+            continue
+        parsed = parse_message(item.text)
+        if item.kind == KIND_MULTI:
+            assert len(parsed) >= 2
+        elif item.kind == KIND_UNKNOWN:
+            assert parsed[0]["data"] == {"raw": item.text}
+        else:
+            assert parsed[0]["event"] == item.kind
+
+
+def test_compare_flags_only_slowdowns_beyond_threshold() -> None:
+    def report(mean_us: float, p50_us: float) -> dict:
+        return {"results": {"parse_message": {"mean_us": mean_us, "p50_us": p50_us}}}
+
+    baseline = report(10.0, 8.0)
+    assert compare(baseline, report(12.0, 9.5), threshold=0.25) == []
+    assert compare(baseline, report(5.0, 4.0), threshold=0.25) == []
+    regressions = compare(baseline, report(13.0, 9.0), threshold=0.25)
+    assert len(regressions) == 1 and regressions[0].startswith("parse_message.mean_us")
+
+    # 新加的目标没有基线时不能被悄悄跳过
+    current = report(10.0, 8.0)
+    current["results"]["first_event"] = {"mean_us": 1.0, "p50_us": 1.0}
+    assert compare(baseline, current, threshold=0.25) == ["first_event: no baseline entry; re-save the baseline"]
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+
+from src.coalesce import GLOBAL_CHAT_ID, Coalescer
+from src.delivery import DeliveryJob
+
+
+def _job(chat_id: int, title: str) -> DeliveryJob:
+    return DeliveryJob(chat_id=chat_id, title=title, content=f"<p>{title}</p>")
+
+
+def test_window_merges_into_digest_and_urgent_bypasses() -> None:
+    forwarded: list[DeliveryJob] = []
+
+    async def forward(job: DeliveryJob, sinks: tuple[str, ...] | None) -> None:
+        forwarded.append(job)
+
+    async def run() -> None:
+        coalescer = Coalescer(forward, window_seconds=0.05, max_messages=10)
+        await coalescer.submit(_job(1, "a"))
+        await coalescer.submit(_job(1, "b"))
+        await coalescer.submit(_job(2, "alert"), urgent=True)
+        assert [job.title for job in forwarded] == ["alert"]
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert len(forwarded) == 2
+    digest = forwarded[1]
+    assert digest.chat_id == 1
+    assert digest.title == "a (+1)"
+    assert "<p>a</p>" in digest.content and "<p>b</p>" in digest.content
+
+
+def test_max_messages_flushes_early_in_global_scope() -> None:
+    forwarded: list[DeliveryJob] = []
+
+    async def forward(job: DeliveryJob, sinks: tuple[str, ...] | None) -> None:
+        forwarded.append(job)
+
+    async def run() -> None:
+        coalescer = Coalescer(forward, window_seconds=60, max_messages=3, scope="global")
+        for chat_id, title in ((1, "a"), (2, "b"), (3, "c"), (4, "d")):
+            await coalescer.submit(_job(chat_id, title))
+        assert len(forwarded) == 1
+        await coalescer.close()
+
+    asyncio.run(run())
+    assert [job.chat_id for job in forwarded] == [GLOBAL_CHAT_ID, 4]
+    assert forwarded[0].title == "a (+2)"
+    assert forwarded[1].title == "d"
+
+
+def test_global_scope_keeps_per_chat_routes_and_logs_failed_flushes(caplog) -> None:
+    forwarded: list[tuple[str, tuple[str, ...] | None]] = []
+    routes = {1: ("pushplus",), 2: ("archive",), 3: ("pushplus",)}
+
+    async def forward(job: DeliveryJob, sinks: tuple[str, ...] | None) -> None:
+        if job.title == "boom":
+            raise RuntimeError("outbox unavailable")
+        forwarded.append((job.title, sinks))
+
+    async def run() -> None:
+        coalescer = Coalescer(
+            forward, window_seconds=0.05, max_messages=10, scope="global", route=routes.__getitem__
+        )
+        for chat_id, title in ((1, "a"), (2, "b"), (3, "c")):
+            await coalescer.submit(_job(chat_id, title))
+        await asyncio.sleep(0.1)
+        # 定时刷新失败不能悄无声息地丢掉消息
+        await coalescer.submit(_job(4, "boom"))
+        await asyncio.sleep(0.1)
+
+    routes[4] = ("webhook",)
+    with caplog.at_level(logging.ERROR, logger="src.coalesce"):
+        asyncio.run(run())
+    # 只发 archive 的 chat 不会混进发往 pushplus 的合并推送
+    assert sorted(forwarded) == [("a (+1)", ("pushplus",)), ("b", ("archive",))]
+    assert any(getattr(r, "event", None) == "coalesce_error" and r.jobs == 1 for r in caplog.records)
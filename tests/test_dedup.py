@@ -0,0 +1,56 @@
+from pathlib import Path
+
+from src.dedup import DedupCache, content_key
+from src.format import Message
+
+
+def test_content_key_normalizes_whitespace_and_case() -> None:
+    a = Message(msg_id=1, time="", message="BREAKING:  Fed cuts\nrates", media_url="https://x")
+    b = Message(msg_id=2, time="", message="breaking: fed cuts rates ", media_url="https://x")
+    c = Message(msg_id=3, time="", message="breaking: fed cuts rates", media_url=None)
+    assert content_key(a) == content_key(b)
+    assert content_key(a) != content_key(c)
+    assert content_key(Message(msg_id=4, time="", message="  ")) is None
+
+
+def test_ttl_and_bounded_size() -> None:
+    now = [0.0]
+    cache = DedupCache(ttl_seconds=10, max_entries=2, clock=lambda: now[0])
+    assert not cache.check("a")
+    assert cache.check("a")
+    now[0] = 11
+    assert not cache.check("a")
+
+    cache.check("b")
+    cache.check("c")
+    assert len(cache) == 2
+    assert not cache.check("a")
+    assert (cache.hits, cache.misses) == (1, 5)
+
+
+def test_repeats_do_not_extend_the_window() -> None:
+    now = [0.0]
+    cache = DedupCache(ttl_seconds=10, clock=lambda: now[0])
+    assert not cache.check("alert")
+    # 每 4 秒重复一次：只在首次出现满 10 秒后再放行一次
+    seen = []
+    for _ in range(6):
+        now[0] += 4
+        seen.append(cache.check("alert"))
+    assert seen == [True, True, False, True, True, False]
+
+
+def test_persistence_round_trip(tmp_path: Path) -> None:
+    now = [100.0]
+    path = tmp_path / "dedup.json"
+    cache = DedupCache(ttl_seconds=10, clock=lambda: now[0])
+    cache.check("a")
+    now[0] = 105
+    cache.check("b")
+    cache.save(path)
+
+    now[0] = 112
+    restored = DedupCache(ttl_seconds=10, clock=lambda: now[0])
+    assert restored.load(path) == 1
+    assert restored.check("b")
+    assert not restored.check("a")
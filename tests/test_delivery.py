@@ -0,0 +1,178 @@
+import asyncio
+from typing import Any
+
+from src.delivery import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, DeliveryJob, DeliveryQueue
+
+
+def test_per_chat_order_is_preserved() -> None:
+    delivered: list[tuple[int, str]] = []
+
+    async def send(job: DeliveryJob) -> None:
+        # 让同一 lane 内后到的任务有机会“插队”，验证顺序仍然保持
+        await asyncio.sleep(0.001 * (job.chat_id % 3))
+        delivered.append((job.chat_id, job.title))
+
+    async def run() -> None:
+        queue = DeliveryQueue(send, workers=3, maxsize=100)
+        queue.start()
+        for i in range(10):
+            for chat_id in (1, 2, 3, 4):
+                await queue.put(DeliveryJob(chat_id=chat_id, title=str(i), content=""))
+        await queue.close()
+
+    asyncio.run(run())
+    for chat_id in (1, 2, 3, 4):
+        titles = [title for cid, title in delivered if cid == chat_id]
+        assert titles == [str(i) for i in range(10)]
+
+
+def test_blocked_puts_are_served_in_arrival_order() -> None:
+    delivered: list[str] = []
+
+    async def run() -> None:
+        release = asyncio.Event()
+        arrive = asyncio.Event()
+
+        async def send(job: DeliveryJob) -> None:
+            if job.title == "0":
+                await release.wait()
+            delivered.append(job.title)
+
+        async def late() -> None:
+            await arrive.wait()
+            await queue.put(DeliveryJob(chat_id=1, title="3", content=""))
+
+        queue = DeliveryQueue(send, workers=1, maxsize=1)
+        queue.start()
+        await queue.put(DeliveryJob(chat_id=1, title="0", content=""))
+        await asyncio.sleep(0)
+        await queue.put(DeliveryJob(chat_id=1, title="1", content=""))
+        blocked = asyncio.create_task(queue.put(DeliveryJob(chat_id=1, title="2", content="")))
+        arriving = asyncio.create_task(late())
+        await asyncio.sleep(0)
+        # worker 腾出空位后、被唤醒的 "2" 运行前，"3" 恰好到达
+        release.set()
+        arrive.set()
+        await asyncio.gather(blocked, arriving)
+        await queue.close()
+
+    asyncio.run(run())
+    assert delivered == ["0", "1", "2", "3"]
+
+
+def test_drop_policies_when_full() -> None:
+    async def run(policy: str) -> list[str]:
+        delivered: list[str] = []
+
+        async def send(job: DeliveryJob) -> None:
+            delivered.append(job.title)
+
+        queue = DeliveryQueue(send, workers=1, maxsize=2, overflow=policy)
+        for title in ("a", "b", "c"):
+            await queue.put(DeliveryJob(chat_id=1, title=title, content=""))
+        assert queue.dropped == 1
+        queue.start()
+        await queue.close()
+        return delivered
+
+    assert asyncio.run(run("drop_newest")) == ["a", "b"]
+    assert asyncio.run(run("drop_oldest")) == ["b", "c"]
+
+
+def test_send_errors_do_not_stop_worker() -> None:
+    delivered: list[str] = []
+
+    async def send(job: DeliveryJob) -> None:
+        if job.title == "bad":
+            raise RuntimeError("boom")
+        delivered.append(job.title)
+
+    async def run() -> None:
+        queue = DeliveryQueue(send, workers=1)
+        queue.start()
+        for title in ("bad", "ok"):
+            await queue.put(DeliveryJob(chat_id=1, title=title, content=""))
+        await queue.close()
+
+    asyncio.run(run())
+    assert delivered == ["ok"]
+
+
+def test_priority_lanes_schedule_evict_and_shed() -> None:
+    chat_by_priority = {PRIORITY_HIGH: 1, PRIORITY_NORMAL: 2, PRIORITY_LOW: 3}
+
+    def job(title: str, priority: int) -> DeliveryJob:
+        return DeliveryJob(chat_id=chat_by_priority[priority], title=title, content="", priority=priority)
+
+    async def run(scheduling: str, **kwargs: Any) -> tuple[list[str], list[str]]:
+        delivered: list[str] = []
+        dropped: list[str] = []
+
+        async def send(j: DeliveryJob) -> None:
+            delivered.append(j.title)
+
+        queue = DeliveryQueue(
+            send, workers=1, maxsize=6, scheduling=scheduling, weights=(2, 1, 1),
+            on_drop=lambda j: dropped.append(j.title), on_shed=lambda j: dropped.append(j.title), **kwargs,
+        )
+        for i in range(3):
+            await queue.put(job(f"low{i}", PRIORITY_LOW))
+        for i in range(3):
+            await queue.put(job(f"normal{i}", PRIORITY_NORMAL))
+        # 队列已满：高优先级挤掉最早的低优先级推送，而不是阻塞
+        await queue.put(job("high0", PRIORITY_HIGH))
+        await queue.put(job("high1", PRIORITY_HIGH))
+        queue.start()
+        await queue.close()
+        return delivered, dropped
+
+    delivered, dropped = asyncio.run(run("strict"))
+    assert dropped == ["low0", "low1"]
+    assert delivered == ["high0", "high1", "normal0", "normal1", "normal2", "low2"]
+
+    delivered, _ = asyncio.run(run("weighted"))
+    # 权重 2:1:1 的平滑加权轮询：每 4 次里高优先级 2 次，低优先级也不会饿死
+    assert delivered == ["high0", "normal0", "low2", "high1", "normal1", "normal2"]
+
+    async def shed(mode: str) -> tuple[list[str], list[str]]:
+        delivered: list[str] = []
+        shed_titles: list[str] = []
+
+        async def send(j: DeliveryJob) -> None:
+            delivered.append(j.title)
+
+        queue = DeliveryQueue(
+            send, workers=1, shed_age_seconds=0.01, shed_mode=mode,
+            on_shed=lambda j: shed_titles.append(j.title),
+        )
+        for i in range(30):
+            await queue.put(job(f"low{i}", PRIORITY_LOW))
+        await queue.put(job("high", PRIORITY_HIGH))
+        await asyncio.sleep(0.02)
+        queue.start()
+        await queue.close()
+        assert queue.shed == 30
+        return delivered, shed_titles
+
+    delivered, shed_titles = asyncio.run(shed("summarize"))
+    assert shed_titles == [f"low{i}" for i in range(30)]
+    assert delivered == ["high", "积压跳过 30 条低优先级推送"]
+    assert asyncio.run(shed("drop"))[0] == ["high"]
+
+
+def test_shed_summary_escapes_titles() -> None:
+    delivered: list[str] = []
+
+    async def send(job: DeliveryJob) -> None:
+        delivered.append(job.content)
+
+    async def run() -> None:
+        queue = DeliveryQueue(send, workers=1, shed_age_seconds=0.01)
+        for title in ("<b>A&B</b>", "plain"):
+            await queue.put(DeliveryJob(chat_id=1, title=title, content="", priority=PRIORITY_LOW))
+        await asyncio.sleep(0.02)
+        queue.start()
+        await queue.close()
+
+    asyncio.run(run())
+    assert delivered == ["&lt;b&gt;A&amp;B&lt;/b&gt;<br>plain"]
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from telethon.tl.types import Channel, ChatPhotoEmpty, InputPeerChannel
+from telethon.utils import get_peer_id
+
+from src.entity_cache import EntityCache
+
+
+def test_cached_entity_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / "entities.json"
+    channel = Channel(123, "BWEnews", ChatPhotoEmpty(), None, access_hash=987)
+
+    cache = EntityCache(path)
+    cache.put("t.me/BWEnews", channel)
+    cache.save()
+
+    cached = EntityCache(path).get("t.me/BWEnews")
+    assert cached is not None
+    assert cached.title == "BWEnews"
+    peer = cached.input_peer()
+    assert peer == InputPeerChannel(123, 987)
+    assert get_peer_id(peer) == get_peer_id(channel) == cached.peer_id
+
+
+def test_invalidate_and_staleness(tmp_path: Path) -> None:
+    cache = EntityCache(tmp_path / "entities.json")
+    cache.put("t.me/x", Channel(1, "x", ChatPhotoEmpty(), None, access_hash=2))
+    assert not cache.is_stale("t.me/x", max_age_seconds=60)
+    assert cache.is_stale("t.me/x", max_age_seconds=-1)
+    cache.invalidate("t.me/x")
+    assert cache.get("t.me/x") is None
+    assert cache.put("t.me/y", object()) is None
@@ -0,0 +1,125 @@
+import json
+from pathlib import Path
+
+from src.config import ChatFilter, _load_chat_filters_from_json
+from src.filter_syntax import check_pattern, parse_expression
+from src.filters import AHO_CORASICK_MIN_KEYWORDS, KeywordMatcher, compile_rule
+
+
+def test_empty_keywords_pass_everything() -> None:
+    rule = compile_rule(ChatFilter(mode="deny", keywords=[""], case_sensitive=True))
+    assert rule.should_push("anything") == (True, None)
+
+
+def test_case_insensitive_deny() -> None:
+    rule = compile_rule(ChatFilter(mode="deny", keywords=["Bitget Listing"]))
+    assert rule.should_push("New BITGET listing: FOO") == (False, "bitget listing")
+    assert rule.should_push("Binance Listing: FOO") == (True, None)
+
+
+def test_automaton_matches_linear_scan() -> None:
+    keywords = [f"kw{i:04d}" for i in range(AHO_CORASICK_MIN_KEYWORDS * 2)] + ["GM", "Day"]
+    matcher = KeywordMatcher(keywords, case_sensitive=True)
+    assert matcher._goto, "expected automaton for large keyword lists"
+
+    texts = ["GM frens", "nothing here", "prefix kw0007 suffix", "kw00 kw001", "Monday", "gm"]
+    for text in texts:
+        expected = any(kw in text for kw in keywords)
+        hit = matcher.search(text)
+        assert (hit is not None) == expected
+        if hit is not None:
+            assert hit in text
+
+
+def test_regex_patterns_share_one_matcher_with_keywords() -> None:
+    rule = compile_rule(
+        ChatFilter(mode="deny", keywords=["#币安安全星期四"], patterns=[r"^GM\b", r"\bDay \d+\b"])
+    )
+    assert rule.should_push("GM frens") == (False, r"^GM\b")
+    assert rule.should_push("gmx listing") == (True, None)
+    assert rule.should_push("Monday update") == (True, None)
+    assert rule.should_push("Day 12 of building") == (False, r"\bDay \d+\b")
+    assert rule.should_push("今天是 #币安安全星期四") == (False, "#币安安全星期四")
+
+
+def test_pathological_patterns_are_rejected() -> None:
+    for pattern in [
+        r"(a+)+$", r"(\w+\s?)*x", r"(.|\s)*X", r"(a|a)*c", r"(a|ab)*c", r"(a?a)*c",
+        r"(a)\1", r"(?P<name>a)", "a(?i)b", "[",
+        # 相邻量词能匹配同样的字符：不匹配时按多项式回溯
+        r"\d*\d*\d*!", r".*.*.*!", r"\s*\s*\s*$x", r"a.*b.*c.*d.*e", r"(?:\d+)\d+", r"\w+\s*\d+",
+    ]:
+        try:
+            check_pattern(pattern)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {pattern!r}")
+    # 分支首字符互斥、可选项与后续字符不重叠的重复是安全的
+    for pattern in [
+        r"(foo|bar)+", r"(\d|\s)*x", r"(https?://)+", r"(?:ETF|BTC)\s*approved",
+        r"\d+\s+\d+", r"ETF.*approved", r"https?://\S+",
+    ]:
+        check_pattern(pattern)
+
+
+def test_expression_over_parsed_fields() -> None:
+    rule = compile_rule(
+        ChatFilter(
+            mode="allow",
+            keywords=[],
+            expr='event == "新推文" and not content ~ "^gm\\\\b" or username == "cz_binance"',
+        )
+    )
+    tweet = "🌟监控到新推文\n你关注的用户: Foo(备注: x)\n用户所属分组: KOL\n推文内容: {}"
+    assert rule.should_push(tweet.format("launching v2"))[0]
+    assert not rule.should_push(tweet.format("GM frens"))[0]
+    assert not rule.should_push("plain launching v2")[0]
+
+    for bad in ['event ==', 'title == "x"', '"a" and', 'text ~ "(a+)+"']:
+        try:
+            parse_expression(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {bad!r}")
+
+
+def test_filter_file_reports_bad_patterns_and_expressions(tmp_path: Path) -> None:
+    path = tmp_path / "chat_filters.json"
+    entries = [
+        ({"patterns": [r"^GM\b", r"(a+)+"]}, "chat_filters[1].patterns[2]: nested quantifiers"),
+        ({"expr": 'event = "新推文"'}, "chat_filters[1].expr: unexpected character"),
+    ]
+    for extra, expected in entries:
+        entry = {"chat": "t.me/BWEnews", "mode": "deny", "keywords": [], **extra}
+        path.write_text(json.dumps({"chat_filters": [entry]}), encoding="utf-8")
+        try:
+            _load_chat_filters_from_json(path)
+        except ValueError as exc:
+            assert expected in str(exc)
+            continue
+        raise AssertionError(f"accepted {extra}")
+
+
+def test_field_rules_use_parsed_event_username_and_group() -> None:
+    rule = compile_rule(
+        ChatFilter(
+            mode="deny",
+            keywords=["giveaway"],
+            field_rules={
+                "events": ["新推文", "新推文引用"],
+                "usernames": ["CZ_Binance"],
+                "groups": ["交易所"],
+                "drop_usernames": ["spam"],
+            },
+        )
+    )
+    header = "🌟监控到{}\n你关注的用户: {}(备注: x)\n用户所属分组: {}\n推文内容: hello"
+
+    assert rule.should_push(header.format("新推文", "cz_binance", "KOL")) == (True, None)
+    assert rule.should_push(header.format("新推文", "someone", "交易所")) == (True, None)
+    assert rule.should_push(header.format("新推文", "someone", "KOL")) == (False, "username=someone")
+    assert rule.should_push(header.format("删除推文", "cz_binance", "KOL")) == (False, "event=删除推文")
+    assert rule.should_push(header.format("新推文", "spam", "交易所")) == (False, "username=spam")
+    assert rule.should_push(header.format("新推文", "cz_binance", "KOL") + " giveaway")[0] is False
+    # 非 6551 消息只走关键词规则
+    assert rule.should_push("plain post") == (True, None)
@@ -1,4 +1,4 @@
-from src.format import MessageType, detect_message_type
+from src.format import MessageType, ParsedEvent, detect_message_type, iter_events, parse_message
 
 
 def test_detect_message_type_quote() -> None:
@@ -14,3 +14,39 @@ def test_detect_message_type_reply() -> None:
 def test_detect_message_type_unknown() -> None:
     text = "this is a normal message"
     assert detect_message_type(text) == MessageType.UNKNOWN
+
+
+def test_parse_message_delete_tweet_and_reply_share_header() -> None:
+    header = "🌟监控到删除推文\n你关注的用户: alice(备注:a)\n用户所属分组: g"
+    deleted = parse_message(header)
+    deleted_reply = parse_message(f"{header}\n上文内容: parent\n回帖内容: reply")
+
+    assert deleted[0]["event"] == "删除推文"
+    assert deleted[0]["data"] == {}
+    assert deleted_reply[0]["event"] == "删除推文回复"
+    assert deleted_reply[0]["data"] == {"parent": "parent", "reply": "reply"}
+
+
+def test_parse_message_unknown_event_falls_back_to_header() -> None:
+    text = "🌟监控到新头像\n你关注的用户: bob(备注:b)\n用户所属分组: g\n头像: x"
+    parsed = parse_message(text)
+    assert parsed[0]["event"] == "新头像"
+    assert parsed[0]["username"] == "bob"
+    assert parsed[0]["data"] == {"raw": text}
+
+
+def test_iter_events_is_lazy_and_matches_parse_message() -> None:
+    tweet = "🌟监控到新推文\n你关注的用户: alice(备注:a)\n用户所属分组: g\n推文内容: hi"
+    follow = "🌟监控到新关注动态\n你关注的用户: bob(备注:b)\n用户所属分组: g\n用户列表:\n• x\n• y"
+    text = f"intro\n{tweet}\n\n{follow}\n\n🌟监控到新头像"
+
+    events = iter_events(text)
+    first = next(events)
+    assert first == ParsedEvent(event="新推文", username="alice", remark="a", group="g", tweet="hi")
+    assert next(events).followed_users == ["x", "y"]
+
+    parsed = parse_message(text)
+    assert [event.to_dict() for event in iter_events(text)] == parsed
+    assert parsed[1]["data"] == {"followed_users": ["x", "y"]}
+    assert parsed[2] == {"event": "", "username": "", "remark": "", "group": "", "data": {"raw": "🌟监控到新头像"}}
+    assert list(iter_events("plain 🌟监控到新推文 mid-line")) == []
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import httpx
+
+from src.config import Config, SinkConfig
+from src.format import Message
+from src.judging import PRIORITY_TITLE_PREFIX, JudgeStage
+from src.opportunity_judge_standalone import Judge
+from src.pipeline import Pipeline
+
+
+def _mock_judge_api(calls: list[str]) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        text = json.loads(request.content)["input"][1]["content"]
+        calls.append(text)
+        if "slow" in text:
+            await asyncio.sleep(0.5)
+        verdict = {"should_push": "spam" not in text, "reason": "mock", "confidence": 90}
+        return httpx.Response(200, json={"output_text": json.dumps(verdict)})
+
+    return httpx.MockTransport(handler)
+
+
+def test_judge_stage_prioritises_suppresses_and_never_exceeds_budget(tmp_path: Path) -> None:
+    out = tmp_path / "pushes.jsonl"
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=[], chat_filters={},
+        pushplus_token="", pushplus_timeout=5, data_dir=tmp_path,
+        outbox_enabled=False, dedup_enabled=False, judge_suppress=True,
+        sinks={"file": SinkConfig(name="file", type="jsonl", path=str(out), concurrency=1)},
+        default_sinks=["file"],
+    )
+    calls: list[str] = []
+
+    async def run() -> tuple[float, float]:
+        async with httpx.AsyncClient(transport=_mock_judge_api(calls)) as client:
+            pipeline = Pipeline(cfg, client, {1: "alerts", 2: "news", 3: "misc"}, {})
+            judge = Judge("key", "mock", "system", "{text}", concurrency=32, http_client=client)
+            pipeline.judging = JudgeStage(judge, 0.1, pipeline.metrics.judged)
+            await pipeline.start()
+
+            started = time.monotonic()
+            # handle 不等判定：回补那样逐条调用也不会每条等满预算
+            for msg_id in range(5, 15):
+                await pipeline.handle(3, Message(msg_id=msg_id, time="", message=f"slow {msg_id}"))
+            intake = time.monotonic() - started
+            # 同一 chat 的慢判定不能让后一条消息插队；两个 chat 同时出现的相同文本只请求一次
+            await asyncio.gather(
+                pipeline.handle(1, Message(msg_id=1, time="", message="slow news")),
+                pipeline.handle(1, Message(msg_id=2, time="", message="ETF approved")),
+                pipeline.handle(2, Message(msg_id=3, time="", message="ETF approved")),
+                pipeline.handle(2, Message(msg_id=4, time="", message="spam offer")),
+            )
+            await pipeline.close()
+            return intake, time.monotonic() - started
+
+    intake, elapsed = asyncio.run(run())
+    assert intake < 0.05
+    # 同一 chat 的判定并行发出，总耗时仍只有一个预算
+    assert elapsed < 0.4
+    assert sorted(call for call in calls if not call.startswith("slow ")) == ["ETF approved", "spam offer"]
+
+    pushes = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    by_chat = {chat_id: [p["title"] for p in pushes if p["chat_id"] == chat_id] for chat_id in (1, 2, 3)}
+    assert by_chat[1] == ["alerts", PRIORITY_TITLE_PREFIX + "alerts"]
+    assert by_chat[2] == [PRIORITY_TITLE_PREFIX + "news"]
+    assert by_chat[3] == ["misc"] * 10
+    contents = [p["content"] for p in pushes if p["chat_id"] == 3]
+    assert contents == sorted(contents, key=lambda c: int(c.split("slow ")[1].split("<")[0]))
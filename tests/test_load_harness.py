@@ -0,0 +1,42 @@
+import asyncio
+import tempfile
+from pathlib import Path
+
+from benchmarks.load_harness import FakePushPlus, run_load, synthetic_events
+from src.config import Config
+
+
+def _config(data_dir: Path, api_url: str) -> Config:
+    return Config(
+        api_id=0,
+        api_hash="",
+        phone="",
+        session_name="test",
+        chats=[],
+        chat_filters={},
+        pushplus_token="token",
+        pushplus_timeout=5,
+        pushplus_api_url=api_url,
+        pushplus_rate_per_second=1000.0,
+        pushplus_rate_burst=100,
+        data_dir=data_dir,
+        outbox_enabled=False,
+        dedup_enabled=False,
+    )
+
+
+def test_every_injected_message_is_delivered_or_filtered() -> None:
+    fake = FakePushPlus(latency_ms=5)
+    url = fake.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            events = synthetic_events(40, chats=3, seed=1)
+            report = asyncio.run(run_load(_config(Path(tmp), url), events, rate=400))
+    finally:
+        fake.stop()
+
+    assert report.injected == 40
+    assert report.delivered + report.filter_dropped == 40
+    assert report.delivered == fake.requests == len(report.latencies_ms)
+    assert report.failed == report.queue_dropped == 0
+    assert 0 < report.percentile(0.5) <= report.percentile(0.99)
@@ -0,0 +1,46 @@
+import io
+import json
+import logging
+
+from src.log import SamplingFilter, get_logger, setup_logging
+
+
+def _record(event: str, created: float) -> logging.LogRecord:
+    record = logging.LogRecord("tg_forwarder.test", logging.INFO, "", 0, "drop", (), None)
+    record.event = event
+    record.created = created
+    return record
+
+
+def test_sampling_limits_drop_events_per_second() -> None:
+    sampler = SamplingFilter(per_second=2)
+    passed = [sampler.filter(_record("filter_drop", 100.1 + i / 10)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert sampler.filter(_record("push_error", 100.9))
+
+    record = _record("filter_drop", 101.0)
+    assert sampler.filter(record)
+    assert record.suppressed == 3
+
+
+def test_records_are_written_as_json_by_the_listener() -> None:
+    stream = io.StringIO()
+    listener = setup_logging("INFO", "json", sample_per_second=0, stream=stream)
+    log = get_logger("src.pipeline")
+    log.debug("hidden")
+    log.info(
+        "filter drop",
+        extra={"event": "filter_drop", "chat": "BWEnews", "msg_id": 7, "mode": "deny", "hit": "GM"},
+    )
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError as exc:
+        log.error("push error: %s", exc, exc_info=True, extra={"event": "push_error"})
+    listener.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["event"] for line in lines] == ["filter_drop", "push_error"]
+    assert lines[0]["logger"] == "tg_forwarder.pipeline"
+    assert lines[0]["chat"] == "BWEnews" and lines[0]["msg_id"] == 7 and lines[0]["hit"] == "GM"
+    assert lines[1]["msg"] == "push error: boom"
+    assert "RuntimeError: boom" in lines[1]["exc"]
@@ -0,0 +1,95 @@
+import asyncio
+from pathlib import Path
+
+import httpx
+
+from src.config import Config
+from src.format import Message
+from src.metrics import Counter, Histogram, Metrics, MetricsServer, Registry
+from src.pipeline import Pipeline
+
+
+def test_histogram_and_counter_render_prometheus_text() -> None:
+    registry = Registry()
+    hist = registry.register(Histogram("lat_seconds", "Latency.", ("sink",), (0.5, 1.0)))
+    hits = registry.register(Counter("hits_total", "Hits.", ("chat", "mode")))
+    for value in (0.2, 0.5, 0.7, 3.0):
+        hist.observe(value, "pushplus")
+    hits.inc('a "b"', "deny")
+    hits.inc('a "b"', "deny")
+
+    text = registry.render()
+    assert 'lat_seconds_bucket{sink="pushplus",le="0.5"} 2' in text
+    assert 'lat_seconds_bucket{sink="pushplus",le="1"} 3' in text
+    assert 'lat_seconds_bucket{sink="pushplus",le="+Inf"} 4' in text
+    assert 'lat_seconds_sum{sink="pushplus"} 4.4' in text
+    assert 'lat_seconds_count{sink="pushplus"} 4' in text
+    assert 'hits_total{chat="a \\"b\\"",mode="deny"} 2' in text
+    assert "# TYPE lat_seconds histogram" in text
+
+
+def test_server_exposes_metrics() -> None:
+    async def run() -> None:
+        metrics = Metrics()
+        metrics.queue_depth.set_function(lambda: [(("sink-pushplus",), 3)])
+        metrics.sent.inc("pushplus")
+        server = MetricsServer(metrics, "127.0.0.1", 0)
+        await server.start()
+        try:
+            async with httpx.AsyncClient() as client:
+                resp = await client.get(f"http://127.0.0.1:{server.port}/metrics")
+                missing = await client.get(f"http://127.0.0.1:{server.port}/")
+        finally:
+            await server.close()
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'tg_forwarder_queue_depth{queue="sink-pushplus"} 3' in resp.text
+        assert 'tg_forwarder_sent_total{sink="pushplus"} 1' in resp.text
+        assert missing.status_code == 404
+
+    asyncio.run(run())
+
+
+def test_breaker_and_limiter_metrics_are_scraped_per_sink(tmp_path: Path) -> None:
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=[], chat_filters={},
+        pushplus_token="t", pushplus_timeout=5, data_dir=tmp_path,
+        outbox_enabled=False, dedup_enabled=False,
+        pushplus_rate_per_second=20.0, pushplus_rate_burst=1,
+        pushplus_breaker_threshold=2, pushplus_breaker_reset_seconds=60.0,
+    )
+    attempts: list[bytes] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.content)
+        return httpx.Response(200, json={"code": 500, "msg": "quota"})
+
+    async def run() -> str:
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            pipeline = Pipeline(cfg, client, {}, {})
+            await pipeline.start()
+            server = MetricsServer(pipeline.metrics, "127.0.0.1", 0)
+            await server.start()
+            try:
+                # 两个会话并发发送：突发容量 1，第二条要等令牌；两次失败后熔断器打开
+                await pipeline.handle(1, Message(msg_id=1, time="", message="a"))
+                await pipeline.handle(2, Message(msg_id=2, time="", message="b"))
+                for _ in range(100):
+                    if pipeline.sinks["pushplus"].breaker.times_opened:
+                        break
+                    await asyncio.sleep(0.01)
+                async with httpx.AsyncClient() as scraper:
+                    resp = await scraper.get(f"http://127.0.0.1:{server.port}/metrics")
+            finally:
+                await server.close()
+                await pipeline.close()
+        return resp.text
+
+    text = asyncio.run(run())
+    assert 'tg_forwarder_breaker_state{sink="pushplus"} 2' in text
+    assert 'tg_forwarder_breaker_opened_total{sink="pushplus"} 1' in text
+    assert 'tg_forwarder_limiter_waits_total{sink="pushplus"} 1' in text
+    assert "# TYPE tg_forwarder_limiter_wait_seconds_total counter" in text
+    assert len(attempts) == 2
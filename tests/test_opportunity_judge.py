@@ -0,0 +1,61 @@
+import asyncio
+import io
+import json
+from pathlib import Path
+
+import httpx
+
+from src.opportunity_judge_standalone import Judge, ResultCache, judge_batch
+
+
+def _mock_responses_api(calls: list[str]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/v1/responses"
+        user_prompt = json.loads(request.content)["input"][1]["content"]
+        calls.append(user_prompt)
+        if "boom" in user_prompt:
+            return httpx.Response(400, text="bad request")
+        verdict = {"should_push": "ETF" in user_prompt, "reason": "mock", "confidence": 90}
+        # 模拟模型在 JSON 外面包了一层说明文字
+        return httpx.Response(200, json={"output_text": f"结果：{json.dumps(verdict)}"})
+
+    return httpx.MockTransport(handler)
+
+
+def test_batch_runs_concurrently_in_order_and_reuses_cached_verdicts(tmp_path: Path) -> None:
+    calls: list[str] = []
+    lines = [
+        json.dumps({"id": "a", "text": "ETF approved"}),
+        json.dumps("just chatting"),
+        "not json",
+        json.dumps({"id": "c", "text": "boom"}),
+    ]
+
+    async def run(system_prompt: str) -> list[dict]:
+        async with httpx.AsyncClient(transport=_mock_responses_api(calls)) as client:
+            judge = Judge(
+                "key", "mock-model", system_prompt, "判断：{text}",
+                api_url="http://mock/v1/responses", concurrency=2,
+                cache=ResultCache(tmp_path), http_client=client,
+            )
+            out = io.StringIO()
+            failed = await judge_batch(judge, io.StringIO("\n".join(lines) + "\n"), out, window=2)
+            records = [json.loads(line) for line in out.getvalue().splitlines()]
+            assert failed == sum("error" in record for record in records)
+            return records
+
+    first = asyncio.run(run("system"))
+    assert [record["id"] for record in first] == ["a", 2, 3, "c"]
+    assert first[0]["result"]["should_push"] is True and first[0]["cached"] is False
+    assert first[1]["result"]["should_push"] is False
+    assert "error" in first[2] and "HTTPError 400" in first[3]["error"]
+    assert sorted(calls) == ["判断：ETF approved", "判断：boom", "判断：just chatting"]
+
+    # 文本、提示词和模型都没变：直接命中磁盘缓存，失败的条目不缓存
+    second = asyncio.run(run("system"))
+    assert [record.get("cached") for record in second] == [True, True, None, None]
+    assert len(calls) == 4
+
+    # 提示词变了缓存键就变了
+    asyncio.run(run("system v2"))
+    assert len(calls) == 7
@@ -0,0 +1,102 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from src.config import Config, SinkConfig
+from src import outbox as outbox_module
+from src.delivery import PRIORITY_HIGH, PRIORITY_LOW, DeliveryJob
+from src.format import Message
+from src.outbox import OUTBOX_FILENAME, Outbox
+from src.pipeline import Pipeline
+
+
+def test_pending_records_survive_restart(tmp_path: Path) -> None:
+    db = tmp_path / "outbox.sqlite3"
+
+    async def first_run() -> None:
+        outbox = Outbox(db)
+        outbox.start()
+        jobs = [DeliveryJob(chat_id=1, title=f"t{i}", content="c") for i in range(5)]
+        ids = await asyncio.gather(*(outbox.add(job) for job in jobs))
+        assert sorted(ids) == ids and len(set(ids)) == 5
+        outbox.mark_done(jobs[0].outbox_id)
+        outbox.mark_dead(jobs[1].outbox_id, "boom")
+        await outbox.close()
+
+    asyncio.run(first_run())
+
+    outbox = Outbox(db)
+    assert outbox.prune_done() == 1
+    pending = outbox.pending()
+    assert [job.title for job in pending] == ["t2", "t3", "t4"]
+    assert all(job.outbox_id is not None for job in pending)
+    asyncio.run(outbox.close())
+
+
+def test_replay_keeps_priority_and_origin_time_and_done_rows_are_pruned(
+    tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(outbox_module, "OUTBOX_DONE_RETENTION_SECONDS", 0.0)
+    monkeypatch.setattr(outbox_module, "OUTBOX_PRUNE_INTERVAL_SECONDS", 0.0)
+    db = tmp_path / "outbox.sqlite3"
+
+    async def run() -> None:
+        outbox = Outbox(db)
+        outbox.start()
+        done = DeliveryJob(chat_id=1, title="done", content="c")
+        await outbox.add(done)
+        outbox.mark_done(done.outbox_id)
+        await outbox.add(DeliveryJob(chat_id=1, title="low", content="c", priority=PRIORITY_LOW, origin_ts=10.5))
+        await outbox.add(DeliveryJob(chat_id=1, title="high", content="c", priority=PRIORITY_HIGH))
+        await outbox.close()
+
+    asyncio.run(run())
+    outbox = Outbox(db)
+    # 运行期间写线程已删掉送达的记录，启动时不再有可清理的
+    assert outbox.prune_done() == 0
+    assert [(job.title, job.priority, job.origin_ts) for job in outbox.pending()] == [
+        ("low", PRIORITY_LOW, 10.5), ("high", PRIORITY_HIGH, None),
+    ]
+    asyncio.run(outbox.close())
+
+
+def test_pushes_rejected_by_open_breaker_stay_pending_and_are_retried(tmp_path: Path) -> None:
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=[], chat_filters={},
+        pushplus_token="t", pushplus_timeout=5, data_dir=tmp_path, dedup_enabled=False,
+        pushplus_breaker_threshold=1, pushplus_breaker_reset_seconds=0.1, pushplus_rate_per_second=1000,
+        sinks={"push": SinkConfig(name="push", type="pushplus", url="http://pp.test/send", max_retries=1)},
+        default_sinks=["push"],
+    )
+    sent: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        content = json.loads(request.content)["content"]
+        # 第一条推送时 PushPlus 故障，熔断器打开
+        if "m1" in content:
+            return httpx.Response(500)
+        sent.append(content)
+        return httpx.Response(200, json={"code": 200})
+
+    async def run() -> None:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            pipeline = Pipeline(cfg, client, {}, {})
+            await pipeline.start()
+            for i in (1, 2, 3):
+                await pipeline.handle(1, Message(msg_id=i, time="", message=f"m{i}"))
+            for _ in range(100):
+                if len(sent) == 2:
+                    break
+                await asyncio.sleep(0.02)
+            await pipeline.close()
+
+    asyncio.run(run())
+    assert len(sent) == 2
+    outbox = Outbox(tmp_path / OUTBOX_FILENAME)
+    # 只有真正失败的那条成为死信，熔断期间被拒的两条在恢复后送达
+    assert outbox.prune_done() == 2
+    assert outbox.pending() == []
+    asyncio.run(outbox.close())
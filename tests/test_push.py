@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+import src.push as push
+from src.config import Config
+from src.push import BREAKER_CLOSED, BREAKER_OPEN, CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+class _FakePushPlus(BaseHTTPRequestHandler):
+    # 按顺序返回的 code 列表，用尽后一直返回最后一个
+    codes: list[int] = [200]
+    requests = 0
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        cls = type(self)
+        code = cls.codes[min(cls.requests, len(cls.codes) - 1)]
+        cls.requests += 1
+        body = json.dumps({"code": code, "msg": "fake"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_pushplus(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(push, "PUSHPLUS_RETRY_BASE_DELAY_SECONDS", 0.0)
+    _FakePushPlus.codes = [200]
+    _FakePushPlus.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakePushPlus)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/send"
+    server.shutdown()
+    server.server_close()
+
+
+def _cfg() -> Config:
+    return Config(
+        api_id=1,
+        api_hash="x",
+        phone="+1",
+        session_name="test",
+        chats=[],
+        chat_filters={},
+        pushplus_token="token",
+        pushplus_timeout=5,
+    )
+
+
+def test_breaker_opens_and_fails_fast(fake_pushplus: str) -> None:
+    _FakePushPlus.codes = [500]
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+
+    async def run() -> None:
+        async with httpx.AsyncClient() as client:
+            with pytest.raises(CircuitOpenError):
+                await push.pushplus_send(
+                    client, _cfg(), "t", "c", breaker=breaker, api_url=fake_pushplus
+                )
+            assert breaker.state == BREAKER_OPEN
+            assert _FakePushPlus.requests == 2
+
+            with pytest.raises(CircuitOpenError):
+                await push.pushplus_send(
+                    client, _cfg(), "t", "c", breaker=breaker, api_url=fake_pushplus
+                )
+            assert _FakePushPlus.requests == 2
+
+            # 超过 reset_timeout 后半开探测成功，熔断器关闭
+            _FakePushPlus.codes = [200]
+            _FakePushPlus.requests = 0
+            now[0] = 11
+            await push.pushplus_send(
+                client, _cfg(), "t", "c", breaker=breaker, api_url=fake_pushplus
+            )
+            assert breaker.state == BREAKER_CLOSED
+            assert _FakePushPlus.requests == 1
+
+    asyncio.run(run())
+
+
+def test_half_open_allows_single_probe() -> None:
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 6
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == BREAKER_OPEN
+
+
+def test_token_bucket_limits_throughput() -> None:
+    async def run() -> float:
+        limiter = TokenBucket(rate=100, burst=2)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+        assert limiter.waits == 4
+        return loop.time() - start
+
+    assert asyncio.run(run()) >= 0.035
+
+
+def test_token_bucket_serves_higher_priority_waiters_first() -> None:
+    async def run() -> list[str]:
+        limiter = TokenBucket(rate=200, burst=1)
+        order: list[str] = []
+
+        async def take(name: str, priority: int) -> None:
+            await limiter.acquire(priority)
+            order.append(name)
+
+        # a 拿走唯一的令牌，b 持有取令牌的资格在等待补充；其余按优先级排队
+        await asyncio.gather(take("a", 2), take("b", 2), take("c", 2), take("normal", 1), take("high", 0))
+        return order
+
+    assert asyncio.run(run()) == ["a", "b", "high", "normal", "c"]
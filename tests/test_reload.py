@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from src.config import ChatFilter
+from src.reload import FilterWatcher
+
+
+def _write(path: Path, keywords: list[str], mtime_ns: int) -> None:
+    entry = {"chat": "t.me/BWEnews", "mode": "deny", "keywords": keywords}
+    path.write_text(json.dumps({"chat_filters": [entry]}), encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_watcher_applies_valid_changes_only(tmp_path: Path) -> None:
+    path = tmp_path / "chat_filters.json"
+    _write(path, ["a"], 1_000_000_000)
+    applied: list[dict[str, ChatFilter]] = []
+
+    async def apply(chat_filters: dict[str, ChatFilter]) -> None:
+        applied.append(chat_filters)
+
+    async def run() -> None:
+        watcher = FilterWatcher(path, apply)
+        assert not await watcher.check()
+
+        _write(path, ["Bitget Listing"], 2_000_000_000)
+        assert await watcher.check()
+        assert applied[-1]["t.me/BWEnews"].keywords == ["Bitget Listing"]
+
+        path.write_text("{not json", encoding="utf-8")
+        os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+        assert not await watcher.check()
+        assert len(applied) == 1
+
+    asyncio.run(run())
+
+
+def test_watcher_rejects_unknown_sinks_and_session_pins(tmp_path: Path) -> None:
+    path = tmp_path / "chat_filters.json"
+    applied: list[dict[str, ChatFilter]] = []
+
+    async def apply(chat_filters: dict[str, ChatFilter]) -> None:
+        applied.append(chat_filters)
+
+    async def run() -> None:
+        watcher = FilterWatcher(path, apply, sink_names={"pushplus"}, session_names={"main"})
+        for mtime, extra in enumerate(
+            [{"sinks": ["mail"]}, {"session": "backup"}, {"sinks": ["pushplus"], "session": "main"}], start=1
+        ):
+            entry = {"chat": "t.me/BWEnews", "mode": "deny", "keywords": [], **extra}
+            path.write_text(json.dumps({"chat_filters": [entry]}), encoding="utf-8")
+            os.utime(path, ns=(mtime * 1_000_000_000, mtime * 1_000_000_000))
+            await watcher.check()
+
+    asyncio.run(run())
+    # 前两次编辑指向不存在的 sink / 会话，被拒绝，只应用了第三次
+    assert len(applied) == 1
+    assert applied[0]["t.me/BWEnews"].session == "main"
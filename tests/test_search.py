@@ -0,0 +1,57 @@
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+
+from src.config import Config, SinkConfig
+from src.format import Message
+from src.pipeline import Pipeline
+from src.search import SEARCH_FILENAME, _connect, search
+
+
+QUOTE = "🌟监控到新推文引用\n你关注的用户: Alice(备注:a)\n用户所属分组: KOL\n引用内容: Spot ETF 获批"
+TWEET = "🌟监控到新推文\n你关注的用户: bob(备注:b)\n用户所属分组: KOL\n推文内容: ETF 流入创新高"
+MULTI = TWEET.replace("bob", "alice") + "\n" + QUOTE.replace("Spot ETF 获批", "比特币减半")
+
+
+def test_pipeline_indexes_messages_by_6551_fields_and_text(tmp_path: Path) -> None:
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=[], chat_filters={},
+        pushplus_token="", pushplus_timeout=5, data_dir=tmp_path,
+        outbox_enabled=False, dedup_enabled=False, search_enabled=True,
+        sinks={"file": SinkConfig(name="file", type="jsonl", path=str(tmp_path / "out.jsonl"))},
+        default_sinks=["file"],
+    )
+
+    async def run() -> None:
+        async with httpx.AsyncClient() as client:
+            pipeline = Pipeline(cfg, client, {1: "alerts"}, {})
+            await pipeline.start()
+            await pipeline.handle(1, Message(msg_id=1, time="", message=QUOTE))
+            await pipeline.handle(1, Message(msg_id=2, time="", message=TWEET))
+            await pipeline.handle(
+                1, Message(msg_id=3, time="", message="GM", media_description="Daily etf report")
+            )
+            await pipeline.handle(1, Message(msg_id=4, time="", message=MULTI))
+            # 回补重复处理同一条消息不会重复索引
+            await pipeline.handle(1, Message(msg_id=4, time="", message=MULTI))
+            await pipeline.queues["file"].join()
+            await pipeline.close()
+
+    asyncio.run(run())
+    conn = _connect(tmp_path / SEARCH_FILENAME)
+
+    def ids(**kwargs) -> list[tuple[int, str]]:
+        return sorted((row["msg_id"], row["event"]) for row in search(conn, **kwargs))
+
+    assert ids(terms=["etf"]) == [(1, "新推文引用"), (2, "新推文"), (3, ""), (4, "新推文")]
+    assert ids(terms=["ETF"], event="新推文引用", username="alice") == [(1, "新推文引用")]
+    # 多事件消息按事件分行：alice 的引用不含 ETF
+    assert ids(event="新推文引用", username="ALICE") == [(1, "新推文引用"), (4, "新推文引用")]
+    # 不足三个字符的词走 LIKE
+    assert ids(terms=["减半"]) == [(4, "新推文引用")]
+    assert ids(terms=["ETF", "获批"], since=time.time() - 60) == [(1, "新推文引用")]
+    assert ids(terms=["ETF"], until=time.time() - 60) == []
+    assert ids(terms=['"ETF'], group="KOL") == []
+    conn.close()
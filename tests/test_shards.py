@@ -0,0 +1,191 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from telethon.errors import ChannelPrivateError
+from telethon.tl.types import Channel, ChatPhotoEmpty
+from telethon.utils import get_peer_id
+
+from src import ingest as ingest_module
+from src import shards as shards_module
+from src.config import ChatFilter, Config
+from src.metrics import Metrics
+from src.shards import ShardedIngest, assign_chats
+from src.watermark import WatermarkStore
+
+
+def test_assignment_is_stable_pinned_and_moves_only_lost_chats() -> None:
+    chat_filters = {f"t.me/chat{i}": ChatFilter(mode="deny", keywords=[]) for i in range(200)}
+    chat_filters["t.me/pinned"] = ChatFilter(mode="deny", keywords=[], session="alt2")
+    sessions = ["main", "alt1", "alt2"]
+
+    full = assign_chats(chat_filters, sessions, {})
+    assert full == assign_chats(chat_filters, list(reversed(sessions)), {})
+    assert full["t.me/pinned"] == "alt2"
+    assert {name: list(full.values()).count(name) > 40 for name in sessions} == dict.fromkeys(sessions, True)
+
+    degraded = assign_chats(chat_filters, ["main", "alt1"], {})
+    moved = [chat for chat in chat_filters if degraded[chat] != full[chat]]
+    assert moved and all(full[chat] == "alt2" for chat in moved)
+
+    unavailable = {"t.me/chat0": {full["t.me/chat0"]}}
+    assert assign_chats(chat_filters, sessions, unavailable)["t.me/chat0"] != full["t.me/chat0"]
+    assert "t.me/chat0" not in assign_chats(chat_filters, [full["t.me/chat0"]], unavailable)
+
+
+def _channel(channel_id: int) -> Channel:
+    return Channel(channel_id, f"chan{channel_id}", ChatPhotoEmpty(), None, access_hash=channel_id)
+
+
+def _message(msg_id: int) -> Any:
+    return SimpleNamespace(id=msg_id, date=None, raw_text=f"m{msg_id}", message=f"m{msg_id}", media=None)
+
+
+class FakeClient:
+    def __init__(self, entities: dict[str, Channel], history: dict[int, list[Any]]) -> None:
+        self.entities = entities
+        self.history = history
+        self.handlers: list[Any] = []
+        self.disconnected: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+    async def get_entity(self, chat: str) -> Channel:
+        if chat not in self.entities:
+            raise ChannelPrivateError(request=None)
+        return self.entities[chat]
+
+    async def get_messages(
+        self, entity: Channel, limit: int = 1, min_id: int = 0, reverse: bool = False
+    ) -> list[Any]:
+        newer = [m for m in self.history[get_peer_id(entity)] if m.id > min_id]
+        return newer[:limit] if reverse else list(reversed(newer))[:limit]
+
+    def add_event_handler(self, handler: Any, event_filter: Any) -> None:
+        self.handlers.append(handler)
+
+    def remove_event_handler(self, handler: Any, event_filter: Any = None) -> None:
+        self.handlers.remove(handler)
+
+    async def deliver(self, chat_id: int, message: Any) -> None:
+        for handler in list(self.handlers):
+            await handler(SimpleNamespace(chat_id=chat_id, message=message))
+
+    async def connect(self) -> None:
+        self.disconnected = asyncio.get_running_loop().create_future()
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def disconnect(self) -> None:
+        if not self.disconnected.done():
+            self.disconnected.set_result(None)
+
+
+class FakePipeline:
+    def __init__(self) -> None:
+        self.metrics = Metrics()
+        self.chat_title_by_id: dict[int, str] = {}
+        self.chat_rule_by_id: dict[int, Any] = {}
+        self.handled: list[tuple[int, int]] = []
+
+    def update_chats(self, chat_title_by_id: dict[int, str], chat_rule_by_id: dict[int, Any]) -> None:
+        self.chat_title_by_id = chat_title_by_id
+        self.chat_rule_by_id = chat_rule_by_id
+
+    async def handle(self, chat_id: int, message: Any) -> None:
+        self.handled.append((chat_id, message.msg_id))
+
+
+def test_sessions_fail_over_and_deliver_each_message_once(tmp_path: Path, monkeypatch: Any) -> None:
+    monkeypatch.setattr(shards_module, "RECONNECT_BASE_DELAY_SECONDS", 0.01)
+    chats = {"t.me/a": _channel(1), "t.me/b": _channel(2), "t.me/c": _channel(3), "t.me/private": _channel(4)}
+    ids = {chat: get_peer_id(entity) for chat, entity in chats.items()}
+    history = {peer_id: [_message(1)] for peer_id in ids.values()}
+    chat_filters = {chat: ChatFilter(mode="deny", keywords=[]) for chat in chats}
+    chat_filters["t.me/c"] = ChatFilter(mode="deny", keywords=[], session="alt")
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=list(chats), chat_filters=chat_filters,
+        pushplus_token="", pushplus_timeout=5, data_dir=tmp_path,
+    )
+
+    async def run() -> None:
+        pipeline = FakePipeline()
+        main = FakeClient(chats, history)
+        # alt 没有加入私有群
+        alt = FakeClient({k: v for k, v in chats.items() if k != "t.me/private"}, history)
+        sharded = ShardedIngest(cfg, pipeline, WatermarkStore(tmp_path / "watermarks.json"))
+        sharded.add_session("main", main, None)
+        sharded.add_session("alt", alt, None)
+
+        await sharded.start(chat_filters)
+        assert sharded.owner_by_chat["t.me/private"] == "main"
+        assert sharded.owner_by_chat["t.me/c"] == "alt"
+        assert sorted(pipeline.handled) == sorted((peer_id, 1) for peer_id in ids.values())
+        assert set(pipeline.chat_title_by_id) == set(ids.values())
+
+        # 迁移期间两个会话都可能收到同一条消息
+        history[ids["t.me/c"]].append(_message(2))
+        await alt.deliver(ids["t.me/c"], history[ids["t.me/c"]][-1])
+        await main.deliver(ids["t.me/c"], history[ids["t.me/c"]][-1])
+        assert pipeline.handled.count((ids["t.me/c"], 2)) == 1
+
+        # alt 掉线期间错过的消息由接手的 main 补拉
+        history[ids["t.me/c"]].append(_message(3))
+        await alt.disconnect()
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if set(sharded.owner_by_chat.values()) == {"main"}:
+                break
+        assert set(sharded.owner_by_chat.values()) == {"main"}
+        assert (ids["t.me/c"], 3) in pipeline.handled
+
+        # alt 重连后固定给它的 chat 迁回
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if sharded.owner_by_chat.get("t.me/c") == "alt":
+                break
+        assert sharded.owner_by_chat["t.me/c"] == "alt"
+        assert len(pipeline.handled) == len(set(pipeline.handled))
+        await sharded.close()
+
+    asyncio.run(run())
+
+
+def test_backfill_pages_oldest_first_until_caught_up_or_capped(
+    tmp_path: Path, monkeypatch: Any, caplog: Any
+) -> None:
+    monkeypatch.setattr(ingest_module, "BACKFILL_PAGE_SIZE", 50)
+    chats = {"t.me/a": _channel(1), "t.me/b": _channel(2)}
+    ids = {chat: get_peer_id(entity) for chat, entity in chats.items()}
+    # a 错过 120 条（不到上限），b 错过 250 条（超过上限 200）
+    history = {
+        ids["t.me/a"]: [_message(i) for i in range(1, 131)],
+        ids["t.me/b"]: [_message(i) for i in range(1, 261)],
+    }
+    chat_filters = {chat: ChatFilter(mode="deny", keywords=[]) for chat in chats}
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=list(chats), chat_filters=chat_filters,
+        pushplus_token="", pushplus_timeout=5, data_dir=tmp_path, backfill_max_messages=200,
+    )
+    watermarks = WatermarkStore(tmp_path / "watermarks.json")
+    for peer_id in ids.values():
+        watermarks.advance(peer_id, 10)
+
+    async def run() -> FakePipeline:
+        pipeline = FakePipeline()
+        sharded = ShardedIngest(cfg, pipeline, watermarks)
+        sharded.add_session("main", FakeClient(chats, history), None)
+        await sharded.start(chat_filters)
+        await sharded.close()
+        return pipeline
+
+    with caplog.at_level("WARNING"):
+        pipeline = asyncio.run(run())
+    handled = {
+        peer_id: [msg_id for chat_id, msg_id in pipeline.handled if chat_id == peer_id]
+        for peer_id in ids.values()
+    }
+    assert handled[ids["t.me/a"]] == list(range(11, 131))
+    assert handled[ids["t.me/b"]] == list(range(11, 211))
+    truncated = [r for r in caplog.records if getattr(r, "event", None) == "backfill_truncated"]
+    assert [r.msg_id for r in truncated] == [210]
@@ -0,0 +1,106 @@
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from src.config import ChatFilter, Config, SinkConfig, _check_sink_routes, _load_sinks_from_json
+from src.filters import compile_rule
+from src.format import Message
+from src.pipeline import Pipeline
+from src.sinks import Sink
+
+
+def _cfg(tmp_path: Path) -> Config:
+    return Config(
+        api_id=1,
+        api_hash="hash",
+        phone="+100",
+        session_name="test",
+        chats=[],
+        chat_filters={},
+        pushplus_token="token",
+        pushplus_timeout=5,
+        data_dir=tmp_path,
+        outbox_enabled=False,
+        dedup_enabled=False,
+        sinks={
+            "hook": SinkConfig(name="hook", type="webhook", concurrency=1, url="http://hook.test/"),
+            "archive": SinkConfig(name="archive", type="jsonl", path="pushes.jsonl"),
+        },
+    )
+
+
+def _message(msg_id: int, text: str) -> Message:
+    return Message(msg_id=msg_id, time="2024-01-01 00:00:00", message=text)
+
+
+def test_slow_sink_does_not_hold_back_fast_sink(tmp_path: Path) -> None:
+    async def run() -> None:
+        release = asyncio.Event()
+        hooked: list[str] = []
+        pushplus: list[str] = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            body = json.loads(request.content)
+            if request.url.host == "hook.test":
+                await release.wait()
+                hooked.append(body["title"])
+                return httpx.Response(204)
+            pushplus.append(body["title"])
+            return httpx.Response(200, json={"code": 200})
+
+        cfg = _cfg(tmp_path)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            rule = compile_rule(ChatFilter(mode="deny", keywords=[], sinks=["hook", "archive"]))
+            pipeline = Pipeline(cfg, client, {7: "chat", 8: "other"}, {7: rule})
+            await pipeline.start()
+            for msg_id in range(3):
+                await pipeline.handle(7, _message(msg_id, f"m{msg_id}"))
+            await pipeline.handle(8, _message(9, "default route"))
+
+            await pipeline.queues["archive"].join()
+            await pipeline.queues["pushplus"].join()
+            lines = (tmp_path / "pushes.jsonl").read_text(encoding="utf-8").splitlines()
+            assert [json.loads(line)["title"] for line in lines] == ["chat", "chat", "chat"]
+            assert pushplus == ["other"]
+            assert hooked == []
+
+            release.set()
+            await pipeline.close()
+        assert len(hooked) == 3
+
+    asyncio.run(run())
+
+
+def test_sink_without_send_fails_at_construction() -> None:
+    class Incomplete(Sink):
+        pass
+
+    with pytest.raises(TypeError, match="send"):
+        Incomplete(SinkConfig(name="x", type="custom"))
+
+
+def test_sink_routes_must_name_defined_sinks(tmp_path: Path) -> None:
+    path = tmp_path / "chat_filters.json"
+    path.write_text(
+        json.dumps(
+            {
+                "sinks": [
+                    {"name": "wechat", "type": "pushplus", "channel": "wechat", "concurrency": 1},
+                    {"name": "archive", "type": "jsonl", "path": "pushes.jsonl"},
+                ],
+                "default_sinks": ["pushplus", "archive"],
+            }
+        ),
+        encoding="utf-8",
+    )
+    sinks, default_sinks = _load_sinks_from_json(path)
+    assert sinks["wechat"].channel == "wechat" and sinks["wechat"].concurrency == 1
+    assert default_sinks == ["pushplus", "archive"]
+
+    names = set(sinks) | {"pushplus"}
+    _check_sink_routes({"a": ChatFilter(mode="deny", keywords=[], sinks=["wechat"])}, names, default_sinks)
+    with pytest.raises(ValueError, match="unknown sinks: mail"):
+        _check_sink_routes({"a": ChatFilter(mode="deny", keywords=[], sinks=["mail"])}, names, default_sinks)
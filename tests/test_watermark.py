@@ -0,0 +1,20 @@
+import asyncio
+from pathlib import Path
+
+from src.watermark import WatermarkStore
+
+
+def test_watermarks_only_move_forward_and_persist(tmp_path: Path) -> None:
+    path = tmp_path / "watermarks.json"
+    store = WatermarkStore(path)
+    assert store.get(-100) is None
+
+    store.advance(-100, 10)
+    store.advance(-100, 7)
+    store.advance(42, 3)
+    assert store.get(-100) == 10
+    asyncio.run(store.close())
+
+    reloaded = WatermarkStore(path)
+    assert reloaded.get(-100) == 10
+    assert reloaded.get(42) == 3
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import re
+from pathlib import Path
+from typing import Any
+
+from src.config import ChatFilter, Config, SinkConfig
+from src.filters import compile_rule
+from src.format import Message
+from src import workers as workers_module
+from src.workers import WorkerPool, worker_index
+
+
+def test_worker_processes_filter_and_deliver_each_chat_in_order(tmp_path: Path) -> None:
+    out = tmp_path / "pushes.jsonl"
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=[], chat_filters={},
+        pushplus_token="", pushplus_timeout=5, data_dir=tmp_path,
+        outbox_enabled=False, dedup_enabled=False, log_level="WARNING",
+        sinks={"file": SinkConfig(name="file", type="jsonl", path=str(out), concurrency=1)},
+        default_sinks=["file"],
+    )
+    chat_ids = [-1001, -1002, -1003]
+    assert {worker_index(chat_id, 2) for chat_id in chat_ids} == {0, 1}
+
+    async def run() -> None:
+        pool = WorkerPool(cfg, 2)
+        await pool.start()
+        pool.update_chats(
+            {chat_id: f"chat{chat_id}" for chat_id in chat_ids},
+            {-1003: compile_rule(ChatFilter(mode="deny", keywords=["spam"], expr='"junk"'))},
+        )
+        for msg_id in range(1, 31):
+            for chat_id in chat_ids:
+                text = "spam" if msg_id % 10 == 0 else "junk" if msg_id % 10 == 5 else f"m{msg_id}"
+                await pool.handle(chat_id, Message(msg_id=msg_id, time="", message=text))
+        await pool.close()
+
+    asyncio.run(run())
+
+    pushes = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    by_chat: dict[int, list[str]] = {}
+    for push in pushes:
+        by_chat.setdefault(push["chat_id"], []).append(push["content"])
+    assert len(by_chat[-1001]) == len(by_chat[-1002]) == 30
+    assert len(by_chat[-1003]) == 24
+    for contents in by_chat.values():
+        numbers = [int(m.group(1)) for m in map(re.compile(r"\bm(\d+)").search, contents) if m]
+        assert numbers == sorted(numbers)
+
+
+def test_messages_stay_unacked_in_order_and_are_resent_when_a_worker_dies(
+    tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(workers_module, "WORKER_QUEUE_SIZE", 1)
+    monkeypatch.setattr(workers_module, "WORKER_CHECK_INTERVAL_SECONDS", 0.05)
+    cfg = Config(
+        api_id=0, api_hash="", phone="", session_name="", chats=[], chat_filters={},
+        pushplus_token="", pushplus_timeout=5, data_dir=tmp_path,
+    )
+
+    async def run() -> list[tuple[Any, ...]]:
+        # 不启动 worker 进程：测试读取进程队列并代替 worker 发确认
+        pool = WorkerPool(cfg, 1)
+        monkeypatch.setattr(pool, "_spawn", lambda index: None)
+        pool._ack_reader = asyncio.create_task(pool._read_acks())
+        handles = []
+        for msg_id in (1, 2):
+            message = Message(msg_id=msg_id, time="", message="m")
+            handles.append(asyncio.create_task(pool.handle(-1001, message)))
+            await asyncio.sleep(0)
+        pool.update_chats({-1001: "renamed"}, {})
+        handles.append(asyncio.create_task(pool.handle(-1001, Message(msg_id=3, time="", message="m"))))
+        await asyncio.sleep(0)
+
+        # worker 取走第 1 条后崩溃，没来得及确认：重启后的新队列从它开始
+        taken = await asyncio.to_thread(pool._inboxes[0].get, True, 5)
+        assert taken[2].msg_id == 1
+        pool._restart(0)
+        received = [await asyncio.to_thread(pool._inboxes[0].get, True, 5) for _ in range(4)]
+        # 确认之前 handle 不返回，接收端不会推进水位
+        assert not any(handle.done() for handle in handles)
+        pool._acks.put((0, [item[3] for item in received if item[0] == "message"]))
+        await asyncio.gather(*handles)
+        await pool.close()
+        return received
+
+    received = asyncio.run(run())
+    assert [item[0] for item in received] == ["message", "message", "chats", "message"]
+    assert [item[2].msg_id for item in received if item[0] == "message"] == [1, 2, 3]
+    assert received[2][1] == {-1001: "renamed"}